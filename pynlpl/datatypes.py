@@ -20,12 +20,29 @@ from __future__ import print_function
 from __future__ import unicode_literals
 from __future__ import division
 from __future__ import absolute_import
-from pynlpl.common import u
+from pynlpl.common import u, isstring
 
+import io
 import random
 import bisect
+import heapq
 import array
+import json
+import itertools
+import mmap
+import struct
+from collections import Counter
 from sys import version as PYTHONVERSION
+try:
+    import numpy as np
+except ImportError:
+    np = None
+if PYTHONVERSION < '3':
+    _INT64 = 'l' #Python 2 has no 'q' typecode, 'l' is 64-bit on 64-bit Unix platforms
+    _chr = unichr #pylint: disable=undefined-variable
+else:
+    _INT64 = 'q'
+    _chr = chr
 
 
 class Queue(object): #from AI: A Modern Appproach : http://aima.cs.berkeley.edu/python/utils.html
@@ -81,9 +98,12 @@ class PriorityQueue(Queue): #Heavily adapted/extended, originally from AI: A Mod
     blockworse can be set to true if you want to prohibit adding worse-scoring items to the queue. Only items scoring better than the *BEST* one are added.
     blockequal can be set to false if you also want to prohibit adding equally-scoring items to the queue.
     (Both parameters default to False)
+    duplicates can be set to False to prohibit adding an item that is already in the queue with the same score (detected in constant time for hashable items).
+
+    The queue is implemented as a binary heap (heapq) of (key, sequence number, score, item) entries. Unbounded queues keep the best item on top, so append and pop take O(log n); fixed-length queues keep the *worst* item on top, so an item that replaces the worst one takes O(log n) as well. The entries are only sorted when needed for indexing, slicing or popping from a fixed-length queue. Items with equal scores are ordered by insertion: first in, first out when minimizing and last in, first out when maximizing.
     """
     def __init__(self, data =[], f = lambda x: x.score, minimize=False, length=0, blockworse=False, blockequal=False,duplicates=True):
-        self.data = []
+        self.data = [] #heap of (key, sequence number, score, item) tuples
         self.f = f
         self.minimize=minimize
         self.length = length
@@ -91,31 +111,104 @@ class PriorityQueue(Queue): #Heavily adapted/extended, originally from AI: A Mod
         self.blockequal=blockequal
         self.duplicates= duplicates
         self.bestscore = None
+        #the sign turns the heap (a min-heap) into one with the best (unbounded) or worst (fixed-length) item on top
+        if self.length:
+            self.sign = -1 if self.minimize else 1
+        else:
+            self.sign = 1 if self.minimize else -1
+        self.sorted = True #is the heap also sorted (from top to bottom)?
+        self.sequence = 0
+        self.members = set() #(score, item) pairs in the queue, for duplicate detection
+        self.unhashable = [] #(score, item) pairs in the queue that can not be hashed
         for item in data:
             self.append(item)
 
-    def append(self, item):
-        """Adds an item to the priority queue (in the right place), returns True if successfull, False if the item was blocked (because of a bad score)"""
-        f = self.f(item)
-        if callable(f):
-            score = f()
-        else:
-            score = f
+    def _key(self, score):
+        if self.sign == 1:
+            return score
+        try:
+            return -score
+        except TypeError:
+            return _ReverseOrder(score)
 
-        if not self.duplicates:
-            for s, i in self.data:
+    def _entry(self, score, item):
+        self.sequence += 1
+        return (self._key(score), self.sequence * self.sign, score, item)
+
+    def _isduplicate(self, score, item):
+        try:
+            return (score, item) in self.members
+        except TypeError:
+            for s, i in self.unhashable:
                 if s == score and item == i:
-                    #item is a duplicate, don't add it
-                    return False
+                    return True
+            return False
+
+    def _addmember(self, score, item):
+        try:
+            self.members.add((score, item))
+        except TypeError:
+            self.unhashable.append((score, item))
+
+    def _removemember(self, score, item):
+        try:
+            self.members.discard((score, item))
+        except TypeError:
+            for j, (s, i) in enumerate(self.unhashable):
+                if s == score and item == i:
+                    del self.unhashable[j]
+                    break
+
+    def _resetmembers(self):
+        self.members = set()
+        self.unhashable = []
+        if not self.duplicates:
+            for _, _, score, item in self.data:
+                self._addmember(score, item)
+
+    def _sort(self):
+        """Sorts the heap in place (a sorted list is still a valid heap)"""
+        if not self.sorted:
+            self.data.sort()
+            self.sorted = True
+
+    def _ranked(self):
+        """Returns all entries from best to worst"""
+        self._sort()
+        if self.length:
+            return self.data[::-1]
+        else:
+            return self.data[:]
 
-        if self.length and len(self.data) == self.length:
-                #Fixed-length priority queue, abort when queue is full and new item scores worst than worst scoring item.
+    def _rankedentry(self, i):
+        """Returns the i-th best entry"""
+        self._sort()
+        if self.length:
+            return self.data[-1 * i - 1]
+        else:
+            return self.data[i]
+
+    def append(self, item, score=None):
+        """Adds an item to the priority queue (in the right place), returns True if successfull, False if the item was blocked (because of a bad score). If score is given, it is used as the item's score and the score function is not called."""
+        if score is None:
+            f = self.f(item)
+            if callable(f):
+                score = f()
+            else:
+                score = f
+
+        if not self.duplicates and self._isduplicate(score, item):
+            #item is a duplicate, don't add it
+            return False
+
+        full = self.length and len(self.data) >= self.length
+        if full:
+                #Fixed-length priority queue, abort when queue is full and new item scores worst than worst scoring item (which is on top of the heap)
+                worstscore = self.data[0][2]
                 if self.minimize:
-                    worstscore = self.data[-1][0]
                     if score >= worstscore:
                         return False
                 else:
-                    worstscore = self.data[0][0]
                     if score <= worstscore:
                         return False
 
@@ -131,71 +224,74 @@ class PriorityQueue(Queue): #Heavily adapted/extended, originally from AI: A Mod
                 return False
         if (self.bestscore == None) or (self.minimize and score < self.bestscore) or (not self.minimize and score > self.bestscore):
             self.bestscore = score
-        bisect.insort(self.data, (score, item))
-        if self.length:
-            #fixed length queue: queue is now too long, delete worst items
+        entry = self._entry(score, item)
+        if full:
+            #fixed length queue: replace the worst item
             while len(self.data) > self.length:
-                if self.minimize:
-                    del self.data[-1]
-                else:
-                    del self.data[0]
+                _, _, s, i = heapq.heappop(self.data)
+                if not self.duplicates: self._removemember(s, i)
+            _, _, s, i = heapq.heapreplace(self.data, entry)
+            if not self.duplicates: self._removemember(s, i)
+        else:
+            heapq.heappush(self.data, entry)
+        if not self.duplicates: self._addmember(score, item)
+        self.sorted = False
         return True
 
     def __exists__(self, item):
-        return (item in self.data)
+        return any( item == i for _, _, _, i in self.data )
 
     def __len__(self):
         return len(self.data)
 
     def __iter__(self):
         """Iterate over all items, in order from best to worst!"""
-        if self.minimize:
-            f = lambda x: x
-        else:
-            f = reversed
-        for score, item in f(self.data):
+        for _, _, score, item in self._ranked():
             yield item
 
     def __getitem__(self, i):
         """Item 0 is always the best item!"""
         if isinstance(i, slice):
-            indices = i.indices(len(self))
-            if self.minimize:
-                return PriorityQueue([ self.data[j][1] for j in range(*indices) ],self.f, self.minimize, self.length, self.blockworse, self.blockequal)
-            else:
-                return PriorityQueue([ self.data[(-1 * j) - 1][1] for j in range(*indices) ],self.f, self.minimize, self.length, self.blockworse, self.blockequal)
+            ranked = self._ranked()
+            return PriorityQueue([ ranked[j][3] for j in range(*i.indices(len(self))) ],self.f, self.minimize, self.length, self.blockworse, self.blockequal, self.duplicates)
         else:
-            if self.minimize:
-                return self.data[i][1]
-            else:
-                return self.data[(-1 * i) - 1][1]
+            return self._rankedentry(i)[3]
 
     def pop(self):
         """Retrieve the next element in line, this will remove it from the queue"""
-        if self.minimize:
-            return self.data.pop(0)[1]
+        if self.length:
+            #worst item is on top of the heap, sort so the best item is last
+            self._sort()
+            _, _, score, item = self.data.pop()
         else:
-            return self.data.pop()[1]
+            _, _, score, item = heapq.heappop(self.data)
+            self.sorted = False
+        if not self.duplicates: self._removemember(score, item)
+        return item
 
 
     def score(self, i):
         """Return the score for item x (cheap lookup), Item 0 is always the best item"""
-        if self.minimize:
-            return self.data[i][0]
-        else:
-            return self.data[(-1 * i) - 1][0]
+        return self._rankedentry(i)[2]
 
     def prune(self, n):
         """prune all but the first (=best) n items"""
-        if self.minimize:
-            self.data = self.data[:n]
+        if len(self.data) <= n:
+            return
+        self._sort()
+        if self.length:
+            self.data = self.data[len(self.data) - n:]
         else:
-            self.data = self.data[-1 * n:]
+            self.data = self.data[:n]
+        self._resetmembers()
 
 
     def randomprune(self,n):
         """prune down to n items at random, disregarding their score"""
         self.data = random.sample(self.data, n)
+        heapq.heapify(self.data)
+        self.sorted = False
+        self._resetmembers()
 
     def stochasticprune(self,n):
         """prune down to n items, chance of an item being pruned is reverse proportional to its score"""
@@ -206,27 +302,49 @@ class PriorityQueue(Queue): #Heavily adapted/extended, originally from AI: A Mod
         """Deletes all items below/above a certain score from the queue, depending on whether minimize is True or False. Note: It is recommended (more efficient) to use blockworse=True / blockequal=True instead! Preventing the addition of 'worse' items."""
         if retainequalscore:
             if self.minimize:
-                f = lambda x: x[0] <= score
+                f = lambda x: x[2] <= score
             else:
-                f = lambda x: x[0] >= score
+                f = lambda x: x[2] >= score
         else:
             if self.minimize:
-                f = lambda x: x[0] < score
+                f = lambda x: x[2] < score
             else:
-                f = lambda x: x[0] > score
-        self.data = filter(f, self.data)
+                f = lambda x: x[2] > score
+        self.data = [ entry for entry in self.data if f(entry) ] #a filtered heap (or sorted list) is not necessarily a heap anymore
+        if not self.sorted:
+            heapq.heapify(self.data)
+        self._resetmembers()
 
     def __eq__(self, other):
-        return (self.data == other.data) and (self.minimize == other.minimize)
+        return ([ (score, item) for _, _, score, item in self._ranked() ] == [ (score, item) for _, _, score, item in other._ranked() ]) and (self.minimize == other.minimize)
 
 
     def __repr__(self):
-        return repr(self.data)
+        """Returns the (score, item) pairs from lowest to highest score"""
+        ranked = [ (score, item) for _, _, score, item in self._ranked() ]
+        if not self.minimize:
+            ranked.reverse()
+        return repr(ranked)
 
     def __add__(self, other):
         """Priority queues can be added up, as long as they all have minimize or maximize (rather than mixed). In case of fixed-length queues, the FIRST queue in the operation will be authorative for the fixed lengthness of the result!"""
         assert (isinstance(other, PriorityQueue) and self.minimize == other.minimize)
-        return PriorityQueue(self.data + other.data, self.f, self.minimize, self.length, self.blockworse, self.blockequal)
+        return PriorityQueue(list(self) + list(other), self.f, self.minimize, self.length, self.blockworse, self.blockequal, self.duplicates)
+
+
+class _ReverseOrder(object):
+    """Wraps a value that can not be negated, inverting its ordering (used for heap keys)"""
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __lt__(self, other):
+        return other.value < self.value
+
+    def __eq__(self, other):
+        return self.value == other.value
+
 
 class Tree(object):
     """Simple tree structure. Nodes are themselves trees."""
@@ -401,13 +519,295 @@ class Trie(object):
                             yield results
 
 
+class CompactTrie(object):
+    """A frozen, compact trie over strings (characters) or sequences of tokens, suitable for very large lexicons. The trie is built once from *sorted* sequences and can not be modified afterwards.
+
+    Nodes are numbered in breadth-first order, so the children of every node are contiguous and sorted by their label. The whole trie consists of four flat arrays: the label (symbol) of every node, the offset of the first child of every node, the value of every node and whether a node marks the end of an entry. Children are found by binary search. Tokens are mapped to integer labels by a vocabulary, characters are represented by their code point.
+
+    A trie can be saved to file, loading it maps the file into memory (mmap) without copying, so multiple processes loading the same file share one copy of the arrays.
+
+    Arguments:
+        sequences (iterable): Strings or sequences of tokens, in sorted order. Duplicates are allowed, the last value is retained.
+        values (iterable): The value of every sequence, in the same order. If not specified, the value is the index of the sequence
+        valuetype (str): Type code of the values, ``q`` for 64-bit integers (default, ``l`` on Python 2) or ``d`` for floats
+    """
+
+    MAGIC = b'PYNLPLCT'
+    HEADER = struct.Struct(str('<8sIIQQQ')) #magic, tokens (bool), valuetype, nodes, entries, vocabulary size in bytes
+
+    def __init__(self, sequences = None, values = None, valuetype = _INT64):
+        self.valuetype = valuetype
+        self.tokens = False
+        self.vocabulary = [] #label => token (tokens only)
+        self.ids = {} #token => label (tokens only)
+        self.labels = array.array('I',[0])
+        self.children = array.array('I',[1,1])
+        self.values = array.array(valuetype,[0])
+        self.final = bytearray(1)
+        self.entries = 0
+        self.mmap = None
+        if sequences is not None:
+            self._build(sequences, values)
+
+    def _build(self, sequences, values):
+        parent = array.array('I',[0])
+        labels = array.array('I',[0])
+        depth = array.array('I',[0])
+        childcount = array.array('I',[0])
+        final = bytearray(1)
+        nodevalues = array.array(self.valuetype,[0])
+        if values is not None:
+            values = iter(values)
+        stack = [0] #the nodes on the path to the previous sequence
+        previous = None
+        first = True
+        for i, sequence in enumerate(sequences):
+            if first:
+                self.tokens = not isstring(sequence)
+                first = False
+            if self.tokens:
+                sequence = tuple(sequence)
+            if values is not None:
+                value = next(values)
+            else:
+                value = i
+            common = 0
+            if previous is not None:
+                if sequence < previous:
+                    raise ValueError("Sequences must be sorted, " + repr(sequence) + " follows " + repr(previous))
+                limit = min(len(sequence), len(previous))
+                while common < limit and sequence[common] == previous[common]:
+                    common += 1
+                del stack[common+1:]
+            for symbol in sequence[common:]:
+                if self.tokens:
+                    label = self.ids.get(symbol)
+                    if label is None:
+                        label = self.ids[symbol] = len(self.vocabulary)
+                        self.vocabulary.append(symbol)
+                else:
+                    label = ord(symbol)
+                node = len(labels)
+                parent.append(stack[-1])
+                childcount[stack[-1]] += 1
+                labels.append(label)
+                depth.append(len(stack))
+                childcount.append(0)
+                final.append(0)
+                nodevalues.append(0)
+                stack.append(node)
+            node = stack[-1]
+            if not final[node]:
+                self.entries += 1
+                final[node] = 1
+            nodevalues[node] = value
+            previous = sequence
+
+        if self.tokens:
+            #relabel so labels follow the sort order of the tokens
+            self.vocabulary.sort()
+            rank = array.array('I',[0]) * len(self.vocabulary)
+            for label, token in enumerate(self.vocabulary):
+                rank[self.ids[token]] = label
+            self.ids = dict( (token, label) for label, token in enumerate(self.vocabulary) )
+            for node in range(1, len(labels)):
+                labels[node] = rank[labels[node]]
+
+        #Renumber in breadth-first order. Nodes were created in depth-first preorder from sorted input, so within every level the
+        #children of a node are contiguous, sorted by label, and grouped in the order of their parents: the breadth-first order is
+        #simply the concatenation of all levels.
+        levels = [ array.array('I',[0]) ]
+        for node in range(1, len(labels)):
+            d = depth[node]
+            if d == len(levels):
+                levels.append(array.array('I'))
+            levels[d].append(node)
+        order = levels[0]
+        for level in levels[1:]:
+            order.extend(level)
+        self.labels = array.array('I', [ labels[node] for node in order ])
+        self.values = array.array(self.valuetype, [ nodevalues[node] for node in order ])
+        self.final = bytearray( [ final[node] for node in order ] )
+        children = array.array('I',[1])
+        offset = 1
+        for node in order:
+            offset += childcount[node]
+            children.append(offset)
+        self.children = children
+
+    def __len__(self):
+        """Returns the number of entries"""
+        return self.entries
+
+    def size(self):
+        """Returns the number of nodes"""
+        return len(self.labels)
+
+    def _label(self, symbol):
+        if self.tokens:
+            return self.ids.get(symbol)
+        else:
+            return ord(symbol)
+
+    def _symbol(self, label):
+        if self.tokens:
+            return self.vocabulary[label]
+        else:
+            return _chr(label)
+
+    def _child(self, node, symbol):
+        """Returns the child node of the given node with the specified symbol, or None"""
+        label = self._label(symbol)
+        if label is None:
+            return None
+        begin = self.children[node]
+        end = self.children[node+1]
+        if begin == end:
+            return None
+        i = bisect.bisect_left(self.labels, label, begin, end)
+        if i < end and self.labels[i] == label:
+            return i
+        return None
+
+    def _find(self, sequence):
+        """Returns the node for the given sequence, or None"""
+        node = 0
+        for symbol in sequence:
+            node = self._child(node, symbol)
+            if node is None:
+                return None
+        return node
+
+    def __contains__(self, sequence):
+        node = self._find(sequence)
+        return node is not None and bool(self.final[node])
+
+    def __getitem__(self, sequence):
+        """Returns the value of the sequence, raises KeyError if it is not in the trie"""
+        node = self._find(sequence)
+        if node is None or not self.final[node]:
+            raise KeyError(sequence)
+        return self.values[node]
+
+    def get(self, sequence, default = None):
+        """Returns the value of the sequence, or the default if it is not in the trie"""
+        node = self._find(sequence)
+        if node is None or not self.final[node]:
+            return default
+        return self.values[node]
+
+    def longestprefix(self, sequence):
+        """Finds the longest entry in the trie that is a prefix of the given sequence. Returns a (length, value) tuple, or (0, None) if no entry is a prefix of the sequence"""
+        node = 0
+        result = (0, None)
+        if self.final[0]:
+            result = (0, self.values[0])
+        for i, symbol in enumerate(sequence):
+            node = self._child(node, symbol)
+            if node is None:
+                break
+            if self.final[node]:
+                result = (i + 1, self.values[node])
+        return result
+
+    def prefixes(self, sequence):
+        """Generator yielding (length, value) tuples for all entries in the trie that are a prefix of the given sequence, from short to long"""
+        node = 0
+        if self.final[0]:
+            yield 0, self.values[0]
+        for i, symbol in enumerate(sequence):
+            node = self._child(node, symbol)
+            if node is None:
+                break
+            if self.final[node]:
+                yield i + 1, self.values[node]
+
+    def _join(self, symbols):
+        if self.tokens:
+            return tuple(symbols)
+        else:
+            return u('').join(symbols)
+
+    def startswith(self, prefix):
+        """Generator yielding (sequence, value) tuples for all entries that start with the given prefix, in sorted order"""
+        node = self._find(prefix)
+        if node is None:
+            return
+        path = list(prefix)
+        stack = [(node, len(path), False)] #node, length of the path up to and including the node, whether the symbol of the node still has to be added to the path
+        while stack:
+            node, length, add = stack.pop()
+            if add:
+                del path[length-1:]
+                path.append(self._symbol(self.labels[node]))
+            if self.final[node]:
+                yield self._join(path), self.values[node]
+            for child in range(self.children[node+1] - 1, self.children[node] - 1, -1):
+                stack.append( (child, length + 1, True) )
+
+    def __iter__(self):
+        """Iterates over all (sequence, value) tuples in sorted order"""
+        return self.startswith(u('') if not self.tokens else ())
+
+    def save(self, filename):
+        """Saves the trie to file, in a format that can be loaded with memory mapping"""
+        vocabulary = json.dumps(self.vocabulary).encode('utf-8') if self.tokens else b''
+        f = open(filename,'wb')
+        f.write(self.HEADER.pack(self.MAGIC, int(self.tokens), ord(self.valuetype), len(self.labels), self.entries, len(vocabulary)))
+        for a in (self.values, self.labels, self.children):
+            f.write(a.tobytes() if hasattr(a, 'tobytes') else a.tostring()) #tostring on Python 2
+        f.write(bytes(self.final))
+        f.write(vocabulary)
+        f.close()
+
+    def load(self, filename):
+        """Loads a trie from file (as produced by the save method). The file is mapped into memory rather than read, so the operating system shares it between processes"""
+        f = open(filename,'rb')
+        self.mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        f.close()
+        magic, tokens, valuetype, nodes, entries, vocabularysize = self.HEADER.unpack_from(self.mmap, 0)
+        if magic != self.MAGIC:
+            raise ValueError("Not a compact trie: " + filename)
+        self.tokens = bool(tokens)
+        self.valuetype = chr(valuetype)
+        self.entries = entries
+        if PYTHONVERSION > '3':
+            view = memoryview(self.mmap)
+            cast = lambda begin, end, typecode: view[begin:end].cast(typecode)
+        else: #Python 2 can not cast memory views, the arrays are read into memory instead
+            cast = lambda begin, end, typecode: array.array(str(_INT64 if typecode == 'q' else typecode), self.mmap[begin:end])
+        offset = self.HEADER.size
+        self.values = cast(offset, offset + 8 * nodes, self.valuetype)
+        offset += 8 * nodes
+        self.labels = cast(offset, offset + 4 * nodes, 'I')
+        offset += 4 * nodes
+        self.children = cast(offset, offset + 4 * (nodes + 1), 'I')
+        offset += 4 * (nodes + 1)
+        self.final = cast(offset, offset + nodes, 'B')
+        offset += nodes
+        if self.tokens:
+            self.vocabulary = json.loads(bytes(self.mmap[offset:offset + vocabularysize]).decode('utf-8'))
+            self.ids = dict( (token, label) for label, token in enumerate(self.vocabulary) )
+        else:
+            self.vocabulary = []
+            self.ids = {}
+
+
 FIXEDGAP = 128
 DYNAMICGAP = 129
+UNKNOWNCLASS = 1 #class of words that are not known to the class encoder (class 0 is reserved)
 
 if PYTHONVERSION > '3':
     #only available for Python 3
 
+    def encodeclass(cls):
+        """Encodes a class (integer) as bytes: a byte with the number of bytes, followed by the class in big-endian byte order"""
+        size = max(1, (cls.bit_length() + 7) // 8)
+        return bytes((size,)) + cls.to_bytes(size, 'big')
+
     class Pattern:
+        """A sequence of tokens encoded as bytes. Every token is a class (see :class:`ClassEncoder`) encoded by :func:`encodeclass`, or a single marker byte for a gap (``FIXEDGAP`` for one token, ``DYNAMICGAP`` for a variable number of tokens)"""
+
         def __init__(self, data, classdecoder=None):
             assert isinstance(data, bytes)
             self.data = data
@@ -417,36 +817,53 @@ if PYTHONVERSION > '3':
         def fromstring(s, classencoder): #static
             data = b''
             for s in s.split():
-                data += classencoder[s]
+                if s == '{*}':
+                    data += bytes((FIXEDGAP,))
+                elif s == '{**}':
+                    data += bytes((DYNAMICGAP,))
+                else:
+                    data += classencoder[s]
             return Pattern(data)
 
         def __str__(self):
-            s = ""
-            for cls in self:
-                s += self.classdecoder[int.from_bytes(cls)]
+            words = []
+            for token in self.iterbytes():
+                if token[0] == FIXEDGAP:
+                    words.append('{*}')
+                elif token[0] == DYNAMICGAP:
+                    words.append('{**}')
+                elif self.classdecoder is None:
+                    words.append(str(int.from_bytes(token[1:], 'big')))
+                else:
+                    words.append(self.classdecoder[int.from_bytes(token[1:], 'big')])
+            return " ".join(words)
 
-        def iterbytes(self, begin=0, end=0):
+        def iterbytes(self, begin=0, end=None):
+            """Iterates over the encoded tokens (including gap markers) of the pattern, optionally only those from token index begin up to end"""
             i = 0
             l = len(self.data)
             n = 0
-            if (end != begin):
-                slice = True
-            else:
-                slice = False
-
             while i < l:
+                if end is not None and n >= end:
+                    break
                 size = self.data[i]
-                if (size < 128): #everything from 128 onward is reserved for markers
-                    if not slice:
-                        yield self.data[i+1:i+1+size]
-                    else:
-                        n += 1
-                        if n >= begin and n < end:
-                            yield self.data[i+1:i+1+size]
+                if size < 128: #everything from 128 onward is reserved for markers
+                    token = self.data[i:i+1+size]
                     i += 1 + size
                 else:
-                    raise ValueError("Size >= 128")
+                    token = self.data[i:i+1]
+                    i += 1
+                if n >= begin:
+                    yield token
+                n += 1
 
+        def classes(self):
+            """Returns the classes of the tokens, gaps are represented by their marker"""
+            return [ int.from_bytes(token[1:], 'big') if token[0] < 128 else token[0] for token in self.iterbytes() ]
+
+        def isskipgram(self):
+            """Does the pattern contain gaps?"""
+            return any( token[0] >= 128 for token in self.iterbytes() )
 
         def __iter__(self):
             for b in self.iterbytes():
@@ -463,21 +880,21 @@ if PYTHONVERSION > '3':
             while i < l:
                 size = self.data[i]
                 if (size < 128):
-                    n += 1
                     i += 1 + size
                 else:
-                    raise ValueError("Size >= 128")
+                    i += 1
+                n += 1
+            return n
 
         def __getitem__(self, index):
+            if isinstance(index, slice):
+                return Pattern(b''.join(list(self.iterbytes())[index]), self.classdecoder)
             assert isinstance(index, int)
+            if index < 0:
+                index += len(self)
             for b in self.iterbytes(index,index+1):
                 return Pattern(b, self.classdecoder)
-
-        def __getslice__(self, begin, end):
-            slice = b''
-            for b in self.iterbytes(begin,end):
-                slice += b
-            return slice
+            raise IndexError(index)
 
         def __add__(self, other):
             assert isinstance(other, Pattern)
@@ -486,6 +903,12 @@ if PYTHONVERSION > '3':
         def __eq__(self, other):
             return self.data == other.data
 
+        def __hash__(self):
+            return hash(self.data)
+
+        def __repr__(self):
+            return "<Pattern " + repr(self.data) + ">"
+
     class PatternSet:
         def __init__(self):
             self.data = set()
@@ -551,16 +974,478 @@ if PYTHONVERSION > '3':
 
 
 
-#class SuffixTree(object):
-#   def __init__(self):
-#       self.data = {}
-#
-#
-#   def append(self, seq):
-#       if len(seq) > 1:
-#           for item in seq:
-#                self.append(item)
-#        else:
-#
-#
-#    def compile(self, s):
+    def readsentences(corpus):
+        """Generator yielding sentences as lists of tokens from a corpus: a filename or list of filenames of plain-text files with one tokenised sentence per line, or an iterable of token sequences"""
+        if isstring(corpus):
+            corpus = [corpus]
+        for item in corpus:
+            if isstring(item):
+                f = io.open(item, 'r', encoding='utf-8')
+                for line in f:
+                    yield line.split()
+                f.close()
+            else:
+                yield item
+
+
+    class ClassEncoder:
+        """Maps words to classes (integers) and encodes them as bytes for use in a :class:`Pattern`. Classes are assigned by descending frequency, so frequent words get low classes and therefore short encodings. Class 0 is reserved and class 1 (``UNKNOWNCLASS``) is used for unknown words.
+
+        Arguments:
+            filename (str): Load the classes from this file (as produced by :meth:`save`)
+        """
+
+        def __init__(self, filename=None):
+            self.classes = {} #word => class
+            self.encoded = {} #word => bytes
+            if filename:
+                self.load(filename)
+
+        def build(self, corpus, threshold=1):
+            """Builds the classes from a corpus (see :func:`readsentences`), words occurring less than threshold times are left out (and will be encoded as unknown)"""
+            counts = Counter()
+            for sentence in readsentences(corpus):
+                counts.update(sentence)
+            words = sorted( (word for word, count in counts.items() if count >= threshold), key=lambda word: (-counts[word], word) )
+            self.classes = {}
+            for cls, word in enumerate(words, UNKNOWNCLASS + 1):
+                self.classes[word] = cls
+            self.encoded = dict( (word, encodeclass(cls)) for word, cls in self.classes.items() )
+
+        def __len__(self):
+            return len(self.classes)
+
+        def __contains__(self, word):
+            return word in self.classes
+
+        def __getitem__(self, word):
+            """Returns the encoded bytes for the word"""
+            try:
+                return self.encoded[word]
+            except KeyError:
+                return encodeclass(UNKNOWNCLASS)
+
+        def encode(self, sentence):
+            """Encodes a sentence (a string or a sequence of tokens) as a :class:`Pattern`"""
+            if isstring(sentence):
+                sentence = sentence.split()
+            return Pattern(b''.join( self[word] for word in sentence ))
+
+        def decoder(self):
+            """Returns a :class:`ClassDecoder` for the classes of this encoder"""
+            decoder = ClassDecoder()
+            decoder.words = dict( (cls, word) for word, cls in self.classes.items() )
+            return decoder
+
+        def save(self, filename):
+            """Saves the classes to a file, with one tab-separated class and word per line"""
+            f = io.open(filename, 'w', encoding='utf-8')
+            for word, cls in sorted(self.classes.items(), key=lambda x: x[1]):
+                f.write(u(str(cls)) + '\t' + word + '\n')
+            f.close()
+
+        def load(self, filename):
+            """Loads the classes from file (as produced by the save method)"""
+            f = io.open(filename, 'r', encoding='utf-8')
+            for line in f:
+                cls, word = line.rstrip('\n').split('\t', 1)
+                self.classes[word] = int(cls)
+            f.close()
+            self.encoded = dict( (word, encodeclass(cls)) for word, cls in self.classes.items() )
+
+
+    class ClassDecoder:
+        """Maps classes back to words, indexing a decoder with a class returns the word.
+
+        Arguments:
+            filename (str): Load the classes from this file (as produced by :meth:`ClassEncoder.save`)
+        """
+
+        def __init__(self, filename=None):
+            self.words = {} #class => word
+            if filename:
+                self.load(filename)
+
+        def load(self, filename):
+            """Loads the classes from file (as produced by :meth:`ClassEncoder.save`)"""
+            f = io.open(filename, 'r', encoding='utf-8')
+            for line in f:
+                cls, word = line.rstrip('\n').split('\t', 1)
+                self.words[int(cls)] = word
+            f.close()
+
+        def __len__(self):
+            return len(self.words)
+
+        def __getitem__(self, cls):
+            if cls == UNKNOWNCLASS:
+                return '{?}'
+            return self.words[cls]
+
+        def decode(self, pattern):
+            """Decodes a :class:`Pattern` to a string"""
+            return str(Pattern(pattern.data, self))
+
+
+    class PatternModel(PatternMap):
+        """Counts the n-grams, and optionally skipgrams, in a corpus that occur at least a certain number of times. Patterns are stored in their compact byte encoding, which takes considerably less memory than tuples of strings.
+
+        Counting is iterative: an n-gram is only counted if the two (n-1)-grams it consists of both reached the threshold, as no n-gram can be more frequent than its parts. Skipgrams are n-grams in which one or more tokens (other than the first and last) are replaced by a gap (``FIXEDGAP``), they are only counted if all their parts are frequent n-grams.
+
+        Arguments:
+            classencoder (ClassEncoder): The class encoder, used to encode the corpus
+            classdecoder (ClassDecoder): The class decoder, used to turn patterns into strings (optional)
+            filename (str): Load the model from this file (as produced by :meth:`save`)
+        """
+
+        MAGIC = b'PYNLPLPM'
+        HEADER = struct.Struct(str('<8sIIIIQ')) #magic, version, threshold, skipgram threshold, maximum length, number of patterns
+        ENTRY = struct.Struct(str('<QH')) #count, length of pattern data
+
+        def __init__(self, classencoder=None, classdecoder=None, filename=None):
+            super(PatternModel, self).__init__(0)
+            self.classencoder = classencoder
+            self.classdecoder = classdecoder
+            self.threshold = 0
+            self.skipgramthreshold = 0
+            self.maxlength = 0
+            if filename:
+                self.load(filename)
+
+        def _encodecorpus(self, corpus):
+            """Encodes the corpus as a flat array of classes, sentences are separated by a zero"""
+            corpus_ = array.array('I',[0])
+            for sentence in readsentences(corpus):
+                for word in sentence:
+                    corpus_.append(self.classencoder.classes.get(word, UNKNOWNCLASS))
+                corpus_.append(0)
+            return corpus_
+
+        def train(self, corpus, threshold=2, maxlength=8, skipgrams=False, skipgramthreshold=None):
+            """Counts all n-grams up to maxlength (and optionally skipgrams) that occur at least threshold times in the corpus (see :func:`readsentences`). Words that are unknown to the class encoder are never part of a pattern (except in a gap)."""
+            self.threshold = threshold
+            self.maxlength = maxlength
+            self.skipgramthreshold = skipgramthreshold if skipgramthreshold is not None else threshold
+            corpus = self._encodecorpus(corpus)
+            encoded = dict( (cls, encodeclass(cls)) for cls in self.classencoder.classes.values() )
+            L = len(corpus)
+
+            #unigrams
+            counts = Counter(corpus)
+            for cls, count in counts.items():
+                if cls > UNKNOWNCLASS and count >= threshold:
+                    self.data[encoded[cls]] = count
+            frequent = bytearray( 1 if cls > UNKNOWNCLASS and encoded[cls] in self.data else 0 for cls in corpus ) #does a frequent (n-1)-gram start at this position?
+
+            #n-grams: only where the two (n-1)-grams are frequent
+            for n in range(2, maxlength + 1):
+                counts = Counter()
+                for i in range(L - n + 1):
+                    if frequent[i] and frequent[i+1]:
+                        counts[b''.join([ encoded[cls] for cls in corpus[i:i+n] ])] += 1
+                found = False
+                nextfrequent = bytearray(L)
+                for i in range(L - n + 1):
+                    if frequent[i] and frequent[i+1]:
+                        key = b''.join([ encoded[cls] for cls in corpus[i:i+n] ])
+                        if counts[key] >= threshold:
+                            self.data[key] = counts[key]
+                            nextfrequent[i] = 1
+                            found = True
+                if not found:
+                    break
+                frequent = nextfrequent
+
+            if skipgrams:
+                self._trainskipgrams(corpus, encoded)
+
+        def _trainskipgrams(self, corpus, encoded):
+            gap = bytes((FIXEDGAP,))
+            L = len(corpus)
+            #number of tokens from every position to the end of its sentence
+            remaining = array.array('I',[0]) * L
+            for i in range(L - 2, -1, -1):
+                if corpus[i]:
+                    remaining[i] = remaining[i+1] + 1
+            for n in range(3, self.maxlength + 1):
+                configurations = [] #(begin, end, isgap) segments for every way to place gaps in an n-gram
+                for gaps in itertools.product((False,True), repeat=n-2):
+                    if any(gaps):
+                        mask = (False,) + gaps + (False,)
+                        segments = []
+                        begin = 0
+                        for k in range(1, n + 1):
+                            if k == n or mask[k] != mask[begin]:
+                                segments.append( (begin, k, mask[begin]) )
+                                begin = k
+                        configurations.append(segments)
+                counts = Counter()
+                for i in range(L):
+                    if remaining[i] < n:
+                        continue
+                    for segments in configurations:
+                        parts = []
+                        for begin, end, isgap in segments:
+                            if isgap:
+                                parts.append(gap * (end - begin))
+                            else:
+                                segment = corpus[i+begin:i+end]
+                                if UNKNOWNCLASS in segment:
+                                    break
+                                part = b''.join([ encoded[cls] for cls in segment ])
+                                if part not in self.data:
+                                    break
+                                parts.append(part)
+                        else:
+                            counts[b''.join(parts)] += 1
+                for key, count in counts.items():
+                    if count >= self.skipgramthreshold:
+                        self.data[key] = count
+
+        def __iter__(self):
+            for patterndata in self.data:
+                yield Pattern(patterndata, self.classdecoder)
+
+        def items(self):
+            for patterndata, count in self.data.items():
+                yield Pattern(patterndata, self.classdecoder), count
+
+        def save(self, filename):
+            """Saves the model to a binary file"""
+            f = io.open(filename, 'wb')
+            f.write(self.HEADER.pack(self.MAGIC, 1, self.threshold, self.skipgramthreshold, self.maxlength, len(self.data)))
+            for patterndata, count in self.data.items():
+                f.write(self.ENTRY.pack(count, len(patterndata)))
+                f.write(patterndata)
+            f.close()
+
+        def load(self, filename):
+            """Loads a model from a binary file (as produced by the save method)"""
+            f = io.open(filename, 'rb')
+            magic, version, self.threshold, self.skipgramthreshold, self.maxlength, size = self.HEADER.unpack(f.read(self.HEADER.size))
+            if magic != self.MAGIC:
+                raise ValueError("Not a pattern model: " + filename)
+            for _ in range(size):
+                count, length = self.ENTRY.unpack(f.read(self.ENTRY.size))
+                self.data[f.read(length)] = count
+            f.close()
+
+
+class SuffixArray(object):
+    """A suffix array index over a corpus of tokens, to count and locate phrases, extract keywords in context and enumerate repeated phrases. Requires NumPy.
+
+    The suffix array (the start positions of all suffixes of the corpus in sorted order) is constructed by prefix doubling: the suffixes are repeatedly sorted by the ranks of their first 2k tokens, so construction takes O(n log n) time per round and at most log n rounds. A phrase of m tokens is found by binary search in O(m log n) time. The LCP array (the length of the longest common prefix of every suffix with its predecessor) is only needed for :meth:`repeats` and is computed from the finished suffix array with Kasai's algorithm if requested, in O(n) time.
+
+    The corpus, suffix array and LCP array take 4 bytes per token (8 bytes for corpora of 2**31 tokens or more). Construction temporarily needs a few 8 byte integer arrays of the corpus length for prefix doubling, computing the LCP array needs three more integer arrays of the corpus length (the inverse suffix array and plain copies of the corpus and suffix array).
+
+    Arguments:
+        corpus: A sequence of tokens: either integers (e.g. classes from a :class:`ClassEncoder`), or strings, which will be mapped to integers by a vocabulary
+        lcp (bool): Compute the LCP array (default: True)
+    """
+
+    MAGIC = b'PYNLPLSA'
+    HEADER = struct.Struct(str('<8sIIQQ')) #magic, integer size in bytes, has lcp, corpus length, vocabulary size in bytes
+
+    def __init__(self, corpus = None, lcp = True):
+        if np is None:
+            raise ImportError("No numpy installed")
+        self.vocabulary = None #id => word, if the corpus consisted of strings
+        self.ids = None #word => id
+        self.corpus = np.zeros(0, dtype=np.int32)
+        self.suffixes = np.zeros(0, dtype=np.int32)
+        self.lcp = None
+        self.mmap = None
+        if corpus is not None:
+            self._build(corpus, lcp)
+
+    def _build(self, corpus, computelcp):
+        if not isinstance(corpus, np.ndarray):
+            corpus = list(corpus)
+            if corpus and isstring(corpus[0]):
+                self.vocabulary = sorted(set(corpus))
+                self.ids = dict( (word, i) for i, word in enumerate(self.vocabulary) )
+                corpus = [ self.ids[word] for word in corpus ]
+        n = len(corpus)
+        dtype = np.int32 if n < 2**31 - 1 else np.int64
+        corpus = np.asarray(corpus)
+        if n and (corpus.min() < 0 or corpus.max() >= 2**31 - 1):
+            dtype = np.int64
+        self.corpus = corpus.astype(dtype)
+        if n == 0:
+            self.suffixes = np.zeros(0, dtype=dtype)
+            self.lcp = np.zeros(0, dtype=dtype) if computelcp else None
+            return
+
+        #initial ranks: dense rank of the first token
+        _, rank = np.unique(self.corpus, return_inverse=True)
+        rank = rank.astype(np.int64).reshape(-1)
+        k = 1
+        while True:
+            #sort by (rank of the first k tokens, rank of the next k tokens), where a suffix that ends first comes first
+            second = np.zeros(n, dtype=np.int64)
+            second[:n-k] = rank[k:] + 1
+            key = rank * (n + 1) + second
+            suffixes = np.argsort(key, kind='stable')
+            sortedkey = key[suffixes]
+            newrank = np.empty(n, dtype=np.int64)
+            newrank[suffixes] = np.concatenate( ([0], np.cumsum(sortedkey[1:] != sortedkey[:-1])) )
+            rank = newrank
+            if rank[suffixes[-1]] == n - 1 or 2 * k >= n: #all ranks are distinct
+                break
+            k *= 2
+        del key, sortedkey, rank, newrank, second #free the construction arrays before computing the LCP array
+        self.suffixes = suffixes.astype(dtype)
+        del suffixes
+        self.lcp = self._kasai() if computelcp else None
+
+    def _kasai(self):
+        """Computes the LCP array from the suffix array with Kasai's algorithm: the suffixes are visited in corpus order, and the common prefix of a suffix with its predecessor in the suffix array is at most one shorter than that of the previous suffix, so the tokens are compared at most 2n times"""
+        n = len(self.suffixes)
+        dtype = self.suffixes.dtype
+        typecode = str('i') if dtype.itemsize == 4 else str(_INT64) #plain arrays, indexing them is much faster than indexing NumPy arrays
+        inverse = np.empty(n, dtype=dtype)
+        inverse[self.suffixes] = np.arange(n, dtype=dtype)
+        rank = array.array(typecode, inverse.tobytes())
+        del inverse
+        suffixes = array.array(typecode, self.suffixes.tobytes())
+        corpus = array.array(typecode, self.corpus.tobytes())
+        lcp = array.array(typecode, [0]) * n
+        h = 0
+        for i in range(n):
+            r = rank[i]
+            if r:
+                j = suffixes[r - 1]
+                while i + h < n and j + h < n and corpus[i+h] == corpus[j+h]:
+                    h += 1
+                lcp[r] = h
+                if h:
+                    h -= 1
+            else:
+                h = 0
+        return np.frombuffer(lcp, dtype=dtype)
+
+    def __len__(self):
+        """Returns the length of the corpus"""
+        return len(self.corpus)
+
+    def encode(self, phrase):
+        """Converts a phrase (a sequence of tokens, or a string of space-separated words) to a list of integers, returns None if a word is unknown"""
+        if isstring(phrase):
+            phrase = phrase.split()
+        if self.ids is None:
+            return [ int(token) for token in phrase ]
+        try:
+            return [ self.ids[word] for word in phrase ]
+        except KeyError:
+            return None
+
+    def decode(self, tokens):
+        """Converts integers to a tuple of tokens"""
+        if self.vocabulary is None:
+            return tuple( int(token) for token in tokens )
+        return tuple( self.vocabulary[token] for token in tokens )
+
+    def range(self, phrase):
+        """Returns the (begin, end) range in the suffix array of the suffixes starting with the given phrase, found by binary search"""
+        phrase = self.encode(phrase)
+        if phrase is None:
+            return 0, 0
+        m = len(phrase)
+        corpus = self.corpus
+        suffixes = self.suffixes
+        lo = 0
+        hi = len(suffixes)
+        while lo < hi: #lower bound
+            mid = (lo + hi) // 2
+            start = suffixes[mid]
+            if corpus[start:start+m].tolist() < phrase:
+                lo = mid + 1
+            else:
+                hi = mid
+        begin = lo
+        hi = len(suffixes)
+        while lo < hi: #upper bound
+            mid = (lo + hi) // 2
+            start = suffixes[mid]
+            if corpus[start:start+m].tolist() <= phrase:
+                lo = mid + 1
+            else:
+                hi = mid
+        return begin, lo
+
+    def count(self, phrase):
+        """Returns the number of occurrences of the phrase in the corpus"""
+        begin, end = self.range(phrase)
+        return end - begin
+
+    def __contains__(self, phrase):
+        return self.count(phrase) > 0
+
+    def locate(self, phrase):
+        """Returns a sorted NumPy array of all positions of the phrase in the corpus"""
+        begin, end = self.range(phrase)
+        return np.sort(self.suffixes[begin:end])
+
+    def kwic(self, phrase, contextsize = 3):
+        """Generator yielding (leftcontext, phrase, rightcontext) tuples (of tokens) for all occurrences of the phrase in the corpus, in corpus order"""
+        m = len(self.encode(phrase) or ())
+        for position in self.locate(phrase):
+            position = int(position)
+            yield self.decode(self.corpus[max(0, position - contextsize):position]), self.decode(self.corpus[position:position+m]), self.decode(self.corpus[position+m:position+m+contextsize])
+
+    def repeats(self, minlength = 1, mincount = 2):
+        """Generator yielding (phrase, count) tuples for all phrases of at least minlength tokens that occur at least mincount times and can not be extended to the right without occurring less often (right-maximal repeats). They are enumerated from the intervals of the LCP array in a single pass."""
+        if self.lcp is None:
+            raise ValueError("No LCP array available, construct the suffix array with lcp=True")
+        n = len(self.suffixes)
+        lcp = self.lcp.tolist()
+        stack = [(0, 0)] #(common prefix length, left boundary) of the open LCP intervals
+        for i in range(1, n + 1):
+            current = lcp[i] if i < n else 0
+            left = i - 1
+            while current < stack[-1][0]:
+                length, left = stack.pop()
+                count = i - left
+                if length >= minlength and count >= mincount:
+                    start = int(self.suffixes[left])
+                    yield self.decode(self.corpus[start:start+length]), count
+            if current > stack[-1][0]:
+                stack.append((current, left))
+
+    def save(self, filename):
+        """Saves the index to file, in a format that can be loaded with memory mapping"""
+        vocabulary = json.dumps(self.vocabulary).encode('utf-8') if self.vocabulary is not None else b''
+        f = io.open(filename, 'wb')
+        f.write(self.HEADER.pack(self.MAGIC, self.corpus.dtype.itemsize, int(self.lcp is not None), len(self.corpus), len(vocabulary)))
+        f.write(self.corpus.tobytes())
+        f.write(self.suffixes.tobytes())
+        if self.lcp is not None:
+            f.write(self.lcp.tobytes())
+        f.write(vocabulary)
+        f.close()
+
+    def load(self, filename):
+        """Loads the index from file (as produced by the save method). The file is mapped into memory rather than read, so the operating system shares it between processes"""
+        f = io.open(filename, 'rb')
+        self.mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        f.close()
+        magic, itemsize, haslcp, n, vocabularysize = self.HEADER.unpack_from(self.mmap, 0)
+        if magic != self.MAGIC:
+            raise ValueError("Not a suffix array: " + filename)
+        dtype = np.int32 if itemsize == 4 else np.int64
+        offset = self.HEADER.size
+        self.corpus = np.frombuffer(self.mmap, dtype=dtype, count=n, offset=offset)
+        offset += n * itemsize
+        self.suffixes = np.frombuffer(self.mmap, dtype=dtype, count=n, offset=offset)
+        offset += n * itemsize
+        if haslcp:
+            self.lcp = np.frombuffer(self.mmap, dtype=dtype, count=n, offset=offset)
+            offset += n * itemsize
+        else:
+            self.lcp = None
+        if vocabularysize:
+            self.vocabulary = json.loads(self.mmap[offset:offset+vocabularysize].decode('utf-8'))
+            self.ids = dict( (word, i) for i, word in enumerate(self.vocabulary) )
+        else:
+            self.vocabulary = None
+            self.ids = None
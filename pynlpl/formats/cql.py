@@ -16,11 +16,14 @@
 from __future__ import print_function, unicode_literals, division, absolute_import
 
 from pynlpl.fsa import State, NFA
+from array import array
+from bisect import bisect_right
 import re
 import sys
 
 OPERATORS = ('=','!=')
 MAXINTERVAL = 99
+RE_SPECIAL = re.compile(r'[\\.^$*+?{}\[\]|()]') #regular expression special characters
 
 class SyntaxError(Exception):
     pass
@@ -55,6 +58,35 @@ class AttributeExpression(object):
         self.attribute = attribute
         self.operator = operator
         self.valueexpr = valueexpression
+        if attribute == 'text':
+            self.annottype = 'word'
+        else:
+            self.annottype = attribute
+        self.compile()
+
+    def compile(self):
+        """Precompiles the regular expression for the value expression, call this again if the value expression is changed"""
+        if len(self.valueexpr) > 1:
+            self.regexp = re.compile("^(" + "|".join(self.valueexpr) + ")$")
+        else:
+            self.regexp = re.compile("^" + self.valueexpr[0] + '$')
+
+    def literals(self):
+        """Returns the values of the value expression if they are all literal strings rather than regular expressions, None otherwise"""
+        for value in self.valueexpr:
+            if RE_SPECIAL.search(value):
+                return None
+        return list(self.valueexpr)
+
+    def match(self, token):
+        """Does this attribute expression match the token (a dictionary)?"""
+        match = (self.regexp.match(token[self.annottype]) is not None)
+        if self.operator == "!=":
+            return not match
+        elif self.operator == "=":
+            return match
+        else:
+            raise Exception("Unexpected operator " + self.operator)
 
     @staticmethod
     def parse(s,i):
@@ -187,28 +219,30 @@ class TokenExpression(object):
 
 
     def match(self, value):
-        match = False
-        for _, attribexpr in enumerate(self):
-            annottype = attribexpr.attribute
-            if annottype == 'text': annottype = 'word'
-            if attribexpr.operator == "!=":
-                negate = True
-            elif attribexpr.operator == "=":
-                negate = False
-            else:
-                raise Exception("Unexpected operator " + attribexpr.operator)
-
-            if len(attribexpr.valueexpr) > 1:
-                expr = re.compile("^(" + "|".join(attribexpr.valueexpr) + ")$")
-            else:
-                expr = re.compile("^" + attribexpr.valueexpr[0] + '$')
-            match = (expr.match(value[annottype]) is not None)
-            if negate:
-                match = not match
-            if not match:
+        for attribexpr in self.attribexprs:
+            if not attribexpr.match(value):
                 return False
         return True
 
+    def lengths(self):
+        """Returns the minimum and maximum number of tokens this token expression can match, as constructed by :meth:`nfa`. The maximum is None if it is unbounded."""
+        finalstate = State(final=True)
+        dfa = NFA(self.nfa(finalstate)).compile()
+        states = [dfa.initialstate]
+        minlength = maxlength = None
+        length = 0
+        while states:
+            if length > MAXINTERVAL + 1:
+                return minlength, None
+            if any(finalstate in state.nfastates for state in states):
+                if minlength is None: minlength = length
+                maxlength = length
+            #follow all transitions, regardless of what they match
+            states = [ dfa.getstate(target for targets in state.targets for target in targets) for state in states ]
+            states = [ state for state in states if state is not None ]
+            length += 1
+        return minlength, maxlength
+
 
 
 class Query(object):
@@ -222,6 +256,8 @@ class Query(object):
             else:
                 tokenexpr,i = TokenExpression.parse(s,i)
                 self.tokenexprs.append(tokenexpr)
+        self.dfa = None #compiled automaton, see compile()
+        self.lengths = None #(minimum, maximum) number of tokens for every token expression, see tokenlengths()
 
     def __len__(self):
         return len(self.tokenexprs)
@@ -242,19 +278,230 @@ class Query(object):
             nextstate = state
         return NFA(state)
 
+    def compile(self):
+        """Returns the compiled automaton (a :class:`pynlpl.fsa.DFA`) for the expression, it is constructed only once and cached on the query"""
+        if self.dfa is None:
+            self.dfa = self.nfa().compile()
+        return self.dfa
+
+    def tokenlengths(self):
+        """Returns a list of (minimum, maximum) numbers of tokens that every token expression can match (see :meth:`TokenExpression.lengths`), it is computed only once and cached on the query"""
+        if self.lengths is None:
+            self.lengths = [ tokenexpr.lengths() for tokenexpr in self ]
+        return self.lengths
 
     def __call__(self, tokens, debug=False):
-        """Execute the CQL expression, pass a list of tokens/annotations using keyword arguments: word, pos, lemma, etc"""
+        """Execute the CQL expression, pass a list of tokens/annotations using keyword arguments: word, pos, lemma, etc, or a :class:`CQLIndex`"""
+
+        if isinstance(tokens, CQLIndex):
+            return tokens(self, debug)
 
         if not tokens:
             raise Exception("Pass a list of tokens/annotation using keyword arguments! (word,pos,lemma, or others)")
 
-        #convert the expression into an NFA
-        nfa = self.nfa()
+        dfa = self.compile()
         if debug:
-            print(repr(nfa), file=sys.stderr)
+            print(repr(dfa.nfa), file=sys.stderr)
+
+        return list(dfa.find(tokens,debug))
+
+
+class CQLIndex(object):
+    """An inverted index over a corpus of token sequences, for fast CQL queries over large corpora.
+
+    Tokens are stored column-wise as integer-encoded attribute values, with a postings list (sorted token positions) for every value of every attribute. When querying, the positive attribute constraint on a mandatory token expression that matches the fewest tokens in the corpus is selected as anchor, and the automaton only runs from the start positions that are compatible with its occurrences. Queries without such a constraint run over the full corpus. Matches never cross sequence boundaries.
+
+    Arguments:
+        sequences (iterable): Token sequences to add, each either a list of tokens (dictionaries, as passed to :class:`Query`) or a FoLiA document, from which every sentence is added as a sequence
+        attributes (tuple): The token attributes to store and index (default: word, pos, lemma)
+
+    Example::
+
+        index = CQLIndex([tokens, moretokens])
+        for sequenceindex, begin, end in index.find('[ pos = "det" ] [ lemma = "house" ]'):
+            ...
+    """
+
+    def __init__(self, sequences=(), attributes=('word','pos','lemma')):
+        self.attributes = tuple(attributes)
+        self.columns = dict( (attribute, array('l')) for attribute in self.attributes ) #attribute -> value id for every token position (-1 if not set)
+        self.vocabulary = dict( (attribute, []) for attribute in self.attributes ) #attribute -> value id -> value
+        self.ids = dict( (attribute, {}) for attribute in self.attributes ) #attribute -> value -> value id
+        self.postings = dict( (attribute, []) for attribute in self.attributes ) #attribute -> value id -> positions
+        self.offsets = array('l') #start position for every sequence
+        self.size = 0 #number of tokens
+        self.cache = {} #(attribute, pattern) -> matching value ids
+        for sequence in sequences:
+            self.add(sequence)
+
+    def add(self, sequence):
+        """Add a token sequence (a list of token dictionaries) or a FoLiA document to the index"""
+        if not isinstance(sequence, (list, tuple)):
+            from pynlpl.formats import folia
+            if isinstance(sequence, folia.Document):
+                sentences = list(sequence.sentences())
+                if sentences:
+                    for sentence in sentences:
+                        self.add(CQLIndex.foliatokens(sentence))
+                else:
+                    self.add(CQLIndex.foliatokens(sequence))
+                return
+            sequence = list(sequence)
+
+        self.offsets.append(self.size)
+        for token in sequence:
+            for attribute in self.attributes:
+                value = token.get(attribute)
+                if value is None:
+                    valueid = -1
+                else:
+                    try:
+                        valueid = self.ids[attribute][value]
+                    except KeyError:
+                        valueid = self.ids[attribute][value] = len(self.vocabulary[attribute])
+                        self.vocabulary[attribute].append(value)
+                        self.postings[attribute].append(array('l'))
+                    self.postings[attribute][valueid].append(self.size)
+                self.columns[attribute].append(valueid)
+            self.size += 1
+        self.cache = {}
+
+    @staticmethod
+    def foliatokens(element):
+        """Converts the words in a FoLiA element (such as a sentence or document) to a list of token dictionaries (word, pos and lemma, an empty string if not available)"""
+        from pynlpl.formats import folia
+        tokens = []
+        for word in element.words():
+            try:
+                token = {'word': word.text() }
+            except folia.NoSuchText:
+                token = {'word': ""}
+            for attribute, Class in (('pos', folia.PosAnnotation), ('lemma', folia.LemmaAnnotation)):
+                try:
+                    token[attribute] = word.annotation(Class).cls
+                except folia.NoSuchAnnotation:
+                    token[attribute] = ""
+            tokens.append(token)
+        return tokens
 
-        return list(nfa.find(tokens,debug))
+    def __len__(self):
+        """Returns the number of tokens in the index"""
+        return self.size
+
+    def sequences(self):
+        """Returns the number of sequences in the index"""
+        return len(self.offsets)
+
+    def bounds(self, sequenceindex):
+        """Returns the begin and end position of the specified sequence"""
+        if sequenceindex + 1 < len(self.offsets):
+            return self.offsets[sequenceindex], self.offsets[sequenceindex+1]
+        else:
+            return self.offsets[sequenceindex], self.size
+
+    def token(self, position):
+        """Returns the token (a dictionary with all indexed attributes, an empty string for those not set) at the specified position"""
+        token = {}
+        for attribute in self.attributes:
+            valueid = self.columns[attribute][position]
+            if valueid >= 0:
+                token[attribute] = self.vocabulary[attribute][valueid]
+            else:
+                token[attribute] = ""
+        return token
+
+    def tokens(self, begin, end):
+        """Returns a generator of all tokens in the specified range of positions"""
+        for position in range(begin, end):
+            yield self.token(position)
+
+    def sequence(self, sequenceindex):
+        """Returns the specified sequence as a list of tokens"""
+        return list(self.tokens(*self.bounds(sequenceindex)))
+
+    def matching(self, attribexpr):
+        """Returns the ids of all values of the attribute that match the attribute expression (ignoring negation)"""
+        key = (attribexpr.annottype, attribexpr.regexp.pattern)
+        try:
+            return self.cache[key]
+        except KeyError:
+            pass
+        literals = attribexpr.literals()
+        if literals is not None:
+            ids = self.ids[attribexpr.annottype]
+            valueids = sorted(set( ids[value] for value in literals if value in ids ))
+        else:
+            valueids = [ valueid for valueid, value in enumerate(self.vocabulary[attribexpr.annottype]) if attribexpr.regexp.match(value) ]
+        self.cache[key] = valueids
+        return valueids
+
+    def anchor(self, query):
+        """Selects the anchor for the query, returns a (tokenexpression index, positions) tuple, or None if the query has no suitable constraint"""
+        best = None
+        lengths = query.tokenlengths()
+        for i, tokenexpr in enumerate(query):
+            if not lengths[i][0]:
+                continue #optional (or never matching) token expressions can not be anchors
+            for attribexpr in tokenexpr:
+                if attribexpr.operator != "=" or attribexpr.annottype not in self.postings:
+                    continue
+                postings = self.postings[attribexpr.annottype]
+                valueids = self.matching(attribexpr)
+                count = sum( len(postings[valueid]) for valueid in valueids )
+                if best is None or count < best[0]:
+                    best = (count, i, [ postings[valueid] for valueid in valueids ])
+        if best is None:
+            return None
+        _, i, postings = best
+        if len(postings) == 1:
+            return i, postings[0]
+        positions = array('l')
+        for p in postings:
+            positions.extend(p)
+        return i, sorted(positions)
+
+    def find(self, query, debug=False):
+        """Find all matches of the query (a string or :class:`Query`), yields (sequence index, begin, end) tuples with offsets relative to the sequence, ordered by position"""
+        if not isinstance(query, Query):
+            query = Query(query)
+        dfa = query.compile()
+        anchor = self.anchor(query)
+        if anchor is None:
+            if debug: print("No anchor, searching full index",file=sys.stderr)
+            for sequenceindex in range(len(self.offsets)):
+                begin, end = self.bounds(sequenceindex)
+                for matchbegin, matchend in dfa.spans(self.tokens(begin, end), debug):
+                    yield sequenceindex, matchbegin, matchend
+            return
+
+        anchorindex, positions = anchor
+        if debug: print("Anchoring on token expression ", anchorindex, ", ", len(positions), " occurrences",file=sys.stderr)
+        #the anchor token is preceded by at least minbefore and at most maxbefore tokens in a match
+        minbefore = maxbefore = 0
+        for minlength, maxlength in query.tokenlengths()[:anchorindex]:
+            if minlength is None:
+                return #can never match
+            minbefore += minlength
+            if maxbefore is not None:
+                maxbefore = None if maxlength is None else maxbefore + maxlength
+
+        starts = set()
+        for position in positions:
+            sequenceindex = bisect_right(self.offsets, position) - 1
+            begin = self.offsets[sequenceindex]
+            last = position - minbefore
+            first = begin if maxbefore is None else max(begin, position - maxbefore)
+            starts.update(range(first, last+1))
+
+        for start in sorted(starts):
+            sequenceindex = bisect_right(self.offsets, start) - 1
+            begin, end = self.bounds(sequenceindex)
+            for length in dfa.run(self.tokens(start, end), False, debug):
+                yield sequenceindex, start - begin, start - begin + length
+
+    def __call__(self, query, debug=False):
+        """Executes the query (a string or :class:`Query`) and returns a list of all matches, each a list of tokens"""
+        return [ list(self.tokens(self.offsets[sequenceindex] + begin, self.offsets[sequenceindex] + end)) for sequenceindex, begin, end in self.find(query, debug) ]
 
 
 
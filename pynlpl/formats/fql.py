@@ -22,12 +22,14 @@ from __future__ import division
 from __future__ import absolute_import
 
 from pynlpl.formats import folia
+from pynlpl.common import isstring
 from copy import copy
 import json
 import re
 import sys
 import random
 import datetime
+import multiprocessing
 
 OPERATORS = ('=','==','!=','>','<','<=','>=','CONTAINS','NOTCONTAINS','MATCHES','NOTMATCHES')
 MASK_NORMAL = 0
@@ -234,6 +236,8 @@ class Filter(object): #WHERE ....
                     cnv =  lambda x: x
                 if operator == '=' or operator == '==':
                     filters.append( lambda x,y=q[i+2],v=v : v(x) == y )
+                    if q[i] in ("class","text"):
+                        filters[-1].indexkey = (q[i], q[i+2]) #equality constraint that can be answered by a DocumentIndex
                 elif operator == '!=':
                     filters.append( lambda x,y=q[i+2],v=v : v(x) != y )
                 elif operator == '>':
@@ -327,6 +331,24 @@ class Filter(object): #WHERE ....
         if debug: print("[FQL EVALUATION DEBUG] Filter returns ", str(match),file=sys.stderr)
         return match
 
+    def indexconstraints(self):
+        """Returns a list of equality constraints that any element has to satisfy to pass this filter, for use with a :class:`DocumentIndex`. Constraints are tuples ``('class', cls)``, ``('text', text)`` or ``('has', Class, set, cls)``, the latter for ``HAS`` statements on a subelement. Only conjunctive, non-negated filters produce constraints."""
+        if self.negation or (self.disjunction and len(self.filters) > 1):
+            return []
+        constraints = []
+        for filter in self.filters:
+            if isinstance(filter,tuple):
+                modifier, selector, subfilter = filter
+                if modifier == "CHILD" and subfilter and selector.Class and selector.Class != "ALL" and not selector.id:
+                    for constraint in subfilter.indexconstraints():
+                        if constraint[0] == 'class':
+                            constraints.append( ('has', selector.Class, selector.set, constraint[1]) )
+            elif isinstance(filter, Filter):
+                constraints += filter.indexconstraints()
+            elif hasattr(filter, 'indexkey'):
+                constraints.append(filter.indexkey)
+        return constraints
+
     def __str__(self):
         q = ""
         if self.negation:
@@ -355,16 +377,143 @@ class SpanSet(list):
         raise QueryError("Got a span set for a non-span element")
 
     def partof(self, collection):
+        """Is a span set with the very same elements part of the collection?"""
         for e in collection:
-            if isinstance(e, SpanSet):
-                if len(e) != len(self):
-                    return False
-                for c1,c2 in zip(e,self):
-                    if c1 is not c2:
-                        return False
+            if isinstance(e, SpanSet) and len(e) == len(self) and all( c1 is c2 for c1,c2 in zip(e,self) ):
+                return True
         return False
 
 
+class DocumentIndex(object):
+    """Optional secondary index on a FoLiA document, used by FQL to answer equality filters (``WHERE class = "X"``, ``WHERE text = "..."`` and ``HAS`` statements on annotations, such as ``:pos = "X"``) without visiting every element in the document.
+
+    The index maps (Class, class) to elements and text to words. It attaches itself to the document upon construction, all subsequent queries on the document will use it::
+
+        fql.DocumentIndex(doc)
+        query = fql.Query('SELECT w WHERE text = "house"')
+        for word in query(doc):
+            print(word)
+
+    The index is built lazily and invalidated automatically whenever an FQL query modifies the document. If you modify the document through other means, call :meth:`invalidate` yourself.
+    """
+
+    def __init__(self, doc):
+        self.doc = doc
+        self.valid = False
+        self.classindex = {} #cls -> Class -> [element], in document order
+        self.textindex = {} #text -> [word], in document order
+        self.positions = {} #id(element) -> position in document order
+        doc.fqlindex = self
+
+    def build(self):
+        """Builds the index, this is done automatically upon first use"""
+        self.classindex = {}
+        self.textindex = {}
+        self.positions = {}
+        for i, e in enumerate(self.doc.select(folia.AbstractElement)):
+            self.positions[id(e)] = i
+            if e.cls is not None:
+                if e.cls not in self.classindex:
+                    self.classindex[e.cls] = {}
+                if e.__class__ in self.classindex[e.cls]:
+                    self.classindex[e.cls][e.__class__].append(e)
+                else:
+                    self.classindex[e.cls][e.__class__] = [e]
+            if isinstance(e, folia.Word):
+                try:
+                    text = e.text()
+                except folia.NoSuchText:
+                    continue
+                if text in self.textindex:
+                    self.textindex[text].append(e)
+                else:
+                    self.textindex[text] = [e]
+        self.valid = True
+
+    def invalidate(self):
+        """Invalidates the index, it will be rebuilt upon next use"""
+        self.valid = False
+
+    def detach(self):
+        """Detaches the index from the document, queries will no longer use it"""
+        if getattr(self.doc, 'fqlindex', None) is self:
+            del self.doc.fqlindex
+
+    def lookup(self, Class, cls):
+        """Returns all (authoritative) elements of the specified Class (or subclasses thereof) with the specified class, in document order"""
+        if not self.valid: self.build()
+        found = [ elements for C, elements in self.classindex.get(cls,{}).items() if issubclass(C, Class) ]
+        if not found:
+            return []
+        elif len(found) == 1:
+            return found[0]
+        else:
+            return self.sort(e for elements in found for e in elements)
+
+    def lookuptext(self, text):
+        """Returns all (authoritative) words with the specified text, in document order"""
+        if not self.valid: self.build()
+        return self.textindex.get(text, [])
+
+    def sort(self, elements):
+        """Sorts elements in document order"""
+        return sorted(elements, key=lambda e: self.positions.get(id(e),-1))
+
+    def candidates(self, query, selector, context, recursive=True):
+        """Returns a list of candidate elements for the selector in the specified context, a superset of the elements that pass the selector's filter, in document order. The filter itself still has to be applied. Returns None if the index can not help out, in which case the caller has to fall back to a full scan."""
+        if not selector.filter or selector.Class in (folia.Text, "ALL") or not (context is self.doc or isinstance(context, folia.Text)):
+            #the index only pays off when selecting from the top level
+            return None
+
+        best = None
+        for constraint in selector.filter.indexconstraints():
+            if constraint[0] == 'class':
+                found = self.lookup(selector.Class, constraint[1])
+            elif constraint[0] == 'text':
+                if not issubclass(selector.Class, folia.Word):
+                    continue
+                found = self.lookuptext(constraint[1])
+            elif constraint[0] == 'has':
+                _, Class, set, cls = constraint
+                if Class.XMLTAG in query.defaultsets:
+                    set = query.defaultsets[Class.XMLTAG]
+                found = []
+                seen = {}
+                for e in self.lookup(Class, cls):
+                    if set is not None and e.set != set:
+                        continue
+                    for ancestor in e.ancestors(selector.Class):
+                        if id(ancestor) not in seen:
+                            seen[id(ancestor)] = True
+                            found.append(ancestor)
+                found = self.sort(found)
+            else:
+                continue
+            if best is None or len(found) < len(best):
+                best = found
+                if not best: break
+
+        if best is None:
+            return None
+
+        candidates = []
+        for e in best:
+            if selector.set is not None and e.set != selector.set:
+                continue
+            if id(e) not in self.positions:
+                continue
+            if recursive:
+                if context is not self.doc and not any(a is context for a in e.ancestors()):
+                    continue
+            elif context is self.doc:
+                if not any(e.parent is t for t in self.doc.data):
+                    continue
+            elif e.parent is not context:
+                continue
+            candidates.append(e)
+        return candidates
+
+
 
 class Selector(object):
     def __init__(self, Class, set=None,id=None, filter=None, nextselector=None, expansion = None):
@@ -500,7 +649,14 @@ class Selector(object):
                         yield e, e
                     else:
                         #print("DEBUG: doing select " + selector.Class.__name__ + " (recurse=" + str(recurse)+") on " + repr(e))
-                        for candidate  in e.select(selector.Class, selector.set, recurse):
+                        candidates = None
+                        index = getattr(query.doc, 'fqlindex', None)
+                        if index is not None:
+                            candidates = index.candidates(query, selector, e, recurse)
+                            if debug and candidates is not None: print("[FQL EVALUATION DEBUG] Select - Obtained " + str(len(candidates)) + " candidates from index",file=sys.stderr)
+                        if candidates is None:
+                            candidates = e.select(selector.Class, selector.set, recurse)
+                        for candidate in candidates:
                             try:
                                 if candidate.changedbyquery is query:
                                     #this candidate has been added/modified by the query, don't select it again
@@ -1458,6 +1614,40 @@ class Action(object): #Action expression
 
         return action, i
 
+    def focusselector(self, query, contextselector, debug=False):
+        """Returns a generator of (focus, target) tuples for the focus of this action"""
+        if contextselector is query.doc and self.focus.Class in ('ALL',folia.Text):
+            return ( (x,x) for x in query.doc )  #Patch to make root-level SELECT ALL work as intended
+        else:
+            strict = query.targets and query.targets.strict
+            return self.focus(query,contextselector, not strict, debug)
+
+    def islazy(self):
+        """Can this action be evaluated lazily? This is only the case for a single plain SELECT action, without forms or subactions"""
+        return self.action == "SELECT" and self.nextaction is None and self.form is None and not self.subactions
+
+    def iterselect(self, query, contextselector, debug=False):
+        """Generator yielding the focus selection of a plain SELECT action one element at a time, rather than gathering it in a list like :meth:`__call__` does. Only applicable if :meth:`islazy` holds."""
+        assert self.islazy()
+        if not self.focus: #SELECT without focus, pure target-select
+            if isinstance(contextselector, tuple) and len(contextselector) == 2:
+                contextselector = contextselector[0](*contextselector[1])
+            for e in contextselector:
+                yield e
+        else:
+            seen = set() #ids of the focus elements yielded so far, the selected elements stay alive in the document so ids are stable
+            spans = [] #span results yielded so far, deduplicated the same way as in __call__
+            for focus, target in self.focusselector(query, contextselector, debug):
+                if isinstance(focus,SpanSet):
+                    if not focus.partof(spans):
+                        spans.append(target)
+                        if debug: print("[FQL EVALUATION DEBUG] Action - Got focus result (spanset), yielding ", repr(target),file=sys.stderr)
+                        yield target
+                elif id(focus) not in seen:
+                    seen.add(id(focus))
+                    if debug: print("[FQL EVALUATION DEBUG] Action - Got focus result, yielding ", repr(focus),file=sys.stderr)
+                    yield focus
+
 
     def __call__(self, query, contextselector, debug=False):
         """Returns a list focusselection after having performed the desired action on each element therein"""
@@ -1538,11 +1728,7 @@ class Action(object): #Action expression
                             focusselection.append(e)
 
                 elif action.action not in ("ADD","APPEND","PREPEND"): #only for actions that operate on an existing focus
-                    if contextselector is query.doc and action.focus.Class in ('ALL',folia.Text):
-                        focusselector = ( (x,x) for x in query.doc )  #Patch to make root-level SELECT ALL work as intended
-                    else:
-                        strict = query.targets and query.targets.strict
-                        focusselector = action.focus(query,contextselector, not strict, debug)
+                    focusselector = action.focusselector(query, contextselector, debug)
                     if debug: print("[FQL EVALUATION DEBUG] Action - Obtaining focus...",file=sys.stderr)
                     for focus, target in focusselector:
                         if target and action.action != "SUBSTITUTE":
@@ -1763,6 +1949,10 @@ class Action(object): #Action expression
                         else:
                             focusselection.append(e)
 
+        if any(action.action != "SELECT" for action in actions):
+            #the document may have changed, not all mutations go through Query._touch
+            query._invalidateindex()
+
         if len(actions) > 1:
             return focusselection_all, constrainedtargetselection_all
         else:
@@ -1896,60 +2086,15 @@ class Query(object):
     def __call__(self, doc, wrap=True,debug=False):
         """Execute the query on the specified document"""
 
-        self.doc = doc
-
-        if debug: print("[FQL EVALUATION DEBUG] Query  - Starting on document ", doc.id,file=sys.stderr)
+        targetselector = self._prepare(doc, debug)
 
-        if self.declarations:
-            for Class, decset, defaults in self.declarations:
-                if debug: print("[FQL EVALUATION DEBUG] Processing declaration for ", Class.__name__, "of",str(decset),file=sys.stderr)
-                doc.declare(Class,decset,**defaults)
-
-        if self.action:
-            targetselector = doc
-            if self.targets and not (isinstance(self.targets.targets[0], Selector) and self.targets.targets[0].Class in ("ALL", folia.Text)):
-                targetselector = (self.targets, (self, targetselector, True, debug)) #function recipe to get the generator for the targets, (f, *args) (first is always recursive)
-
-            focusselection, targetselection = self.action(self, targetselector, debug) #selecting focus elements further constrains the target selection (if any), return values will be lists
-
-            if self.returntype == "nothing":
-                return ""
-            elif self.returntype == "focus":
-                responseselection = focusselection
-            elif self.returntype == "target" or self.returntype == "inner-target":
-                responseselection = []
-                for e in targetselection:
-                    if not any(x is e for x in responseselection): #filter out duplicates
-                        responseselection.append(e)
-            elif self.returntype == "outer-target":
-                raise NotImplementedError
-            elif self.returntype == "ancestor" or self.returntype == "ancestor-focus":
-                responseselection = []
-                try:
-                    responseselection.append( next(folia.commonancestors(folia.AbstractStructureElement,*focusselection)) )
-                except StopIteration:
-                    raise QueryError("No ancestors found for focus: " + str(repr(focusselection)))
-            elif self.returntype == "ancestor-target":
-                elems = []
-                for e in targetselection:
-                    if isinstance(e, SpanSet):
-                        elems += e
-                    else:
-                        elems.append(e)
-                responseselection = []
-                try:
-                    responseselection.append( next(folia.commonancestors(folia.AbstractStructureElement,*elems)) )
-                except StopIteration:
-                    raise QueryError("No ancestors found for targets: " + str(repr(targetselection)))
-            else:
-                raise QueryError("Invalid return type: " + self.returntype)
-
-        else:
-            responseselection = []
-
-        if self.returntype == "nothing": #we're done
+        if self.returntype == "nothing":
+            if self.action:
+                self.action(self, targetselector, debug)
             return ""
 
+        responseselection = self._responseselection(targetselector, debug)
+
         #convert response selection to proper format and return
         if self.format.startswith('single'):
             if len(responseselection) > 1:
@@ -1960,11 +2105,7 @@ class Query(object):
                     return ""
                 else:
                     if isinstance(responseselection[0], SpanSet):
-                            r = "<result>\n"
-                            for e in responseselection[0]:
-                                r += e.xmlstring(True)
-                            r += "</result>\n"
-                            return r
+                        return "".join(self._serialise_xml(responseselection[0], False))
                     else:
                         return responseselection[0].xmlstring(True)
             elif self.format == "single-json":
@@ -1979,58 +2120,175 @@ class Query(object):
                     return None
                 else:
                     return responseselection[0]
+        elif self.format in ("xml","json","jsonl"):
+            if debug: print("[FQL EVALUATION DEBUG] Query  - Returning " + self.format,file=sys.stderr)
+            return "".join(self.serialise(responseselection, wrap))
+        else: #python and undefined formats
+            if debug: print("[FQL EVALUATION DEBUG] Query  - Returning python",file=sys.stderr)
+            return responseselection
+
+        return QueryError("Invalid format: " + self.format)
+
+    def stream(self, doc, wrap=True, debug=False):
+        """Execute the query on the specified document and yield the results incrementally, rather than returning them all at once.
+
+        For the ``xml``, ``json`` and ``jsonl`` formats, this is a generator of string chunks that together make up the same output as :meth:`__call__` would return. For the ``python`` format, the resulting elements themselves are yielded. Plain ``SELECT`` queries (without forms or subactions) returning their focus are evaluated lazily, so the full result set is never held in memory. Other queries are evaluated completely first, only the serialisation is incremental then.
+
+        Example::
+
+            query = fql.Query('SELECT w FORMAT jsonl')
+            for chunk in query.stream(doc):
+                connection.send(chunk)
+        """
+        if self.format.startswith('single'):
+            #there is only one result anyway
+            yield self(doc, wrap, debug)
+            return
+
+        targetselector = self._prepare(doc, debug)
+
+        if self.returntype == "nothing":
+            if self.action:
+                self.action(self, targetselector, debug)
+            return
+
+        if self.action and self.returntype == "focus" and self.action.islazy():
+            if debug: print("[FQL EVALUATION DEBUG] Query  - Streaming lazily evaluated focus selection",file=sys.stderr)
+            responseselection = self.action.iterselect(self, targetselector, debug)
         else:
-            if self.format == "xml":
-                if debug: print("[FQL EVALUATION DEBUG] Query  - Returning xml",file=sys.stderr)
-                if not responseselection:
-                    if wrap:
-                        return "<results></results>"
-                    else:
-                        return ""
+            responseselection = self._responseselection(targetselector, debug)
+
+        if self.format in ("xml","json","jsonl"):
+            for chunk in self.serialise(responseselection, wrap):
+                yield chunk
+        else: #python and undefined formats
+            for e in responseselection:
+                yield e
+
+    def write(self, doc, stream, wrap=True, debug=False):
+        """Execute the query on the specified document and write the serialised results incrementally to the specified file-like object (anything with a ``write()`` method). Only applicable to string formats (``xml``, ``json``, ``jsonl`` and the ``single-`` variants thereof). See :meth:`stream`."""
+        if self.format in ("python", "single-python"):
+            raise QueryError("Can not write results in format " + self.format + " to a stream")
+        for chunk in self.stream(doc, wrap, debug):
+            if chunk:
+                stream.write(chunk)
+
+    def serialise(self, responseselection, wrap=True):
+        """Generator yielding the serialisation of the response selection (any iterable) in string chunks, in the format of this query (``xml``, ``json`` or ``jsonl``)"""
+        if self.format == "xml":
+            first = True
+            for e in responseselection:
+                if first:
+                    if wrap: yield "<results>\n"
+                    first = False
+                for chunk in self._serialise_xml(e):
+                    yield chunk
+            if first: #no results
+                if wrap: yield "<results></results>"
+            elif wrap:
+                yield "</results>\n"
+        elif self.format == "json":
+            first = True
+            for e in responseselection:
+                if first:
+                    if wrap: yield "[ "
+                    first = False
                 else:
-                    if wrap:
-                        r = "<results>\n"
-                    else:
-                        r = ""
-                    for e in responseselection:
-                        if isinstance(e, SpanSet):
-                            r += "<result>\n"
-                            for e2 in e:
-                                r += "" + e2.xmlstring(True) + "\n"
-                            r += "</result>\n"
-                        else:
-                            r += "<result>\n" + e.xmlstring(True) + "</result>\n"
-                    if wrap:
-                        r += "</results>\n"
-                    return r
-            elif self.format == "json":
-                if debug: print("[FQL EVALUATION DEBUG] Query  - Returning json",file=sys.stderr)
-                if not responseselection:
-                    if wrap:
-                        return "[]"
-                    else:
-                        return ""
+                    yield ", "
+                yield self._serialise_json(e)
+            if first: #no results
+                if wrap: yield "[]"
+            elif wrap:
+                yield "]"
+        elif self.format == "jsonl":
+            #JSON Lines, one result per line, never wrapped
+            for e in responseselection:
+                yield self._serialise_json(e) + "\n"
+        else:
+            raise QueryError("Invalid format for serialisation: " + self.format)
+
+    @staticmethod
+    def _serialise_xml(e, newlines=True):
+        if isinstance(e, SpanSet):
+            yield "<result>\n"
+            for e2 in e:
+                if newlines:
+                    yield e2.xmlstring(True) + "\n"
                 else:
-                    if wrap:
-                        s = "[ "
-                    else:
-                        s = ""
-                    for e in responseselection:
-                        if isinstance(e, SpanSet):
-                            s += json.dumps([ e2.json() for e2 in e ] ) + ", "
-                        else:
-                            s += json.dumps(e.json()) + ", "
-                    s = s.strip(", ")
-                    if wrap:
-                        s += "]"
-                    return s
-            else: #python and undefined formats
-                if debug: print("[FQL EVALUATION DEBUG] Query  - Returning python",file=sys.stderr)
-                return responseselection
+                    yield e2.xmlstring(True)
+            yield "</result>\n"
+        else:
+            yield "<result>\n" + e.xmlstring(True) + "</result>\n"
 
-        return QueryError("Invalid format: " + self.format)
+    @staticmethod
+    def _serialise_json(e):
+        if isinstance(e, SpanSet):
+            return json.dumps([ e2.json() for e2 in e ] )
+        else:
+            return json.dumps(e.json())
+
+    def _prepare(self, doc, debug=False):
+        """Binds the query to the document, processes declarations and returns the target selector"""
+        self.doc = doc
+
+        if debug: print("[FQL EVALUATION DEBUG] Query  - Starting on document ", doc.id,file=sys.stderr)
+
+        if self.declarations:
+            for Class, decset, defaults in self.declarations:
+                if debug: print("[FQL EVALUATION DEBUG] Processing declaration for ", Class.__name__, "of",str(decset),file=sys.stderr)
+                doc.declare(Class,decset,**defaults)
+
+        targetselector = doc
+        if self.targets and not (isinstance(self.targets.targets[0], Selector) and self.targets.targets[0].Class in ("ALL", folia.Text)):
+            targetselector = (self.targets, (self, targetselector, True, debug)) #function recipe to get the generator for the targets, (f, *args) (first is always recursive)
+        return targetselector
+
+    def _responseselection(self, targetselector, debug=False):
+        """Evaluates the action and returns the response selection (a list) according to the return type"""
+        if not self.action:
+            return []
+
+        focusselection, targetselection = self.action(self, targetselector, debug) #selecting focus elements further constrains the target selection (if any), return values will be lists
+
+        if self.returntype == "focus":
+            responseselection = focusselection
+        elif self.returntype == "target" or self.returntype == "inner-target":
+            responseselection = []
+            for e in targetselection:
+                if not any(x is e for x in responseselection): #filter out duplicates
+                    responseselection.append(e)
+        elif self.returntype == "outer-target":
+            raise NotImplementedError
+        elif self.returntype == "ancestor" or self.returntype == "ancestor-focus":
+            responseselection = []
+            try:
+                responseselection.append( next(folia.commonancestors(folia.AbstractStructureElement,*focusselection)) )
+            except StopIteration:
+                raise QueryError("No ancestors found for focus: " + str(repr(focusselection)))
+        elif self.returntype == "ancestor-target":
+            elems = []
+            for e in targetselection:
+                if isinstance(e, SpanSet):
+                    elems += e
+                else:
+                    elems.append(e)
+            responseselection = []
+            try:
+                responseselection.append( next(folia.commonancestors(folia.AbstractStructureElement,*elems)) )
+            except StopIteration:
+                raise QueryError("No ancestors found for targets: " + str(repr(targetselection)))
+        else:
+            raise QueryError("Invalid return type: " + self.returntype)
+
+        return responseselection
+
+    def _invalidateindex(self):
+        index = getattr(self.doc, 'fqlindex', None)
+        if index is not None:
+            index.invalidate()
 
     def _touch(self, *args):
+        self._invalidateindex()
         for e in args:
             if isinstance(e, folia.AbstractElement):
                 e.changedbyquery = self
@@ -2038,4 +2296,141 @@ class Query(object):
 
 
 
+def _corpusquery_init(progress):
+    global _corpusquery_progress #pylint: disable=global-statement
+    _corpusquery_progress = progress
+
+def _corpusquery_worker(args):
+    """Processes a single file for :class:`CorpusQuery`, runs in a worker process"""
+    filename, queries, context, limit, index, save, ignoreerrors, documentkwargs = args
+    if limit is not None and all(count >= limit for count in _corpusquery_progress):
+        #the limit has already been reached on documents prior to this one, skip
+        return filename, None
+    try:
+        doc = folia.Document(file=filename, **documentkwargs)
+        if index:
+            DocumentIndex(doc)
+        results = []
+        for q in queries:
+            query = Query(q, context)
+            format = query.format
+            query.format = "python"
+            items = []
+            for e in query.stream(doc):
+                if limit is not None and len(items) >= limit:
+                    break
+                if format in ("xml","single-xml"):
+                    items.append("".join(Query._serialise_xml(e)))
+                elif format in ("json","jsonl","single-json"):
+                    items.append(Query._serialise_json(e))
+                elif isinstance(e, SpanSet):
+                    items.append([ e2.json() for e2 in e ])
+                else:
+                    items.append(e.json())
+            results.append(items)
+        if save and any(_mutates(q) for q in queries):
+            doc.save()
+    except Exception as e: #pylint: disable=broad-except
+        if not ignoreerrors:
+            raise
+        print("Error, unable to query " + filename + ": " + e.__class__.__name__  + " - " + str(e),file=sys.stderr)
+        return filename, None
+    return filename, results
+
+def _mutates(q):
+    """Does the query modify documents?"""
+    if not isinstance(q, Query):
+        q = Query(q)
+    if q.declarations:
+        return True
+    action = q.action
+    while action:
+        if action.action != "SELECT":
+            return True
+        action = action.nextaction
+    return False
+
+
+class CorpusQuery(object):
+    """Runs one or more FQL queries on all FoLiA documents in a corpus, in parallel. Each document is processed by a worker process from a pool, the results are yielded in a deterministic order (sorted by filename) regardless of which worker finishes first. Iterating yields ``(filename, results)`` tuples, where ``results`` holds a list of result items for each of the queries.
+
+    A result item is the serialisation of a single result in the format of the query, i.e. an XML string for ``xml``, a JSON string for ``json`` and ``jsonl``. Elements can not be passed between processes, so for the ``python`` format the item is the dictionary produced by :meth:`pynlpl.formats.folia.AbstractElement.json` (or a list thereof for spans).
+
+    Queries that modify documents (EDIT, ADD, DELETE, etc..) cause the documents to be saved in place, unless ``save=False``.
+
+    Example::
+
+        for filename, (words,) in fql.CorpusQuery('SELECT w WHERE text = "house" FORMAT xml', "/path/to/corpus", limit=100):
+            for word in words:
+                print(filename, word)
+
+    Arguments:
+        queries (str or list): An FQL query, or a list of queries to run on each document
+        corpusdir (str): The directory containing the corpus, see :class:`pynlpl.formats.folia.CorpusFiles`
+        threads (int): The number of worker processes, defaults to the number of available cores
+        extension (str): The extension of the FoLiA documents
+        restrict_to_collection (str): Only process this subdirectory of the corpus
+        conditionf: A function taking a filename, only files for which it returns ``True`` are processed
+        maxtasksperchild (int): Recycle workers after this many documents, should never be set too high due to lxml leaking memory
+        chunksize (int): Number of documents to hand to a worker at once
+        limit (int): The maximum number of results to return per query for the corpus as a whole; processing stops as soon as this is attained. Can not be used with queries that modify documents, as it is undefined which documents would be saved.
+        context (Context): The context for the queries (default format, return type, default sets)
+        index (bool): Attach a :class:`DocumentIndex` to each document, worthwhile when running a batch of queries
+        save (bool): Save documents modified by the queries (default: ``True``)
+        ignoreerrors (bool): Skip documents that can not be loaded or queried, rather than raising an exception. Their results will be ``None``
+        **kwargs: Keyword arguments passed to :class:`pynlpl.formats.folia.Document`
+    """
+
+    def __init__(self, queries, corpusdir, threads=None, extension='xml', restrict_to_collection="", conditionf=lambda x: True, maxtasksperchild=100, chunksize=1, limit=None, context=Context(), index=False, save=True, ignoreerrors=False, **kwargs):
+        if isstring(queries):
+            queries = [queries]
+        self.queries = list(queries)
+        for q in self.queries:
+            Query(q, context) #raises a SyntaxError early, rather than in the workers
+        self.corpusdir = corpusdir
+        self.threads = threads #If set to None, will use all available cores by default
+        self.extension = extension
+        self.restrict_to_collection = restrict_to_collection
+        self.conditionf = conditionf
+        self.maxtasksperchild = maxtasksperchild #This should never be set too high due to lxml leaking memory!!!
+        self.chunksize = chunksize
+        self.limit = limit
+        self.context = context
+        self.index = index
+        self.save = save
+        self.ignoreerrors = ignoreerrors
+        self.documentkwargs = kwargs
+        if limit is not None and save and any(_mutates(q) for q in self.queries):
+            raise QueryError("A limit can not be combined with queries that modify documents")
+
+    def files(self):
+        """Returns a sorted list of all files in the corpus that will be processed"""
+        return sorted(folia.CorpusFiles(self.corpusdir, self.extension, self.restrict_to_collection, self.conditionf, True))
+
+    def run(self):
+        """Generator yielding ``(filename, results)`` tuples, in order. If the queries modify documents that are saved, all documents are still processed when the iteration is stopped early."""
+        progress = multiprocessing.Array('l', len(self.queries)) #number of results found so far per query, in order, only updated by the parent process
+        counts = [0] * len(self.queries)
+        pool = multiprocessing.Pool(self.threads, _corpusquery_init, (progress,), self.maxtasksperchild)
+        tasks = ( (filename, self.queries, self.context, self.limit, self.index, self.save, self.ignoreerrors, self.documentkwargs) for filename in self.files() )
+        try:
+            for filename, results in pool.imap(_corpusquery_worker, tasks, self.chunksize):
+                if results is not None and self.limit is not None:
+                    for i, items in enumerate(results):
+                        if counts[i] + len(items) > self.limit:
+                            results[i] = items[:self.limit - counts[i]]
+                        counts[i] += len(results[i])
+                        progress[i] = counts[i]
+                yield filename, results
+                if self.limit is not None and all(count >= self.limit for count in counts):
+                    break
+        finally:
+            if self.save and any(_mutates(q) for q in self.queries):
+                #workers may be saving documents in place, let them finish rather than leave truncated files
+                pool.close()
+            else:
+                pool.terminate()
+            pool.join()
 
+    def __iter__(self):
+        return self.run()
@@ -14,6 +14,7 @@
 #----------------------------------------------------------------
 from __future__ import print_function, unicode_literals, division, absolute_import
 import sys
+from collections import deque
 
 
 class State(object):
@@ -86,10 +87,16 @@ class NFA(object):
             return False
 
     def find(self, sequence, debug=False):
-        l = len(sequence)
-        for i in range(0,l):
-            for length in self.run(sequence[i:], False, debug):
-                yield sequence[i:i+length]
+        """Find all subsequences matched by the automaton, ordered by offset and length. This uses the compiled deterministic automaton (see :meth:`compile`) and processes the sequence in a single pass"""
+        return self.compile().find(sequence, debug)
+
+    def compile(self):
+        """Returns a :class:`DFA` equivalent to this NFA. The DFA is built lazily and cached, so do not change the NFA's states after calling this."""
+        try:
+            return self.dfa
+        except AttributeError:
+            self.dfa = DFA(self)
+            return self.dfa
 
     def __iter__(self):
         return iter(self._states(self.initialstate))
@@ -126,3 +133,154 @@ class NFA(object):
                 out.append( staterep + " -(" + repr(item) + ")-> " + nextstaterep )
 
         return "\n".join(out)
+
+
+
+class DFAState(object):
+    """A state in a :class:`DFA`, corresponding to a set of states in the underlying NFA. The outgoing transitions of all NFA states are grouped by their match function (the predicates), each predicate is evaluated only once per value."""
+
+    def __init__(self, nfastates):
+        self.nfastates = nfastates #frozenset of NFA states (epsilon-closed)
+        self.final = any(state.final for state in nfastates)
+        self.predicates = [] #distinct match functions
+        self.matchitems = [] #corresponding match items
+        self.targets = [] #corresponding NFA states reached when a predicate matches
+        index = {}
+        for state in nfastates:
+            for matchitem, matchfunction, nextstate in state.transitions:
+                if matchfunction in index:
+                    self.targets[index[matchfunction]].append(nextstate)
+                else:
+                    index[matchfunction] = len(self.predicates)
+                    self.predicates.append(matchfunction)
+                    self.matchitems.append(matchitem)
+                    self.targets.append([nextstate])
+        self.next = {} #memoised transitions: bitmask of matching predicates -> DFAState (or None if no states are reached)
+
+    def __len__(self):
+        return len(self.nfastates)
+
+
+class DFA(object):
+    """Deterministic finite state automaton, compiled from an :class:`NFA` using subset construction. States are constructed lazily as they are reached and cached, keyed on the set of NFA states they represent.
+
+    The transitions of the NFA carry arbitrary match functions rather than symbols from an alphabet, so a DFA state's transition for a value is determined by which of its predicates match (the equivalence class of the value), and is memoised on that.
+    """
+
+    def __init__(self, nfa):
+        self.nfa = nfa
+        self.states = {} #frozenset of NFA states -> DFAState
+        self.closures = {} #NFA state -> frozenset, epsilon closure
+        self.initialstate = self.getstate([nfa.initialstate])
+
+    def closure(self, state):
+        """Returns the epsilon closure of an NFA state (as a frozenset)"""
+        try:
+            return self.closures[state]
+        except KeyError:
+            pass
+        closure = set()
+        stack = [state]
+        while stack:
+            s = stack.pop()
+            if s not in closure:
+                closure.add(s)
+                stack += s.epsilon
+        closure = frozenset(closure)
+        self.closures[state] = closure
+        return closure
+
+    def getstate(self, nfastates):
+        """Returns the DFA state for the given NFA states (after taking their epsilon closure), or None if there are no states"""
+        closure = set()
+        for state in nfastates:
+            closure |= self.closure(state)
+        if not closure:
+            return None
+        closure = frozenset(closure)
+        try:
+            return self.states[closure]
+        except KeyError:
+            dfastate = DFAState(closure)
+            self.states[closure] = dfastate
+            return dfastate
+
+    def step(self, state, value, cache=None):
+        """Returns the state reached from the given state for the given value, or None if there is none. A dictionary may be passed as cache to share predicate results for the same value across states."""
+        signature = 0
+        for i, predicate in enumerate(state.predicates):
+            if cache is None:
+                match = predicate(value)
+            else:
+                try:
+                    match = cache[predicate]
+                except KeyError:
+                    match = cache[predicate] = predicate(value)
+            if match:
+                signature |= 1 << i
+        try:
+            return state.next[signature]
+        except KeyError:
+            nextstate = self.getstate(target for i, targets in enumerate(state.targets) if signature & (1 << i) for target in targets)
+            state.next[signature] = nextstate
+            return nextstate
+
+    def run(self, sequence, mustmatchall=False,debug=False):
+        """Runs the automaton on the sequence and yields the offsets at which a final state is reached, or only the final offset if ``mustmatchall`` is set. See :meth:`NFA.run`."""
+        state = self.initialstate
+        offset = -1
+        for offset, value in enumerate(sequence):
+            state = self.step(state, value)
+            if debug: print("Value: ", repr(value), " state: ", repr(state),file=sys.stderr)
+            if state is None:
+                return
+            if not mustmatchall and state.final:
+                if debug: print("Final state reached",file=sys.stderr)
+                yield offset+1
+        if mustmatchall and state.final and offset >= 0:
+            if debug: print("Final state reached",file=sys.stderr)
+            yield offset+1
+
+    def match(self, sequence):
+        try:
+            return next(self.run(sequence,True)) == len(sequence)
+        except StopIteration:
+            return False
+
+    def find(self, sequence, debug=False):
+        """Find all subsequences matched by the automaton. All start offsets are tracked simultaneously in a single pass over the sequence, evaluating each predicate at most once per value. Matches are yielded ordered by start offset first and length second, i.e. in the same order as running the automaton from every offset in turn."""
+        for begin, end in self.spans(sequence, debug):
+            yield sequence[begin:end]
+
+    def spans(self, sequence, debug=False):
+        """Like :meth:`find`, but yields (begin, end) offsets instead of subsequences. The sequence may be any iterable."""
+        pending = deque() #[start, ends, state] for all starts whose matches have not been yielded yet, in order
+        active = [] #the subset of pending that can still reach a final state
+        for offset, value in enumerate(sequence):
+            entry = [offset, [], self.initialstate]
+            pending.append(entry)
+            active.append(entry)
+            cache = {} #predicate results for this value
+            steps = {} #transitions for this value, starts in the same state share them
+            stillactive = []
+            for entry in active:
+                state = entry[2]
+                try:
+                    nextstate = steps[state]
+                except KeyError:
+                    nextstate = steps[state] = self.step(state, value, cache)
+                entry[2] = nextstate
+                if nextstate is not None:
+                    if nextstate.final:
+                        if debug: print("Final state reached for match starting at ", entry[0], " ending at ", offset+1,file=sys.stderr)
+                        entry[1].append(offset+1)
+                    stillactive.append(entry)
+            active = stillactive
+            if debug: print("Value: ", repr(value), " active starts: ", len(active),file=sys.stderr)
+            while pending and pending[0][2] is None:
+                start, ends, _ = pending.popleft()
+                for end in ends:
+                    yield start, end
+        for start, ends, _ in pending:
+            for end in ends:
+                yield start, end
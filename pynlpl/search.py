@@ -27,8 +27,329 @@ else:
     stdout = sys.stdout
 from pynlpl.datatypes import FIFOQueue, PriorityQueue
 from collections import deque
+from copy import copy
+from array import array
+from collections import OrderedDict
+import heapq
+import math
+try:
+    from time import perf_counter as clock
+except ImportError:
+    from time import time as clock
 from bisect import bisect_left
 
+if sys.version < '3':
+    _UINT64 = 'L' if array('L').itemsize == 8 else None #Python 2 has no 'Q' typecode, fall back to a list if 'L' is too small
+else:
+    _UINT64 = 'Q'
+
+
+def _expand(state):
+    """Expands a state into a list of successors, a module-level function so it can be sent to the workers of a process pool"""
+    return list(state.expand())
+
+def _expanddetached(state):
+    """Expands a state that was detached from its parent, and detaches the successors from the state in turn, so only the states themselves have to be pickled rather than the entire path to them"""
+    successors = _expand(state)
+    for s in successors:
+        if s.parent is state:
+            s.parent = None
+    return successors
+
+def _detach(state):
+    """Returns a shallow copy of the state without parent"""
+    state = copy(state)
+    state.parent = None
+    return state
+
+
+def _digest(state):
+    """Returns a well-mixed 64-bit digest of the state's hash (the finalizer of splitmix64), never zero"""
+    x = hash(state) & 0xFFFFFFFFFFFFFFFF
+    x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & 0xFFFFFFFFFFFFFFFF
+    x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & 0xFFFFFFFFFFFFFFFF
+    x ^= x >> 31
+    return x or 1
+
+
+class AbstractVisitedStore(object):
+    """Stores which states a search has visited. States are identified by their hash, as in the default store, so they are never kept in memory themselves."""
+
+    def add(self, state):
+        """Marks a state as visited"""
+        raise NotImplementedError
+
+    def __contains__(self, state):
+        """Tests whether a state was visited"""
+        raise NotImplementedError
+
+    def __len__(self):
+        """Returns the number of states marked as visited"""
+        raise NotImplementedError
+
+    def clear(self):
+        """Forgets all visited states"""
+        raise NotImplementedError
+
+    def memory(self):
+        """Returns an estimate of the memory used by the store, in bytes"""
+        raise NotImplementedError
+
+
+class HashVisitedStore(AbstractVisitedStore):
+    """Exact store of state hashes in a set (the default)"""
+
+    def __init__(self):
+        self.hashes = set()
+
+    def add(self, state):
+        self.hashes.add(hash(state))
+
+    def __contains__(self, state):
+        return hash(state) in self.hashes
+
+    def __len__(self):
+        return len(self.hashes)
+
+    def clear(self):
+        self.hashes = set()
+
+    def memory(self):
+        #the set's table plus an int object per hash
+        return sys.getsizeof(self.hashes) + len(self.hashes) * sys.getsizeof(2**62)
+
+
+class DigestVisitedStore(AbstractVisitedStore):
+    """Exact store of 64-bit digests of the state hashes, in an open addressing hash table that is a single array of unsigned 64-bit integers. This takes 8 to 32 bytes per state instead of around 60 for a set of hashes."""
+
+    def __init__(self, capacity=1024):
+        self.capacity = capacity
+        self.clear()
+
+    @staticmethod
+    def _table(size):
+        """Returns a table of the specified size with all slots empty (zero)"""
+        if _UINT64:
+            return array(_UINT64, [0]) * size
+        return [0] * size
+
+    def _slot(self, digest):
+        """Returns the slot holding the digest, or the empty slot where it belongs"""
+        table = self.table
+        mask = len(table) - 1
+        i = digest & mask
+        while table[i] and table[i] != digest:
+            i = (i + 1) & mask
+        return i
+
+    def add(self, state):
+        digest = _digest(state)
+        i = self._slot(digest)
+        if not self.table[i]:
+            self.table[i] = digest
+            self.count += 1
+            if self.count * 2 > len(self.table):
+                self._grow()
+
+    def _grow(self):
+        digests = [ digest for digest in self.table if digest ]
+        self.table = self._table(2 * len(self.table))
+        for digest in digests:
+            self.table[self._slot(digest)] = digest
+
+    def __contains__(self, state):
+        return bool(self.table[self._slot(_digest(state))])
+
+    def __len__(self):
+        return self.count
+
+    def clear(self):
+        size = 16
+        while size < self.capacity * 2: size *= 2
+        self.table = self._table(size)
+        self.count = 0
+
+    def memory(self):
+        if isinstance(self.table, list):
+            return sys.getsizeof(self.table) + self.count * sys.getsizeof(2**62)
+        return sys.getsizeof(self.table)
+
+
+class BloomVisitedStore(AbstractVisitedStore):
+    """Scalable Bloom filter (Almeida et al., 2007): a series of Bloom filters, each twice the capacity of the previous one and with half its false positive rate, so the overall false positive rate stays below errorrate however many states are added. A false positive makes the search consider a state visited that was not, so that state is not expanded. Takes about 1.44 * log2(1/errorrate) bits per state. The length of the store does not count states that already tested positive when they were added."""
+
+    def __init__(self, capacity=8192, errorrate=0.001):
+        if not 0 < errorrate < 1:
+            raise ValueError("Error rate must be between 0 and 1")
+        self.capacity = capacity
+        self.errorrate = errorrate
+        self.clear()
+
+    def clear(self):
+        self.filters = [] #list of [bits, number of bits, number of hash functions, capacity, count]
+        self.count = 0
+        self._addfilter()
+
+    def _addfilter(self):
+        n = len(self.filters)
+        capacity = self.capacity * 2**n
+        errorrate = self.errorrate * 0.5 ** (n+1)
+        size = int(math.ceil(-capacity * math.log(errorrate) / math.log(2)**2))
+        hashes = int(math.ceil(-math.log(errorrate, 2)))
+        self.filters.append([bytearray((size + 7) // 8), size, hashes, capacity, 0])
+
+    @staticmethod
+    def _positions(digest, size, hashes):
+        #double hashing: the k positions are h1 + i * h2
+        h1 = digest & 0xFFFFFFFF
+        h2 = (digest >> 32) | 1
+        return [ (h1 + i * h2) % size for i in range(hashes) ]
+
+    def add(self, state):
+        digest = _digest(state)
+        if self._contains(digest):
+            return
+        f = self.filters[-1]
+        if f[4] >= f[3]:
+            self._addfilter()
+            f = self.filters[-1]
+        bits = f[0]
+        for position in self._positions(digest, f[1], f[2]):
+            bits[position >> 3] |= 1 << (position & 7)
+        f[4] += 1
+        self.count += 1
+
+    def _contains(self, digest):
+        for bits, size, hashes, _, _ in self.filters:
+            if all( bits[position >> 3] & (1 << (position & 7)) for position in self._positions(digest, size, hashes) ):
+                return True
+        return False
+
+    def __contains__(self, state):
+        return self._contains(_digest(state))
+
+    def __len__(self):
+        return self.count
+
+    def memory(self):
+        return sum( sys.getsizeof(f[0]) for f in self.filters )
+
+
+class LRUVisitedStore(AbstractVisitedStore):
+    """Exact store of state hashes that holds at most maxsize hashes, forgetting the least recently added or tested ones first. A forgotten state may be expanded again when the search reaches it once more."""
+
+    def __init__(self, maxsize=100000):
+        self.maxsize = maxsize
+        self.hashes = OrderedDict()
+
+    def add(self, state):
+        h = hash(state)
+        if h in self.hashes:
+            del self.hashes[h]
+        elif len(self.hashes) >= self.maxsize:
+            self.hashes.popitem(last=False)
+        self.hashes[h] = True
+
+    def __contains__(self, state):
+        h = hash(state)
+        if h in self.hashes:
+            #mark as recently used
+            del self.hashes[h]
+            self.hashes[h] = True
+            return True
+        return False
+
+    def __len__(self):
+        return len(self.hashes)
+
+    def clear(self):
+        self.hashes = OrderedDict()
+
+    def memory(self):
+        return sys.getsizeof(self.hashes) + len(self.hashes) * sys.getsizeof(2**62)
+
+
+def visitedstore(store='hash', size=None, errorrate=0.001):
+    """Returns a visited store by name: hash (exact set of hashes, the default), digest (exact and compact), bloom (probabilistic, size is the initial capacity) or lru (exact but bounded, size is the maximum number of states). An AbstractVisitedStore instance is returned as is, after emptying it."""
+    if isinstance(store, AbstractVisitedStore):
+        store.clear()
+        return store
+    elif store == 'hash':
+        return HashVisitedStore()
+    elif store == 'digest':
+        return DigestVisitedStore(size or 1024)
+    elif store == 'bloom':
+        return BloomVisitedStore(size or 8192, errorrate)
+    elif store == 'lru':
+        return LRUVisitedStore(size or 100000)
+    else:
+        raise ValueError("Unknown visited store: " + str(store))
+
+
+class SearchStatistics(object):
+    """Statistics of a search, available as the stats attribute of a search during and after iteration. The counters are always kept. The fringe size after each round and the time spent in expanding, scoring and testing states are only recorded if the search was started with instrument=True, as measuring them costs time itself. Statistics can be accessed as attributes or as items, and str() returns a summary."""
+
+    def __init__(self, instrument=False):
+        self.instrument = instrument
+        self.rounds = 0 #number of rounds (iterations of the main loop; beams in beam searches)
+        self.expanded = 0 #number of states expanded
+        self.generated = 0 #number of successors produced by expanding states
+        self.pruned = 0 #number of states removed from or refused by the fringe
+        self.cutoff = 0 #number of successors not added because they exceed maxdepth
+        self.duplicates = 0 #number of states skipped because they were visited before
+        self.solutions = 0 #number of goal states found
+        self.maxfringe = 0 #maximum size of the fringe
+        self.fringesizes = [] #size of the fringe after each round (instrument=True only)
+        self.expandtime = 0.0 #seconds spent in expand() (instrument=True only)
+        self.scoretime = 0.0 #seconds spent in scoring states (instrument=True only)
+        self.testtime = 0.0 #seconds spent in test() (instrument=True only)
+        self.begintime = None
+        self.endtime = None
+
+    def __getitem__(self, key):
+        return getattr(self, key)
+
+    def elapsed(self):
+        """Returns the time in seconds the search has been running (or ran, if it has finished)"""
+        if self.begintime is None:
+            return 0.0
+        elif self.endtime is None:
+            return clock() - self.begintime
+        else:
+            return self.endtime - self.begintime
+
+    def timedscore(self, f):
+        """Wraps a score function in the way PriorityQueue uses them (f(x) returning either the score or a function returning the score), adding the time spent to scoretime"""
+        def score(x):
+            begin = clock()
+            value = f(x)
+            if callable(value):
+                value = value()
+            self.scoretime += clock() - begin
+            return value
+        score.timed = True
+        return score
+
+    def round(self, fringesize):
+        """Registers the end of a round, with the size of the fringe at that point"""
+        self.rounds += 1
+        if fringesize > self.maxfringe:
+            self.maxfringe = fringesize
+        if self.instrument:
+            self.fringesizes.append(fringesize)
+
+    def todict(self):
+        """Returns all statistics as a dictionary"""
+        d = dict( (key, value) for key, value in self.__dict__.items() if key not in ('begintime','endtime') )
+        d['elapsed'] = self.elapsed()
+        return d
+
+    def __str__(self):
+        s = str(self.expanded) + " states expanded in " + str(self.rounds) + " rounds, " + str(self.generated) + " generated, " + str(self.pruned) + " pruned, " + str(self.cutoff) + " cut off, " + str(self.duplicates) + " duplicates, " + str(self.solutions) + " solution(s), maximum fringe size " + str(self.maxfringe) + ", " + str(round(self.elapsed(),4)) + "s"
+        if self.instrument:
+            s += " (expand " + str(round(self.expandtime,4)) + "s, score " + str(round(self.scoretime,4)) + "s, test " + str(round(self.testtime,4)) + "s)"
+        return s
+
 
 class AbstractSearchState(object):
     def __init__(self,  parent = None, cost = 0):
@@ -103,7 +424,11 @@ class AbstractSearchState(object):
 
 class AbstractSearch(object): #not a real search, just a base class for DFS and BFS
     def __init__(self, **kwargs):
-        """For graph-searches graph=True is required (default), otherwise the search may loop forever. For tree-searches, set tree=True for better performance"""
+        """For graph-searches graph=True is required (default), otherwise the search may loop forever. For tree-searches, set tree=True for better performance.
+
+        How visited states are remembered in graph-searches is set with visited=, either an AbstractVisitedStore instance or the name of one (see visitedstore()): hash (default), digest, bloom or lru. The size of the latter two is set with visitedsize=, and the false positive rate of the Bloom filter with errorrate=. The memory used is reported by memoryusage().
+
+        Statistics of the search are kept in the stats attribute, a SearchStatistics instance. Set instrument=True to also record fringe sizes and timings, and callback= to a function that will be called with the statistics after every round."""
         self.usememory = True
         self.poll = lambda x: x.pop
         self.maxdepth = False #unlimited
@@ -114,6 +439,11 @@ class AbstractSearch(object): #not a real search, just a base class for DFS and
         self.traversed = 0 #Count of number of nodes visited
         self.solutions = 0 #Counts the number of solutions
         self.debug = 0
+        self.instrument = False
+        self.callback = None
+        visited = 'hash'
+        visitedsize = None
+        errorrate = 0.001
 
         for key, value in kwargs.items():
             if key == 'graph':
@@ -139,13 +469,25 @@ class AbstractSearch(object): #not a real search, just a base class for DFS and
                 self.exhaustive = True
             elif key == 'debug':
                 self.debug = value
-        self._visited = {}
+            elif key == 'visited':
+                visited = value
+            elif key == 'visitedsize':
+                visitedsize = value
+            elif key == 'errorrate':
+                errorrate = value
+            elif key == 'instrument':
+                self.instrument = value
+            elif key == 'callback':
+                self.callback = value
+        self._visited = visitedstore(visited, visitedsize, errorrate)
         self._traversal = []
         self.incomplete = False
         self.traversed = 0
+        self.stats = SearchStatistics(self.instrument)
 
     def reset(self):
-        self._visited = {}
+        self._visited.clear()
+        self.stats = SearchStatistics(self.instrument)
         self._traversal = []
         self.incomplete = False
         self.traversed = 0 #Count of all visited nodes
@@ -161,16 +503,26 @@ class AbstractSearch(object): #not a real search, just a base class for DFS and
     def traversalsize(self):
         """Returns the number of nodes visited  (also when keeptravel=False). Note that this is not equal to the path, but contains all states that were checked!"""
         return self.traversed
+
+    def memoryusage(self):
+        """Returns a dictionary with estimates of the memory (in bytes) used by the store of visited states (visited) and by the list of traversed states (traversal, only the list itself, not the states in it)"""
+        return {'visited': self._visited.memory(), 'traversal': sys.getsizeof(self._traversal)}
         
 
     def visited(self, state):
         if self.usememory:
-            return (hash(state) in self._visited)
+            return (state in self._visited)
         else:
             raise Exception("No memory kept, algorithm not started with graph=True!")
         
     def __iter__(self):
         """Generator yielding *all* valid goalstates it can find,"""
+        stats = self.stats
+        instrument = stats.instrument
+        if instrument and isinstance(self.fringe, PriorityQueue) and not hasattr(self.fringe.f, 'timed'):
+            self.fringe.f = stats.timedscore(self.fringe.f)
+        stats.begintime = clock()
+        stats.endtime = None
         n = 0
         while len(self.fringe) > 0:
             n += 1
@@ -191,22 +543,36 @@ class AbstractSearch(object): #not a real search, just a base class for DFS and
  
 
             #If node not visited before (or no memory kept):
-            if not self.usememory or (self.usememory and not hash(state) in self._visited):
+            if not self.usememory or (self.usememory and not state in self._visited):
                 
                 #Evaluate the current state
                 self.traversed += 1
-                if state.test(self.goalstates):
+                if instrument:
+                    begin = clock()
+                    isgoal = state.test(self.goalstates)
+                    stats.testtime += clock() - begin
+                else:
+                    isgoal = state.test(self.goalstates)
+                if isgoal:
                     if self.debug: print("\t[pynlpl debug] Valid goalstate, yielding",file=stderr)
+                    self.solutions += 1
+                    stats.solutions += 1
                     yield state
                 elif self.debug:
                     print("\t[pynlpl debug] (no goalstate, not yielding)",file=stderr)
                 
                 #Expand the specified state and add to the fringe
-
+                if instrument:
+                    begin = clock()
+                    successors = list(state.expand())
+                    stats.expandtime += clock() - begin
+                else:
+                    successors = state.expand()
+                stats.expanded += 1
                 
                 #if self.debug: print >>stderr,"\t[pynlpl debug] EXPANDING:"
                 statecount = 0
-                for i, s in enumerate(state.expand()):
+                for i, s in enumerate(successors):
                     statecount += 1
                     if self.debug >= 2:
                         print("\t[pynlpl debug] (Iteration #" + str(n) +") Expanded state #" + str(i+1) + ", adding to fringe: " + str(s),end="",file=stderr)
@@ -216,18 +582,27 @@ class AbstractSearch(object): #not a real search, just a base class for DFS and
                             print("ERROR SCORING!",file=stderr)
                             pass
                     if not self.maxdepth or s.depth() <= self.maxdepth:
-                        self.fringe.append(s)
+                        if self.fringe.append(s) is False: #refused by a priority queue
+                            stats.pruned += 1
                     else:
                         if self.debug: print("\t[pynlpl debug] (Iteration #" + str(n) +") Not adding to fringe, maxdepth exceeded",file=stderr)
+                        stats.cutoff += 1
                         self.incomplete = True
+                stats.generated += statecount
                 if self.debug:
                     print("\t[pynlpl debug] Expanded " + str(statecount) + " states, offered to fringe",file=stderr)
                 if self.keeptraversal: self._traversal.append(state)
-                if self.usememory: self._visited[hash(state)] = True
+                if self.usememory: self._visited.add(state)
+                l = len(self.fringe)
                 self.prune(state) #calls prune method
+                stats.pruned += l - len(self.fringe)
             else:
+                stats.duplicates += 1
                 if self.debug:
                     print("\t[pynlpl debug] State already visited before, not expanding again...(hash="+str(hash(state))+")",file=stderr)
+            stats.round(len(self.fringe))
+            if self.callback: self.callback(stats)
+        stats.endtime = clock()
         if self.debug:
             print("\t[pynlpl debug] Search complete: " + str(self.solutions) + " solution(s), " + str(self.traversed) + " states traversed in " + str(n) + " rounds",file=stderr)
     
@@ -298,32 +673,132 @@ class BreadthFirstSearch(AbstractSearch):
 
 
 class IterativeDeepening(AbstractSearch):
+    """Iterative deepening depth-first search: runs depth-first searches with a depth limit of 0, 1, 2, etc, until a search is no longer cut off by the limit or maxdepth is reached. Goal states are therefore found in order of their depth, each goal state is yielded only once.
+
+    Each iteration repeats the work of the previous ones. Set transpositions=n to keep a transposition table of at most n states (the least recently used ones are forgotten first), which caches for each state the result of testing and expanding it, as well as the smallest depth at which it was reached. Shallow levels are then not tested and expanded again on every iteration, and in graph-searches a state reached deeper than before is not explored again (its subtree is explored from the shallower occurrence). Successors taken from the table are shallow copies, attached to the state reached in the current iteration. The number of lookups that found a state in the table is reported in ``stats.transpositionhits``, the number that did not in ``stats.transpositionmisses``, the fraction of hits in ``stats.hitrate``, the number of states not explored because they were reached deeper before in ``stats.transpositioncutoffs``, and the number of iterations in ``stats.iterations``.
+    """
 
     def __init__(self, state, **kwargs):
         assert isinstance(state, AbstractSearchState)
+        super(IterativeDeepening,self).__init__(**kwargs)
         self.state = state
         self.kwargs = kwargs
-        self.traversed = 0
+        self.transpositions = kwargs['transpositions'] if 'transpositions' in kwargs else 0
+        self.reset()
+
+    def reset(self):
+        super(IterativeDeepening,self).reset()
+        self.table = OrderedDict() #state => [successors (or None if not expanded), goal test result, smallest depth]
+        self.stats.iterations = 0
+        self.stats.transpositionhits = 0
+        self.stats.transpositionmisses = 0
+        self.stats.transpositioncutoffs = 0
+        self.stats.hitrate = 0.0
 
     def __iter__(self):
-        self.traversed = 0
-        d = 0
-        while not 'maxdepth' in self.kwargs or d <= self.kwargs['maxdepth']:
-            dfs = DepthFirstSearch(self.state, **self.kwargs)
-            self.traversed += dfs.traversalsize()
-            for match in dfs:
-                yield match
-            if dfs.incomplete:
-                d +=1 
-            else:
-                break
+        stats = self.stats
+        instrument = stats.instrument
+        table = self.table
+        stats.begintime = clock()
+        stats.endtime = None
+        yielded = set() #hashes of the goal states yielded (graph-searches only)
+        limit = 0
+        while True:
+            stats.iterations += 1
+            if self.debug: print("\t[pynlpl debug] *************** ITERATION WITH DEPTH LIMIT " + str(limit) + " ****************",file=stderr)
+            self.incomplete = False
+            depths = {} #hash => smallest depth at which the state was explored in this iteration (graph-searches only)
+            fringe = [ (self.state, 0) ]
+            while fringe:
+                state, depth = fringe.pop()
+                entry = None
+                if self.transpositions:
+                    if state in table:
+                        entry = table.pop(state)
+                        table[state] = entry #mark as recently used
+                        stats.transpositionhits += 1
+                    else:
+                        stats.transpositionmisses += 1
+
+                if self.usememory:
+                    if entry is not None and depth > entry[2]:
+                        stats.transpositioncutoffs += 1
+                        continue
+                    h = hash(state)
+                    if h in depths and depths[h] <= depth:
+                        stats.duplicates += 1
+                        continue
+                    depths[h] = depth
 
-    def traversal(self):
-        #TODO: add
-        raise Exception("not implemented yet")
+                self.traversed += 1
+                if self.keeptraversal: self._traversal.append(state)
+                if entry is not None:
+                    isgoal = entry[1]
+                    if depth < entry[2]: entry[2] = depth
+                elif instrument:
+                    begin = clock()
+                    isgoal = state.test(self.goalstates)
+                    stats.testtime += clock() - begin
+                else:
+                    isgoal = state.test(self.goalstates)
+                if self.transpositions and entry is None:
+                    entry = table[state] = [None, isgoal, depth]
+                    if len(table) > self.transpositions:
+                        table.popitem(last=False)
+
+                if isgoal:
+                    if self.usememory:
+                        new = not hash(state) in yielded
+                        yielded.add(hash(state))
+                    else:
+                        new = (depth == limit)
+                    if new:
+                        if self.debug: print("\t[pynlpl debug] Valid goalstate at depth " + str(depth) + ", yielding",file=stderr)
+                        self.solutions += 1
+                        stats.solutions += 1
+                        yield state
 
-    def traversalsize(self):
-        return self.traversed
+                if depth >= limit:
+                    if entry is None or entry[0] is None or entry[0]:
+                        #there may be more beyond the depth limit
+                        self.incomplete = True
+                        stats.cutoff += 1
+                elif entry is not None and entry[0] is not None:
+                    #copies, so states yielded before keep their path
+                    successors = [ copy(s) for s in entry[0] ]
+                    for s in successors:
+                        s.parent = state
+                    fringe += [ (s, depth + 1) for s in successors ]
+                    stats.generated += len(successors)
+                else:
+                    if instrument:
+                        begin = clock()
+                        successors = list(state.expand())
+                        stats.expandtime += clock() - begin
+                    else:
+                        successors = list(state.expand())
+                    stats.expanded += 1
+                    if entry is not None:
+                        entry[0] = successors
+                    fringe += [ (s, depth + 1) for s in successors ]
+                    stats.generated += len(successors)
+                stats.round(len(fringe))
+                if self.callback: self.callback(stats)
+
+            lookups = stats.transpositionhits + stats.transpositionmisses
+            if lookups:
+                stats.hitrate = stats.transpositionhits / lookups
+            if not self.incomplete or (self.maxdepth and limit >= self.maxdepth):
+                break
+            limit += 1
+        stats.endtime = clock()
+        if self.debug:
+            print("\t[pynlpl debug] Search complete: " + str(self.solutions) + " solution(s), " + str(self.traversed) + " states traversed in " + str(stats.iterations) + " iterations",file=stderr)
+
+    def memoryusage(self):
+        """Returns a dictionary with estimates of the memory (in bytes) used by the transposition table (transpositions, the table and its entries, not the states in it) and the list of traversed states (traversal)"""
+        transpositions = sys.getsizeof(self.table) + sum( sys.getsizeof(entry) + sys.getsizeof(entry[0]) for entry in self.table.values() )
+        return {'transpositions': transpositions, 'traversal': sys.getsizeof(self._traversal)}
 
 
 class BestFirstSearch(AbstractSearch):
@@ -333,8 +808,144 @@ class BestFirstSearch(AbstractSearch):
         assert isinstance(state, AbstractSearchState)
         self.fringe = PriorityQueue([state], lambda x: x.score, self.minimize, length=0, blockworse=False, blockequal=False,duplicates=False)
 
+class AStarSearch(AbstractSearch):
+    """A* search, expanding states in order of f(s) = g(s) + weight * h(s), where g is the cost of the path to the state and h a heuristic estimate of the remaining cost to a goal. With an admissible heuristic (one that never overestimates) and weight 1, the first goal state yielded is one with a cheapest path. With a weight w > 1 (weighted A*), states closer to a goal are preferred and the first goal state yielded costs at most w times as much as the cheapest one.
+
+    Goal states are yielded in the order they are expanded, i.e. by increasing f. Besides the keyword arguments of AbstractSearch (of which graph/tree, minimize and poll do not apply), the following are supported:
+
+    * ``g`` - A function returning the path cost of a state. Default: the cost of the path is accumulated from the ``cost`` attribute of each state, by adding the cost of each successor to that of the state it was expanded from.
+    * ``h`` - A function returning the heuristic estimate of a state. Default: the state's ``score()`` method.
+    * ``weight`` - The weight of the heuristic (default: 1)
+    * ``key`` - A function returning the key that identifies a state in the open and closed lists. Default: the state itself, so states are compared with ``__eq__`` rather than only by their hash.
+    * ``reopen`` - Put a state that was already expanded back on the open list if a cheaper path to it is found (default: True). Only an inconsistent heuristic or a weight above 1 make this happen.
+
+    Besides the usual statistics, in which ``duplicates`` counts the successors discarded because a path at least as cheap was already known and ``cutoff`` the states not expanded because of maxdepth, ``stats`` holds the number of states ``reopened`` and the number of outdated open list entries skipped (``stale``).
+    """
+
+    def __init__(self, states, **kwargs):
+        if isinstance(states, AbstractSearchState):
+            states = [states]
+        else:
+            assert all( ( isinstance(x, AbstractSearchState) for x in states) )
+        super(AStarSearch,self).__init__(**kwargs)
+        self.g = kwargs['g'] if 'g' in kwargs else None
+        self.h = kwargs['h'] if 'h' in kwargs else lambda x: x.score()
+        self.weight = kwargs['weight'] if 'weight' in kwargs else 1
+        self.key = kwargs['key'] if 'key' in kwargs else lambda x: x
+        self.reopen = kwargs['reopen'] if 'reopen' in kwargs else True
+        self.states = states
+        self.reset()
+
+    def reset(self):
+        super(AStarSearch,self).reset()
+        self.stats.reopened = 0
+        self.stats.stale = 0
+        self.closed = {} #key => g of the state when it was expanded
+        self.bestcost = {} #key => cheapest g found so far (open or closed)
+        self.fringe = [] #open list: heap of (f, h, sequence number, g, depth, state) entries
+        self.sequence = 0
+        for state in self.states:
+            self._push(state, self.g(state) if self.g else state.pathcost(), 0)
+
+    def _push(self, state, g, depth):
+        """Adds a state to the open list unless a path to it that is at least as cheap is known, returns True if it was added"""
+        key = self.key(state)
+        if key in self.bestcost and g >= self.bestcost[key]:
+            self.stats.duplicates += 1
+            return False
+        if key in self.closed:
+            if not self.reopen:
+                self.stats.duplicates += 1
+                return False
+            del self.closed[key]
+            self.stats.reopened += 1
+        self.bestcost[key] = g
+        if self.stats.instrument:
+            begin = clock()
+            h = self.h(state)
+            self.stats.scoretime += clock() - begin
+        else:
+            h = self.h(state)
+        self.sequence += 1
+        #Entries made obsolete by a cheaper path are not removed here but skipped when popped (lazy decrease-key)
+        heapq.heappush(self.fringe, (g + self.weight * h, h, self.sequence, g, depth, state))
+        return True
+
+    def cost(self, state):
+        """Returns the cost of the cheapest path found to the given state, or None if the state was not reached"""
+        return self.bestcost.get(self.key(state))
+
+    def __iter__(self):
+        """Generator yielding all goal states it can find, by increasing f"""
+        stats = self.stats
+        instrument = stats.instrument
+        stats.begintime = clock()
+        stats.endtime = None
+        while self.fringe:
+            f, h, _, g, depth, state = heapq.heappop(self.fringe)
+            key = self.key(state)
+            if g > self.bestcost[key] or key in self.closed:
+                #outdated entry, a cheaper path to this state was pushed later
+                stats.stale += 1
+                continue
+            self.closed[key] = g
+            self.traversed += 1
+            if self.debug: print("\t[pynlpl debug] EXPANDING STATE (depth " + str(depth) + ", g=" + str(g) + ", h=" + str(h) + ", f=" + str(f) + "): " + str(state),file=stderr)
+            if self.keeptraversal: self._traversal.append(state)
+
+            if instrument:
+                begin = clock()
+                isgoal = state.test(self.goalstates)
+                stats.testtime += clock() - begin
+            else:
+                isgoal = state.test(self.goalstates)
+            if isgoal:
+                if self.debug: print("\t[pynlpl debug] Valid goalstate, yielding",file=stderr)
+                self.solutions += 1
+                stats.solutions += 1
+                yield state
+
+            if self.maxdepth and depth >= self.maxdepth:
+                self.incomplete = True
+                stats.cutoff += 1
+            else:
+                if instrument:
+                    begin = clock()
+                    successors = list(state.expand())
+                    stats.expandtime += clock() - begin
+                else:
+                    successors = state.expand()
+                stats.expanded += 1
+                for s in successors:
+                    stats.generated += 1
+                    self._push(s, self.g(s) if self.g else g + s.cost, depth + 1)
+            stats.round(len(self.fringe))
+            if self.callback: self.callback(stats)
+        stats.endtime = clock()
+
+        if self.debug:
+            print("\t[pynlpl debug] Search complete: " + str(self.solutions) + " solution(s), " + str(stats.expanded) + " states expanded, " + str(stats.reopened) + " reopened",file=stderr)
+
+    def visited(self, state):
+        return self.key(state) in self.closed
+
+    def searchbest(self):
+        """Returns the first goal state found, which has the cheapest path if the heuristic is admissible and the weight is 1"""
+        return self.searchfirst()
+
+
 class BeamSearch(AbstractSearch):
-    """Local beam search algorithm"""
+    """Local beam search algorithm
+
+    Besides the keyword arguments of AbstractSearch, the following are supported:
+
+    * ``eager`` - Only offer successors that score equal or better than the state they were expanded from (default: False)
+    * ``duplicates`` - Allow duplicate states in the beam (default: False)
+    * ``scorer`` - A function that takes a list of states and returns a list of their scores, used to score all successors of a round in one batch (e.g. a vectorised or language model batch call) instead of calling ``score()`` on each one
+    * ``executor`` - An object with a ``map(function, iterable)`` method, such as a ``concurrent.futures.ThreadPoolExecutor``, ``concurrent.futures.ProcessPoolExecutor`` or ``multiprocessing.Pool``, used to expand all states of the beam concurrently. The states are handed to the executor as shallow copies detached from their parent, so a process pool only has to pickle the states themselves rather than their entire path; ``expand()`` should therefore not rely on ``parent``. The successors are attached to the original states again afterwards. The executor is not shut down by the search.
+
+    If a scorer or an executor is given, each round first tests all states of the beam, then expands them all, then scores all successors, and finally offers them to the successor pool in the order they would have been offered by the serial search (beam order, then expansion order). The results are therefore identical to those of the serial search, provided the scorer returns the same scores as ``score()``. Note that the ``prune()`` method is then called after the whole beam has been taken from the fringe.
+    """
 
     def __init__(self, states, beamsize, **kwargs):
         if isinstance(states, AbstractSearchState):
@@ -346,6 +957,8 @@ class BeamSearch(AbstractSearch):
             self.eager = kwargs['eager']
         else:
             self.eager = False
+        self.scorer = kwargs['scorer'] if 'scorer' in kwargs else None
+        self.executor = kwargs['executor'] if 'executor' in kwargs else None
         super(BeamSearch,self).__init__(**kwargs)
         self.incomplete = True
         self.duplicates = kwargs['duplicates'] if 'duplicates' in kwargs else False
@@ -353,6 +966,19 @@ class BeamSearch(AbstractSearch):
 
     def __iter__(self):
         """Generator yielding *all* valid goalstates it can find"""
+        if self.scorer is not None or self.executor is not None:
+            for state in self._iterbatched():
+                yield state
+            return
+
+        stats = self.stats
+        instrument = stats.instrument
+        if instrument:
+            score = stats.timedscore(lambda x: x.score)
+        else:
+            score = lambda x: x.score()
+        stats.begintime = clock()
+        stats.endtime = None
         i = 0
         while len(self.fringe) > 0:
             i +=1 
@@ -360,7 +986,8 @@ class BeamSearch(AbstractSearch):
             
             b = 0
             #Create a new empty fixed-length priority queue (this implies there will be pruning if more items are offered than it can hold!)
-            successors = PriorityQueue([], lambda x: x.score, self.minimize, length=self.beamsize, blockworse=False, blockequal=False,duplicates= self.duplicates)
+            successors = PriorityQueue([], score, self.minimize, length=self.beamsize, blockworse=False, blockequal=False,duplicates= self.duplicates)
+            roundoffers = 0
             
             while len(self.fringe) > 0:
                 b += 1
@@ -380,24 +1007,38 @@ class BeamSearch(AbstractSearch):
                         pass
 
 
-                if not self.usememory or (self.usememory and not hash(state) in self._visited):
+                if not self.usememory or (self.usememory and not state in self._visited):
                     
                     self.traversed += 1
                     #Evaluate state
-                    if state.test(self.goalstates):
+                    if instrument:
+                        begin = clock()
+                        isgoal = state.test(self.goalstates)
+                        stats.testtime += clock() - begin
+                    else:
+                        isgoal = state.test(self.goalstates)
+                    if isgoal:
                         if self.debug: print("\t[pynlpl debug] Valid goalstate, yielding",file=stderr)
                         self.solutions += 1 #counts the number of solutions
+                        stats.solutions += 1
                         yield state
                     elif self.debug:
                         print("\t[pynlpl debug] (no goalstate, not yielding)",file=stderr)
 
                     if self.eager:
-                        score = state.score()                    
+                        parentscore = score(state)
 
                     #Expand the specified state and offer to the fringe
+                    if instrument:
+                        begin = clock()
+                        expanded = list(state.expand())
+                        stats.expandtime += clock() - begin
+                    else:
+                        expanded = state.expand()
+                    stats.expanded += 1
                     
                     statecount = offers = 0
-                    for j, s in enumerate(state.expand()):
+                    for j, s in enumerate(expanded):
                         statecount += 1
                         if self.debug >= 2:
                             print("\t[pynlpl debug] (Round #" + str(i) +" Beam #" + str(b) + ") Expanded state #" + str(j+1) + ", offering to successor pool: " + str(s),end="",file=stderr)
@@ -413,9 +1054,10 @@ class BeamSearch(AbstractSearch):
                                 accepted = successors.append(s)
                             else:
                                 #use only equal or better successors
-                                if s.score() >= score:
+                                successorscore = score(s)
+                                if successorscore >= parentscore:
                                     offers += 1
-                                    accepted = successors.append(s)
+                                    accepted = successors.append(s, successorscore)
                                 else:
                                     accepted = False
                             if self.debug >= 2:
@@ -424,17 +1066,23 @@ class BeamSearch(AbstractSearch):
                                 else:
                                     print(" REJECTED",file=stderr)
                         else:                            
+                            stats.cutoff += 1
                             if self.debug >= 2:
                                 print(" REJECTED, MAXDEPTH EXCEEDED.",file=stderr)
                             elif self.debug:
                                 print("\t[pynlpl debug] Not offered to successor pool, maxdepth exceeded",file=stderr)
+                    stats.generated += statecount
+                    roundoffers += offers
                     if self.debug:
                         print("\t[pynlpl debug] Expanded " + str(statecount) + " states, " + str(offers) + " offered to successor pool",file=stderr)
                     if self.keeptraversal: self._traversal.append(state)
-                    if self.usememory: self._visited[hash(state)] = True
+                    if self.usememory: self._visited.add(state)
+                    l = len(self.fringe)
                     self.prune(state) #calls prune method (does nothing by default in this search!!!)
+                    stats.pruned += l - len(self.fringe)
 
                 else:
+                    stats.duplicates += 1
                     if self.debug:
                         print("\t[pynlpl debug] State already visited before, not expanding again... (hash=" + str(hash(state))  +")",file=stderr)
             #AFTER EXPANDING ALL NODES IN THE FRINGE/BEAM:
@@ -446,13 +1094,113 @@ class BeamSearch(AbstractSearch):
             if self.debug: 
                 print("\t[pynlpl debug] (Round #" + str(i) + ") Implicitly pruned with beamsize " + str(self.beamsize) + "...",file=stderr)
             #self.fringe.prune(self.beamsize)
-            if self.debug: print(" (" + str(offers) + " to " + str(len(self.fringe)) + " items)",file=stderr)
+            if self.debug: print(" (" + str(roundoffers) + " to " + str(len(self.fringe)) + " items)",file=stderr)
+            stats.pruned += roundoffers - len(self.fringe)
+            stats.round(len(self.fringe))
+            if self.callback: self.callback(stats)
+        stats.endtime = clock()
         
         if self.debug:
             print("\t[pynlpl debug] Search complete: " + str(self.solutions) + " solution(s), " + str(self.traversed) + " states traversed in " + str(i) + " rounds with " + str(b) + "  beams",file=stderr)            
-        
-        
-        
+
+    def score(self, states):
+        """Returns the scores of the given list of states, using the batch scorer if one was provided"""
+        if self.stats.instrument: begin = clock()
+        if self.scorer is not None:
+            scores = list(self.scorer(states))
+            if len(scores) != len(states):
+                raise ValueError("Scorer returned " + str(len(scores)) + " scores for " + str(len(states)) + " states")
+        else:
+            scores = [ state.score() for state in states ]
+        if self.stats.instrument: self.stats.scoretime += clock() - begin
+        return scores
+
+    def _iterbatched(self):
+        """Generator yielding *all* valid goalstates it can find, expanding and scoring each round's beam in batch (see the class documentation)"""
+        stats = self.stats
+        instrument = stats.instrument
+        stats.begintime = clock()
+        stats.endtime = None
+        i = 0
+        while len(self.fringe) > 0:
+            i += 1
+            if self.debug: print("\t[pynlpl debug] *************** STARTING ROUND #" + str(i) + " ****************",file=stderr)
+
+            successors = PriorityQueue([], lambda x: x.score, self.minimize, length=self.beamsize, blockworse=False, blockequal=False,duplicates= self.duplicates)
+
+            #Take the entire beam from the fringe and evaluate its states
+            beam = []
+            while len(self.fringe) > 0:
+                state = self.poll(self.fringe)()
+                if not self.usememory or not state in self._visited:
+                    self.traversed += 1
+                    if instrument:
+                        begin = clock()
+                        isgoal = state.test(self.goalstates)
+                        stats.testtime += clock() - begin
+                    else:
+                        isgoal = state.test(self.goalstates)
+                    if isgoal:
+                        if self.debug: print("\t[pynlpl debug] Valid goalstate, yielding: " + str(state),file=stderr)
+                        self.solutions += 1 #counts the number of solutions
+                        stats.solutions += 1
+                        yield state
+                    if self.keeptraversal: self._traversal.append(state)
+                    if self.usememory: self._visited.add(state)
+                    beam.append(state)
+                else:
+                    stats.duplicates += 1
+                    if self.debug: print("\t[pynlpl debug] State already visited before, not expanding again... (hash=" + str(hash(state))  +")",file=stderr)
+
+            #Expand all states in the beam, concurrently if an executor is available (map preserves the order of the beam)
+            if instrument: begin = clock()
+            if self.executor is not None:
+                expansions = list(self.executor.map(_expanddetached, [ _detach(state) for state in beam ]))
+                for state, expanded in zip(beam, expansions):
+                    for s in expanded:
+                        if s.parent is None:
+                            s.parent = state
+            else:
+                expansions = [ _expand(state) for state in beam ]
+            if instrument: stats.expandtime += clock() - begin
+            stats.expanded += len(beam)
+
+            #Score all successors in one batch
+            candidates = []
+            origins = []
+            for b, expanded in enumerate(expansions):
+                stats.generated += len(expanded)
+                for s in expanded:
+                    if not self.maxdepth or s.depth() <= self.maxdepth:
+                        candidates.append(s)
+                        origins.append(b)
+                    else:
+                        stats.cutoff += 1
+            scores = self.score(candidates) if candidates else []
+            if self.eager and beam:
+                beamscores = self.score(beam)
+
+            #Offer the successors to the fixed-length successor pool, in beam order and then expansion order
+            offers = 0
+            for s, score, b in zip(candidates, scores, origins):
+                if not self.eager or score >= beamscores[b]:
+                    offers += 1
+                    successors.append(s, score)
+            stats.pruned += offers - len(successors)
+            for state in beam:
+                self.prune(state)
+            if self.debug: print("\t[pynlpl debug] (Round #" + str(i) + ") Expanded " + str(len(beam)) + " states into " + str(len(candidates)) + " successors, " + str(offers) + " offered to successor pool of size " + str(self.beamsize) + " (" + str(len(successors)) + " items)",file=stderr)
+
+            #set fringe for next round
+            self.fringe = successors
+            stats.round(len(self.fringe))
+            if self.callback: self.callback(stats)
+        stats.endtime = clock()
+
+        if self.debug:
+            print("\t[pynlpl debug] Search complete: " + str(self.solutions) + " solution(s), " + str(self.traversed) + " states traversed in " + str(i) + " rounds",file=stderr)
+
+
 
 class EarlyEagerBeamSearch(AbstractSearch):
     """A beam search that prunes early (after each state expansion) and eagerly (weeding out worse successors)"""
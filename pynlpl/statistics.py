@@ -31,11 +31,35 @@ else:
     stderr = sys.stderr
     stdout = sys.stdout
 import io
+import os
+import json
+import heapq
+import struct
+import hashlib
+import shutil
+import sqlite3
+import tempfile
+import multiprocessing
 
 import math
 import random
 import operator
+import itertools
+import pickle
+from array import array
 from collections import Counter
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+def _array64(typecode):
+    """Returns an empty array of 64-bit integers ('q' signed, 'Q' unsigned). Python 2 has no such typecodes, 'l'/'L' is used there if it is wide enough, and a list otherwise."""
+    if sys.version < '3':
+        if array(str('l')).itemsize < 8:
+            return []
+        typecode = 'l' if typecode == 'q' else 'L'
+    return array(str(typecode))
 
 
 
@@ -173,12 +197,22 @@ class FrequencyList(object):
         """Multiple frequency lists can be added together"""
         assert isinstance(otherfreqlist,FrequencyList)
         product = FrequencyList(None,)
-        for type, count in self.items():
-            product.count(type,count)
-        for type, count in otherfreqlist.items():
-            product.count(type,count)
+        product.update(self)
+        product.update(otherfreqlist)
         return product
 
+    def update(self, other):
+        """Merge the counts of another frequency list (or an iterable of (type, count) pairs) into this one, in place"""
+        if other.__class__ is FrequencyList and (not self.dovalidation or self.casesensitive or (other.dovalidation and not other.casesensitive)):
+            #types are already valid for this list, merge the counters directly
+            if self._ranked: self._ranked = None
+            self._count.update(other._count)
+            self.total += other.total
+        else:
+            if isinstance(other, FrequencyList): other = other.items()
+            for type, count in other:
+                self.count(type,count)
+
     def output(self,delimiter = '\t', addnormalised=False):
         """Print a representation of the frequency list"""
         for type, count in self:
@@ -214,6 +248,965 @@ class FrequencyList(object):
         return self._count
 
 
+class Vocabulary(object):
+    """A vocabulary maps strings to integers (0 and up, in order of addition) and back. A vocabulary can be shared by multiple :class:`InternedFrequencyList` instances."""
+
+    def __init__(self, words = None):
+        self.ids = {} #word -> id
+        self.words = [] #id -> word
+        if words:
+            for word in words:
+                self.encode(word)
+
+    def encode(self, word, add=True):
+        """Returns the integer for the specified word. If the word is not in the vocabulary yet it will be added, unless add is False, in which case None is returned"""
+        try:
+            return self.ids[word]
+        except KeyError:
+            if not add:
+                return None
+            id = self.ids[word] = len(self.words)
+            self.words.append(word)
+            return id
+
+    def decode(self, id):
+        """Returns the word for the specified integer"""
+        return self.words[id]
+
+    def __len__(self):
+        return len(self.words)
+
+    def __contains__(self, word):
+        return word in self.ids
+
+    def __iter__(self):
+        return iter(self.words)
+
+    def save(self, filename):
+        """Save the vocabulary to file, one word per line in order"""
+        f = io.open(filename,'w',encoding='utf-8')
+        for word in self.words:
+            f.write(word + '\n')
+        f.close()
+
+    def load(self, filename):
+        """Load a vocabulary from file (in the format produced by the save method), words are added to the vocabulary in order"""
+        f = io.open(filename,'r',encoding='utf-8')
+        for line in f:
+            self.encode(line.rstrip('\n'))
+        f.close()
+
+
+class InternedFrequencyList(FrequencyList):
+    """A compact frequency list for very large numbers of types, with the same interface as :class:`FrequencyList`.
+
+    Words are mapped to integers by a (possibly shared) :class:`Vocabulary` and every type is packed into a single 64-bit integer key: the lowest bit marks n-grams (tuples), followed by the vocabulary ids (plus one) of the words in fixed-width fields of the specified number of bits. So with the default of 21 bits, the vocabulary can hold two million words and n-grams can be up to three words long. Keys and counts are stored in sorted NumPy arrays, counts are first collected in a buffer that is merged into the arrays when it is full or when the counts are needed.
+
+    Pre-encoded keys (see :meth:`encode` and :meth:`ngramkeys`) can be counted in bulk using :meth:`count_many`.
+
+    Arguments:
+        tokens (iterable): Tokens to count
+        casesensitive (bool): Case sensitive counting (default: True)
+        dovalidation (bool): Convert lists to tuples and apply case normalisation (default: True)
+        vocabulary (Vocabulary): The vocabulary to use, a new one will be created if not specified
+        bits (int): The width in bits of every word in an n-gram key
+        buffersize (int): The number of counts to buffer before merging
+    """
+
+    def __init__(self, tokens = None, casesensitive = True, dovalidation = True, vocabulary = None, bits = 21, buffersize = 1048576):
+        if np is None:
+            raise ImportError("No numpy installed")
+        if vocabulary is None:
+            vocabulary = Vocabulary()
+        self.vocabulary = vocabulary
+        self.bits = bits
+        self.maxn = 63 // bits #maximum n-gram length
+        self.buffersize = buffersize
+        self.keys = np.zeros(0, dtype=np.uint64) #sorted
+        self.counts = np.zeros(0, dtype=np.int64)
+        self._bufferkeys = _array64('Q') #keys counted once
+        self._bufferarrays = [] #(keys, counts) pairs
+        self._buffered = 0 #number of buffered keys
+        self._ranked = None #indices of keys/counts, from frequent to rare
+        self.total = 0 #number of tokens
+        self.casesensitive = casesensitive
+        self.dovalidation = dovalidation
+        if tokens: self.append(tokens)
+
+    def _addword(self, word):
+        id = self.vocabulary.encode(word)
+        if id + 1 >= 1 << self.bits:
+            raise ValueError("Vocabulary too large for the key width (" + str(self.bits) + " bits)")
+        return id
+
+    def encode(self, type, add=True):
+        """Encodes a type (a word or an n-gram tuple) to an integer key. Unknown words are added to the vocabulary, unless add is False, in which case None is returned"""
+        if self.dovalidation: type = self._validate(type)
+        ids = self.vocabulary.ids
+        if isinstance(type, tuple):
+            if len(type) > self.maxn:
+                raise ValueError("N-gram too long for the key width, at most " + str(self.maxn) + " words can be packed")
+            key = 1
+            shift = 1
+            for word in type:
+                id = ids.get(word)
+                if id is None:
+                    if not add: return None
+                    id = self._addword(word)
+                key |= (id + 1) << shift
+                shift += self.bits
+            return key
+        else:
+            id = ids.get(type)
+            if id is None:
+                if not add: return None
+                id = self._addword(type)
+            return (id + 1) << 1
+
+    def decode(self, key):
+        """Decodes an integer key to a type (a word or an n-gram tuple)"""
+        key = int(key)
+        mask = (1 << self.bits) - 1
+        if key & 1:
+            ngram = []
+            key >>= 1
+            while key:
+                ngram.append(self.vocabulary.words[(key & mask) - 1])
+                key >>= self.bits
+            return tuple(ngram)
+        else:
+            return self.vocabulary.words[(key >> 1) - 1]
+
+    def ngramkeys(self, ids, n):
+        """Returns an array with the keys of all n-grams in a sequence of vocabulary ids, for use with :meth:`count_many`. For n = 0, the keys of the words themselves are returned."""
+        ids = np.asarray(ids, dtype=np.uint64) + np.uint64(1)
+        if n == 0:
+            return ids << np.uint64(1)
+        if n > self.maxn:
+            raise ValueError("N-gram too long for the key width, at most " + str(self.maxn) + " words can be packed")
+        if len(ids) and int(ids.max()) >= 1 << self.bits:
+            raise ValueError("Vocabulary too large for the key width (" + str(self.bits) + " bits)")
+        l = len(ids) - n + 1
+        if l <= 0:
+            return np.zeros(0, dtype=np.uint64)
+        keys = np.ones(l, dtype=np.uint64)
+        for i in range(n):
+            keys |= ids[i:i+l] << np.uint64(1 + self.bits * i)
+        return keys
+
+    def append(self,tokens):
+        """Add a list of tokens to the frequencylist. This method will count them for you."""
+        encode = self.encode
+        bufferkeys = self._bufferkeys
+        for token in tokens:
+            bufferkeys.append(encode(token))
+            self.total += 1
+            if len(bufferkeys) >= self.buffersize:
+                self.flush()
+                bufferkeys = self._bufferkeys
+
+    def count(self, type, amount = 1):
+        """Count a certain type. The counter will increase by the amount specified (defaults to one)"""
+        amount = int(amount)
+        if amount == 1:
+            self._bufferkeys.append(self.encode(type))
+            self.total += 1
+            if len(self._bufferkeys) >= self.buffersize:
+                self.flush()
+        else:
+            self.count_many(np.array([self.encode(type)], dtype=np.uint64), np.array([amount], dtype=np.int64))
+
+    def count_many(self, keys, amounts = None):
+        """Count many pre-encoded keys (an array of integers, see :meth:`encode` and :meth:`ngramkeys`) at once. Amounts is an array of the same length, all amounts are one if not specified"""
+        keys = np.asarray(keys, dtype=np.uint64)
+        if amounts is None:
+            amounts = np.ones(len(keys), dtype=np.int64)
+        else:
+            amounts = np.asarray(amounts, dtype=np.int64)
+            if len(amounts) != len(keys):
+                raise ValueError("Keys and amounts must be of the same length")
+        self._bufferarrays.append((keys, amounts))
+        self._buffered += len(keys)
+        self.total += int(amounts.sum())
+        if self._buffered + len(self._bufferkeys) >= self.buffersize:
+            self.flush()
+
+    def flush(self):
+        """Merge all buffered counts into the sorted arrays. This is done automatically when needed."""
+        if not self._bufferkeys and not self._bufferarrays:
+            return
+        keys = [self.keys, np.array(self._bufferkeys, dtype=np.uint64)] + [ k for k, _ in self._bufferarrays ]
+        counts = [self.counts, np.ones(len(self._bufferkeys), dtype=np.int64)] + [ c for _, c in self._bufferarrays ]
+        keys = np.concatenate(keys)
+        counts = np.concatenate(counts)
+        order = np.argsort(keys, kind='mergesort')
+        keys = keys[order]
+        counts = counts[order]
+        if len(keys):
+            starts = np.concatenate(([0], np.flatnonzero(keys[1:] != keys[:-1]) + 1))
+            self.keys = keys[starts]
+            self.counts = np.add.reduceat(counts, starts)
+        self._bufferkeys = _array64('Q')
+        self._bufferarrays = []
+        self._buffered = 0
+        self._ranked = None
+
+    def _index(self, type):
+        """Returns the index of the type in the arrays, or None if it was not counted"""
+        self.flush()
+        key = self.encode(type, False)
+        if key is None:
+            return None
+        i = np.searchsorted(self.keys, np.uint64(key))
+        if i < len(self.keys) and self.keys[i] == key:
+            return i
+        return None
+
+    def _rank(self):
+        self.flush()
+        if self._ranked is None:
+            self._ranked = np.argsort(-self.counts, kind='mergesort')
+
+    def __iter__(self):
+        """Iterate over the frequency lists, in order (frequent to rare). This is a generator that yields (type, count) pairs."""
+        self._rank()
+        for i in self._ranked:
+            yield self.decode(self.keys[i]), int(self.counts[i])
+
+    def items(self):
+        """Returns an *unranked* list of (type, count) pairs. Use this only if you are not interested in the order."""
+        self.flush()
+        for key, count in zip(self.keys, self.counts):
+            yield self.decode(key), int(count)
+
+    def __getitem__(self, type):
+        i = self._index(type)
+        if i is None:
+            return 0
+        return int(self.counts[i])
+
+    def __setitem__(self, type, value):
+        """alias for count, but can only be called once"""
+        if type in self:
+            raise ValueError("This type is already set!")
+        self.count(type,value)
+
+    def __delitem__(self, type):
+        i = self._index(type)
+        if i is None:
+            raise KeyError(type)
+        self.total -= int(self.counts[i])
+        self.keys = np.delete(self.keys, i)
+        self.counts = np.delete(self.counts, i)
+        self._ranked = None
+
+    def __contains__(self, type):
+        """Checks if the specified type is in the frequency list"""
+        return self._index(type) is not None
+
+    def __len__(self):
+        """Returns the total amount of types"""
+        self.flush()
+        return len(self.keys)
+
+    def typetokenratio(self):
+        """Computes the type/token ratio"""
+        return len(self) / float(self.total)
+
+    def mode(self):
+        """Returns the type that occurs the most frequently in the frequency list"""
+        self.flush()
+        return self.decode(self.keys[np.argmax(self.counts)])
+
+    def p(self, type):
+        """Returns the probability (relative frequency) of the token"""
+        return self[type] / float(self.total)
+
+    def __eq__(self, otherfreqlist):
+        if isinstance(otherfreqlist, InternedFrequencyList) and otherfreqlist.vocabulary is self.vocabulary and otherfreqlist.bits == self.bits:
+            self.flush()
+            otherfreqlist.flush()
+            return self.total == otherfreqlist.total and np.array_equal(self.keys, otherfreqlist.keys) and np.array_equal(self.counts, otherfreqlist.counts)
+        return self.total == otherfreqlist.total and dict(self.items()) == dict(otherfreqlist.items())
+
+    def __add__(self, otherfreqlist):
+        """Multiple frequency lists can be added together, the result shares the vocabulary of this list"""
+        assert isinstance(otherfreqlist,FrequencyList)
+        product = InternedFrequencyList(None, self.casesensitive, self.dovalidation, self.vocabulary, self.bits, self.buffersize)
+        product.update(self)
+        product.update(otherfreqlist)
+        product.flush()
+        return product
+
+    def update(self, other):
+        """Merge the counts of another frequency list (or an iterable of (type, count) pairs) into this one, in place. Lists sharing the vocabulary are merged without decoding."""
+        if isinstance(other, InternedFrequencyList) and other.vocabulary is self.vocabulary and other.bits == self.bits and (self.casesensitive or not other.casesensitive):
+            other.flush()
+            self.count_many(other.keys, other.counts)
+        else:
+            if isinstance(other, FrequencyList): other = other.items()
+            for type, count in other:
+                self.count(type,count)
+
+    def __repr__(self):
+        return "<InternedFrequencyList: " + str(len(self)) + " types, " + str(self.total) + " tokens>"
+
+    def values(self):
+        self.flush()
+        return self.counts
+
+    def dict(self):
+        return dict(self.items())
+
+
+class CountMinSketch(object):
+    """A Count-Min Sketch: approximate counts for a stream of strings in fixed memory. Estimates never undercount and overcount by at most epsilon times the total count with probability 1 - delta.
+
+    The hash functions are derived from the MD5 digest of the string (double hashing), so sketches with the same parameters built in different processes can be merged.
+
+    Arguments:
+        epsilon (float): The error factor, determines the width of the table
+        delta (float): The probability of exceeding the error, determines the depth of the table
+    """
+
+    def __init__(self, epsilon=0.0001, delta=0.01):
+        if np is None:
+            raise ImportError("No numpy installed")
+        self.epsilon = epsilon
+        self.delta = delta
+        self.width = int(math.ceil(math.e / epsilon))
+        self.depth = int(math.ceil(math.log(1.0 / delta)))
+        self.table = np.zeros((self.depth, self.width), dtype=np.int64)
+        self.rows = np.arange(self.depth)
+        self.total = 0
+
+    def columns(self, key):
+        """Returns the column in every row of the table for the specified key (a string)"""
+        h1, h2 = struct.unpack(b'<QQ', hashlib.md5(key.encode('utf-8')).digest())
+        return [ (h1 + i * h2) % self.width for i in range(self.depth) ]
+
+    def add(self, key, amount=1):
+        """Count the key (a string)"""
+        self.table[self.rows, self.columns(key)] += amount
+        self.total += amount
+
+    def addmany(self, keys, amounts=None):
+        """Count many keys at once, amounts is a list of the same length, all amounts are one if not specified"""
+        indices = _array64('q')
+        for key in keys:
+            h1, h2 = struct.unpack(b'<QQ', hashlib.md5(key.encode('utf-8')).digest())
+            indices.extend([ row * self.width + (h1 + row * h2) % self.width for row in range(self.depth) ])
+        if amounts is None:
+            np.add.at(self.table.reshape(-1), np.asarray(indices, dtype=np.int64), 1)
+            self.total += len(indices) // self.depth
+        else:
+            amounts = np.asarray(amounts, dtype=np.int64)
+            np.add.at(self.table.reshape(-1), np.asarray(indices, dtype=np.int64), np.repeat(amounts, self.depth))
+            self.total += int(amounts.sum())
+
+    def __getitem__(self, key):
+        """Returns the estimated count for the key"""
+        return int(self.table[self.rows, self.columns(key)].min())
+
+    def compatible(self, other):
+        return self.width == other.width and self.depth == other.depth
+
+    def update(self, other):
+        """Merge another sketch with the same parameters into this one, in place"""
+        if not self.compatible(other):
+            raise ValueError("Can't merge sketches with different dimensions")
+        self.table += other.table
+        self.total += other.total
+
+
+class SpaceSaving(object):
+    """The Space-Saving algorithm for finding the top-k most frequent items in a stream, using k counters. Every count is an overestimate by at most the associated error, and any item with a true count above total/k is guaranteed to be tracked.
+
+    Arguments:
+        k (int): The number of items to track
+    """
+
+    def __init__(self, k=1000):
+        self.k = k
+        self.counts = {} #item -> count
+        self.errors = {} #item -> maximum overestimation
+        self.heap = [] #(count, seq, item) entries, stale entries are skipped lazily
+        self.seq = itertools.count() #tie-breaker, items of different types can't be compared
+
+    def add(self, item, amount=1):
+        """Count the item"""
+        if item in self.counts:
+            count = self.counts[item] = self.counts[item] + amount
+        elif len(self.counts) < self.k:
+            count = self.counts[item] = amount
+            self.errors[item] = 0
+        else:
+            minimum, evicted = self._popmin()
+            del self.counts[evicted]
+            del self.errors[evicted]
+            count = self.counts[item] = minimum + amount
+            self.errors[item] = minimum
+        heapq.heappush(self.heap, (count, next(self.seq), item))
+        if len(self.heap) > 4 * self.k + 16:
+            self._rebuild()
+
+    def _popmin(self):
+        while True:
+            count, _, item = heapq.heappop(self.heap)
+            if self.counts.get(item) == count:
+                return count, item
+
+    def _rebuild(self):
+        self.heap = [ (count, next(self.seq), item) for item, count in self.counts.items() ]
+        heapq.heapify(self.heap)
+
+    def minimum(self):
+        """Returns the smallest tracked count if all counters are in use, zero otherwise (i.e. an upper bound for the count of untracked items)"""
+        if len(self.counts) < self.k:
+            return 0
+        return min(self.counts.values())
+
+    def update(self, other):
+        """Merge another summary into this one, in place. Untracked items are assumed to have the minimum count of the summary they are missing from."""
+        minimum, otherminimum = self.minimum(), other.minimum()
+        counts = {}
+        errors = {}
+        for item in set(self.counts) | set(other.counts):
+            counts[item] = self.counts.get(item, minimum) + other.counts.get(item, otherminimum)
+            errors[item] = self.errors.get(item, minimum) + other.errors.get(item, otherminimum)
+        top = heapq.nlargest(self.k, counts.items(), key=lambda x: x[1])
+        self.counts = dict(top)
+        self.errors = dict( (item, errors[item]) for item, _ in top )
+        self._rebuild()
+
+    def __contains__(self, item):
+        return item in self.counts
+
+    def __len__(self):
+        return len(self.counts)
+
+    def __iter__(self):
+        """Iterate over (item, count) pairs, from frequent to rare"""
+        for item, count in sorted(self.counts.items(), key=lambda x: -x[1]):
+            yield item, count
+
+
+class ApproximateFrequencyList(FrequencyList):
+    """An approximate frequency list for streams too large to count exactly, such as web-scale n-gram counts. It combines a :class:`CountMinSketch`, for the approximate frequency of any type, with :class:`SpaceSaving`, to keep track of the top-k most frequent types.
+
+    Lookups return the smallest of both estimates, which never undercounts. Iteration only yields the top-k types, so ``len()`` is at most k, and a :class:`Distribution` created from this list covers only these types (giving an approximate entropy). Lists with the same parameters can be merged, also when created in different processes, and saved to and loaded from disk.
+
+    Arguments:
+        tokens (iterable): Tokens to count
+        casesensitive (bool): Case sensitive counting (default: True)
+        dovalidation (bool): Convert lists to tuples and apply case normalisation (default: True)
+        epsilon (float): Error factor of the sketch, counts are overestimated by at most epsilon times the total...
+        delta (float): ...with probability 1 - delta
+        k (int): The number of most frequent types to track
+    """
+
+    def __init__(self, tokens = None, casesensitive = True, dovalidation = True, epsilon = 0.0001, delta = 0.01, k = 1000):
+        self.sketch = CountMinSketch(epsilon, delta)
+        self.topk = SpaceSaving(k)
+        self.total = 0 #number of tokens
+        self.casesensitive = casesensitive
+        self.dovalidation = dovalidation
+        if tokens: self.append(tokens)
+
+    @staticmethod
+    def _key(type):
+        """Returns the string that represents the type in the sketch. Strings are used as is, all other types (such as n-grams) are JSON encoded behind a NUL character, as are the (rare) strings starting with one, so no two types share a key."""
+        if isstring(type) and not type.startswith("\x00"):
+            return type
+        return "\x00" + json.dumps(type)
+
+    def append(self, tokens, batchsize=10000):
+        """Add a list of tokens to the frequencylist. This method will count them for you. The sketch is updated in batches of the specified size."""
+        batch = []
+        for token in tokens:
+            if self.dovalidation: token = self._validate(token)
+            self.topk.add(token)
+            batch.append(self._key(token))
+            if len(batch) >= batchsize:
+                self.sketch.addmany(batch)
+                self.total += len(batch)
+                batch = []
+        if batch:
+            self.sketch.addmany(batch)
+            self.total += len(batch)
+
+    def count(self, type, amount = 1):
+        """Count a certain type. The counter will increase by the amount specified (defaults to one)"""
+        if self.dovalidation: type = self._validate(type)
+        amount = int(amount)
+        self.sketch.add(self._key(type), amount)
+        self.topk.add(type, amount)
+        self.total += amount
+
+    def __getitem__(self, type):
+        """Returns the estimated count for the type"""
+        if self.dovalidation: type = self._validate(type)
+        estimate = self.sketch[self._key(type)]
+        if type in self.topk.counts:
+            return min(estimate, self.topk.counts[type])
+        return estimate
+
+    def __setitem__(self, type, value):
+        raise TypeError("Approximate frequency lists can only be counted")
+
+    def __delitem__(self, type):
+        raise TypeError("Approximate frequency lists can only be counted")
+
+    def __contains__(self, type):
+        """Checks if the specified type is among the top-k types"""
+        if self.dovalidation: type = self._validate(type)
+        return type in self.topk
+
+    def __iter__(self):
+        """Iterate over the top-k types, in order (frequent to rare). This is a generator that yields (type, estimated count) pairs."""
+        for type, count in sorted(self.items(), key=lambda x: -x[1]):
+            yield type, count
+
+    def items(self):
+        """Returns an *unranked* list of (type, estimated count) pairs for the top-k types"""
+        for type, count in self.topk.counts.items():
+            yield type, min(count, self.sketch[self._key(type)])
+
+    def __len__(self):
+        """Returns the number of types tracked (at most k)"""
+        return len(self.topk)
+
+    def typetokenratio(self):
+        raise ValueError("The number of types is not known for approximate frequency lists")
+
+    def mode(self):
+        """Returns the most frequent type"""
+        return next(iter(self))[0]
+
+    def p(self, type):
+        """Returns the estimated probability (relative frequency) of the type"""
+        return self[type] / float(self.total)
+
+    def error(self):
+        """Returns the maximum overestimation of counts (with probability 1 - delta)"""
+        return self.sketch.epsilon * self.total
+
+    def __eq__(self, other):
+        return isinstance(other, ApproximateFrequencyList) and self.total == other.total and np.array_equal(self.sketch.table, other.sketch.table) and self.topk.counts == other.topk.counts
+
+    def update(self, other):
+        """Merge another approximate frequency list with the same parameters into this one, in place"""
+        if not isinstance(other, ApproximateFrequencyList):
+            raise ValueError("Can only merge approximate frequency lists")
+        self.sketch.update(other.sketch)
+        self.topk.update(other.topk)
+        self.total += other.total
+
+    def __add__(self, other):
+        """Approximate frequency lists with the same parameters can be added together"""
+        product = ApproximateFrequencyList(None, self.casesensitive, self.dovalidation, self.sketch.epsilon, self.sketch.delta, self.topk.k)
+        product.update(self)
+        product.update(other)
+        return product
+
+    def save(self, filename, addnormalised=False):
+        """Save the sketch and top-k types to file (in NumPy's npz format), can be loaded later using the load method"""
+        topk = [ (list(type) if isinstance(type, tuple) else type, count, self.topk.errors[type]) for type, count in self.topk.counts.items() ]
+        parameters = {'epsilon': self.sketch.epsilon, 'delta': self.sketch.delta, 'k': self.topk.k, 'total': self.total, 'casesensitive': self.casesensitive, 'dovalidation': self.dovalidation}
+        f = io.open(filename,'wb')
+        np.savez(f, table=self.sketch.table, parameters=np.array(json.dumps(parameters)), topk=np.array(json.dumps(topk)))
+        f.close()
+
+    def load(self, filename):
+        """Load an approximate frequency list from file (in the format produced by the save method), replacing the current counts"""
+        data = np.load(filename)
+        parameters = json.loads(u(data['parameters'][()]))
+        self.sketch = CountMinSketch(parameters['epsilon'], parameters['delta'])
+        self.sketch.table = data['table']
+        self.sketch.total = self.total = parameters['total']
+        self.casesensitive = parameters['casesensitive']
+        self.dovalidation = parameters['dovalidation']
+        self.topk = SpaceSaving(parameters['k'])
+        for type, count, error in json.loads(u(data['topk'][()])):
+            if isinstance(type, list): type = tuple(type)
+            self.topk.counts[type] = count
+            self.topk.errors[type] = error
+        self.topk._rebuild()
+
+    def __repr__(self):
+        return "<ApproximateFrequencyList: " + str(self.total) + " tokens, top " + str(len(self)) + " types>"
+
+    def values(self):
+        return [ count for _, count in self.items() ]
+
+    def dict(self):
+        return dict(self.items())
+
+
+class SQLiteFrequencyList(FrequencyList):
+    """A persistent frequency list stored in an SQLite database, for counts that do not fit in memory. It offers the same interface as :class:`FrequencyList`.
+
+    Counts are collected in an in-memory write-back buffer and written to the database in batches when the buffer is full, when the counts are iterated over, or on :meth:`flush`/:meth:`close`. Opening an existing database is immediate, nothing is loaded until it is needed. Besides ranked iteration, types can be iterated over by lexical range or prefix, in lexical or frequency order (see :meth:`range` and :meth:`prefix`).
+
+    N-grams (tuples) are stored with their words joined by tabs.
+
+    Arguments:
+        filename (str): The database file, will be created if it does not exist yet
+        tokens (iterable): Tokens to count
+        casesensitive (bool): Case sensitive counting (default: True). Only used when creating a new database, an existing one retains its setting.
+        dovalidation (bool): Convert lists to tuples and apply case normalisation (default: True)
+        buffersize (int): Maximum number of types to buffer in memory before writing to the database
+
+    Example::
+
+        freqlist = SQLiteFrequencyList('counts.db')
+        freqlist.append(tokens)
+        for type, count in freqlist.prefix('house', order='frequency'):
+            print(type, count)
+        freqlist.close()
+    """
+
+    def __init__(self, filename, tokens = None, casesensitive = True, dovalidation = True, buffersize = 100000):
+        self.filename = filename
+        self.buffersize = buffersize
+        self.dovalidation = dovalidation
+        self.db = sqlite3.connect(filename)
+        self.db.execute("CREATE TABLE IF NOT EXISTS freqlist (type TEXT NOT NULL, n INTEGER NOT NULL, count INTEGER NOT NULL, PRIMARY KEY (type, n))")
+        self.db.execute("CREATE INDEX IF NOT EXISTS freqlist_count ON freqlist (count)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS metadata (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        metadata = dict(self.db.execute("SELECT key, value FROM metadata"))
+        if metadata:
+            self.casesensitive = bool(metadata['casesensitive'])
+            self.total = metadata['total'] #number of tokens (including buffered ones)
+            self.types = metadata['types'] #number of types in the database
+        else:
+            self.casesensitive = casesensitive
+            self.total = 0
+            self.types = 0
+            self.db.executemany("INSERT INTO metadata (key, value) VALUES (?,?)", [('casesensitive', int(casesensitive)), ('total', 0), ('types', 0)])
+            self.db.commit()
+        self._flushed = (self.total, self.types) #counters as last written to the database
+        self._buffer = Counter()
+        if tokens: self.append(tokens)
+
+    @staticmethod
+    def _encode(type):
+        if isinstance(type, tuple):
+            return "\t".join(type), len(type)
+        return type, 0
+
+    @staticmethod
+    def _decode(type, n):
+        if n:
+            return tuple(type.split("\t"))
+        return type
+
+    def count(self, type, amount = 1):
+        """Count a certain type. The counter will increase by the amount specified (defaults to one)"""
+        if self.dovalidation: type = self._validate(type)
+        amount = int(amount)
+        self._buffer[type] += amount
+        self.total += amount
+        if len(self._buffer) >= self.buffersize:
+            self.flush()
+
+    def update(self, other):
+        """Merge the counts of another frequency list (or an iterable of (type, count) pairs) into this one"""
+        if isinstance(other, FrequencyList): other = other.items()
+        for type, count in other:
+            self.count(type,count)
+
+    def flush(self):
+        """Write the buffered counts to the database, using batched upserts in a single transaction. Nothing is written if nothing changed since the last flush."""
+        if not self._buffer and (self.total, self.types) == self._flushed:
+            return
+        if self._buffer:
+            rows = [ self._encode(type) + (count,) for type, count in self._buffer.items() ]
+            cursor = self.db.cursor()
+            cursor.executemany("INSERT OR IGNORE INTO freqlist (type, n, count) VALUES (?,?,0)", [ (type, n) for type, n, _ in rows ])
+            self.types += cursor.rowcount
+            cursor.executemany("UPDATE freqlist SET count = count + ? WHERE type = ? AND n = ?", [ (count, type, n) for type, n, count in rows ])
+            self._buffer = Counter()
+        self.db.executemany("UPDATE metadata SET value = ? WHERE key = ?", [(self.total, 'total'), (self.types, 'types')])
+        self.db.commit()
+        self._flushed = (self.total, self.types)
+
+    def close(self):
+        """Flush the buffer and close the database"""
+        self.flush()
+        self.db.close()
+
+    def _get(self, type):
+        row = self.db.execute("SELECT count FROM freqlist WHERE type = ? AND n = ?", self._encode(type)).fetchone()
+        if row is None:
+            return 0
+        return row[0]
+
+    def __getitem__(self, type):
+        if self.dovalidation: type = self._validate(type)
+        return self._get(type) + self._buffer.get(type, 0)
+
+    def __setitem__(self, type, value):
+        """alias for count, but can only be called once"""
+        if type in self:
+            raise ValueError("This type is already set!")
+        self.count(type,value)
+
+    def __delitem__(self, type):
+        if self.dovalidation: type = self._validate(type)
+        self.flush()
+        count = self._get(type)
+        if not count:
+            raise KeyError(type)
+        self.db.execute("DELETE FROM freqlist WHERE type = ? AND n = ?", self._encode(type))
+        self.total -= count
+        self.types -= 1
+        self.flush()
+
+    def __contains__(self, type):
+        """Checks if the specified type is in the frequency list"""
+        return self[type] > 0
+
+    def __len__(self):
+        """Returns the total amount of types"""
+        self.flush()
+        return self.types
+
+    def typetokenratio(self):
+        """Computes the type/token ratio"""
+        return len(self) / float(self.total)
+
+    def p(self, type):
+        """Returns the probability (relative frequency) of the token"""
+        return self[type] / float(self.total)
+
+    def mode(self):
+        """Returns the type that occurs the most frequently in the frequency list"""
+        return next(iter(self))[0]
+
+    def _select(self, where = "", parameters = (), order = 'frequency'):
+        self.flush()
+        if order == 'frequency':
+            orderby = "count DESC"
+        elif order == 'lexical':
+            orderby = "type, n"
+        else:
+            raise ValueError("Invalid order: " + order)
+        for type, n, count in self.db.execute("SELECT type, n, count FROM freqlist " + where + " ORDER BY " + orderby, parameters):
+            yield self._decode(type, n), count
+
+    def __iter__(self):
+        """Iterate over the frequency list, in order (frequent to rare). This is a generator that yields (type, count) pairs."""
+        return self._select()
+
+    def items(self):
+        """Returns an *unranked* list of (type, count) pairs (they are in fact in lexical order)."""
+        return self._select(order='lexical')
+
+    def range(self, begin = None, end = None, order = 'lexical'):
+        """Iterate over all types from begin (inclusive) to end (exclusive) in lexical order of their string representation, as (type, count) pairs. Order can be 'lexical' or 'frequency'."""
+        conditions = []
+        parameters = []
+        if begin is not None:
+            if self.dovalidation: begin = self._validate(begin)
+            conditions.append("type >= ?")
+            parameters.append(self._encode(begin)[0])
+        if end is not None:
+            if self.dovalidation: end = self._validate(end)
+            conditions.append("type < ?")
+            parameters.append(self._encode(end)[0])
+        where = "WHERE " + " AND ".join(conditions) if conditions else ""
+        return self._select(where, parameters, order)
+
+    def prefix(self, prefix, order = 'lexical'):
+        """Iterate over all types starting with the given prefix, as (type, count) pairs. If the prefix is a tuple, this yields the n-grams starting with the given words. Order can be 'lexical' or 'frequency'."""
+        if self.dovalidation: prefix = self._validate(prefix)
+        if isinstance(prefix, tuple):
+            prefix = "\t".join(prefix) + "\t"
+        if not prefix:
+            return self._select(order=order)
+        end = prefix[:-1] + chr(ord(prefix[-1]) + 1) if sys.version >= '3' else prefix[:-1] + unichr(ord(prefix[-1]) + 1) #pylint: disable=undefined-variable
+        return self._select("WHERE type >= ? AND type < ?", (prefix, end), order)
+
+    def load(self, filename):
+        """Load counts from file (in the format produced by the save method), they are added to the database in batches"""
+        f = io.open(filename,'r',encoding='utf-8')
+        for line in f:
+            data = line.strip().split("\t")
+            type, count = data[:2]
+            self.count(type,count)
+        f.close()
+        self.flush()
+
+    def __eq__(self, otherfreqlist):
+        return self.total == otherfreqlist.total and self.dict() == dict(otherfreqlist.items())
+
+    def __repr__(self):
+        return "<SQLiteFrequencyList: " + self.filename + ">"
+
+    def values(self):
+        return [ count for _, count in self.items() ]
+
+    def dict(self):
+        return dict(self.items())
+
+
+def _countchunk(args):
+    """Counts the types in a chunk of a file, used by FrequencyCounter (in a separate process)"""
+    filename, begin, end, encoding, tokenize, casesensitive = args
+    freqlist = FrequencyList(None, casesensitive)
+    f = io.open(filename,'rb')
+    f.seek(begin)
+    position = begin
+    while position < end:
+        line = f.readline()
+        if not line:
+            break
+        position += len(line)
+        freqlist.append(tokenize(line.decode(encoding)))
+    f.close()
+    return freqlist
+
+def _typestring(type):
+    if isinstance(type,tuple) or isinstance(type,list):
+        return " ".join((u(x) for x in type))
+    return u(type)
+
+def _readrun(filename):
+    f = io.open(filename,'r',encoding='utf-8')
+    for line in f:
+        type, count = line.rstrip('\n').split('\t')
+        yield type, int(count)
+    f.close()
+
+
+class FrequencyCounter(object):
+    """Counts types in (large) text files in parallel, map-reduce style. The files are split into chunks of lines that are counted by a pool of worker processes, and the partial frequency lists are merged in place. If a memory limit is set, the merged counts are spilled to sorted runs on disk whenever the estimated size exceeds the limit, and the runs are combined with a k-way merge when iterating.
+
+    Arguments:
+        tokenize (callable): A function that takes a line and returns the types to count in it. It is passed to the worker processes, so it must be picklable: a module-level function or a ``functools.partial`` thereof.
+        workers (int): Number of worker processes, if set to 1 everything is counted in the current process
+        casesensitive (bool): Case sensitive counting (default: True)
+        encoding (str): The character encoding of the files
+        chunksize (int): Size in bytes of the chunks the files are split into
+        memorylimit (int): Approximate memory limit in megabytes for the merged counts, or None for no limit
+        tmpdir (str): Directory in which to create the directory for the sorted runs (default: the system's temporary directory)
+
+    Example::
+
+        counter = FrequencyCounter(crude_tokenizer, workers=4, memorylimit=1024)
+        counter.count(['corpus1.txt','corpus2.txt'])
+        for type, count in counter:
+            print(type, count)
+        counter.cleanup()
+    """
+
+    def __init__(self, tokenize, workers=1, casesensitive=True, encoding='utf-8', chunksize=16*1024*1024, memorylimit=None, tmpdir=None):
+        self.tokenize = tokenize
+        self.workers = workers
+        self.casesensitive = casesensitive
+        self.encoding = encoding
+        self.chunksize = chunksize
+        self.memorylimit = memorylimit
+        self.tmpdir = tmpdir
+        self.freqlist = FrequencyList(None, casesensitive) #counts that have not been spilled yet
+        self.runs = [] #filenames of sorted runs on disk
+        self.rundir = None
+        self.total = 0 #number of tokens
+        self.typesize = None #estimated memory usage per type in bytes
+
+    def chunks(self, filenames):
+        """Splits the files into chunks at line boundaries, yields (filename, begin, end) tuples"""
+        for filename in filenames:
+            size = os.path.getsize(filename)
+            f = io.open(filename,'rb')
+            begin = 0
+            while begin < size:
+                f.seek(min(begin + self.chunksize, size))
+                f.readline() #move on to the end of the line
+                end = min(f.tell(), size)
+                yield filename, begin, end
+                begin = end
+            f.close()
+
+    def count(self, filenames):
+        """Count all types in the specified files"""
+        tasks = ( (filename, begin, end, self.encoding, self.tokenize, self.casesensitive) for filename, begin, end in self.chunks(filenames) )
+        if self.workers > 1:
+            pool = multiprocessing.Pool(self.workers)
+            try:
+                for freqlist in pool.imap(_countchunk, tasks):
+                    self.update(freqlist)
+            finally:
+                pool.terminate()
+                pool.join()
+        else:
+            for task in tasks:
+                self.update(_countchunk(task))
+
+    def update(self, freqlist):
+        """Merge a (partial) frequency list in place, spilling to disk if the memory limit is exceeded"""
+        self.freqlist.update(freqlist)
+        self.total += freqlist.total
+        if self.memorylimit:
+            if self.typesize is None and len(self.freqlist):
+                self.typesize = self._estimatetypesize()
+            if self.typesize and len(self.freqlist) * self.typesize > self.memorylimit * 1024 * 1024:
+                self.spill()
+
+    def _estimatetypesize(self):
+        """Estimates the memory usage per type (including the counter overhead) from a sample"""
+        sample = []
+        for i, type in enumerate(self.freqlist.dict()):
+            if i == 100: break
+            size = sys.getsizeof(type)
+            if isinstance(type, tuple):
+                size += sum(sys.getsizeof(x) for x in type)
+            sample.append(size)
+        return sum(sample) / len(sample) + 100 #plus estimated hashtable and count overhead
+
+    def spill(self):
+        """Write the counts held in memory to a sorted run on disk"""
+        if not len(self.freqlist):
+            return
+        if self.rundir is None:
+            self.rundir = tempfile.mkdtemp(prefix="pynlpl-freqlist-", dir=self.tmpdir)
+        filename = os.path.join(self.rundir, "run" + str(len(self.runs)) + ".tsv")
+        f = io.open(filename,'w',encoding='utf-8')
+        for type, count in sorted( (_typestring(type), count) for type, count in self.freqlist.items() ):
+            f.write(type + "\t" + str(count) + "\n")
+        f.close()
+        self.runs.append(filename)
+        self.freqlist = FrequencyList(None, self.casesensitive)
+
+    def __iter__(self):
+        """Iterate over all (type, count) pairs. If nothing was spilled to disk, these are ranked from frequent to rare, like a FrequencyList. Otherwise the sorted runs are merged and the pairs are in lexical order, with n-grams joined by spaces."""
+        if not self.runs:
+            for type, count in self.freqlist:
+                yield type, count
+            return
+        self.spill()
+        previoustype = None
+        total = 0
+        for type, count in heapq.merge(*[ _readrun(filename) for filename in self.runs ]):
+            if type == previoustype:
+                total += count
+            else:
+                if previoustype is not None:
+                    yield previoustype, total
+                previoustype = type
+                total = count
+        if previoustype is not None:
+            yield previoustype, total
+
+    def cleanup(self):
+        """Remove the sorted runs from disk"""
+        if self.rundir is not None:
+            shutil.rmtree(self.rundir)
+            self.rundir = None
+            self.runs = []
+
+
 #class FrequencyTrie:
 #    def __init__(self):
 #        self.data = Tree()
@@ -344,12 +1337,322 @@ class Distribution(object):
         return self._dist.values()
 
 
+class ArrayDistribution(Distribution):
+    """A distribution backed by a NumPy array, for distributions over very many types. Types are mapped to indices by a :class:`Vocabulary` and their probabilities are stored in a float64 array, so information-theoretic measures are vectorised. Distributions sharing the same vocabulary can be compared with :meth:`kl` and :meth:`js`.
+
+    It offers the same interface as :class:`Distribution`, and can be created over a FrequencyList, a plain dictionary with numeric values, a list of (type, value) pairs, or an array of values aligned with the vocabulary. It will be normalized automatically.
+
+    Arguments:
+        data: The data to create the distribution over
+        base (int): Logarithmic base (default: 2)
+        vocabulary (Vocabulary): The vocabulary to use, types in the data that are not in it yet will be added. A new vocabulary will be created if not specified, but it is required if the data is an array.
+    """
+
+    def __init__(self, data, base = 2, vocabulary = None):
+        if np is None:
+            raise ImportError("No numpy installed")
+        self.base = base
+        if vocabulary is None:
+            if isinstance(data, np.ndarray):
+                raise ValueError("A vocabulary is required to create a distribution over an array")
+            vocabulary = Vocabulary()
+        self.vocabulary = vocabulary
+        if isinstance(data, np.ndarray):
+            values = np.asarray(data, dtype=np.float64)
+            if len(values) > len(vocabulary):
+                raise ValueError("Array is larger than the vocabulary")
+        else:
+            if isinstance(data, FrequencyList):
+                data = data.items()
+            elif isinstance(data, dict):
+                data = data.items()
+            elif not isinstance(data, list):
+                raise Exception("Can't create distribution")
+            indices = array('l')
+            weights = array('d')
+            for type, value in data:
+                indices.append(vocabulary.encode(type))
+                weights.append(float(value))
+            values = np.zeros(len(vocabulary), dtype=np.float64)
+            np.add.at(values, np.asarray(indices, dtype=np.int64), np.asarray(weights))
+        total = values.sum()
+        if total <= 0:
+            raise ValueError("Can't create distribution, no probability mass")
+        self.p = values / total #probabilities, indexed by vocabulary id
+        self._ranked = None #indices from probable to improbable
+        self._alias = None #alias table for sampling
+
+    def _log(self, values, base):
+        if not base: base = self.base
+        if not base:
+            return np.log(values)
+        else:
+            return np.log(values) / math.log(base)
+
+    def _aligned(self, other):
+        """Returns the probability arrays of this and the other distribution, aligned on the shared vocabulary"""
+        if not isinstance(other, ArrayDistribution) or other.vocabulary is not self.vocabulary:
+            raise ValueError("Distributions must share the same vocabulary")
+        p, q = self.p, other.p
+        if len(p) < len(q):
+            p = np.concatenate((p, np.zeros(len(q) - len(p))))
+        elif len(q) < len(p):
+            q = np.concatenate((q, np.zeros(len(p) - len(q))))
+        return p, q
+
+    def _rank(self):
+        if self._ranked is None:
+            nonzero = np.flatnonzero(self.p)
+            self._ranked = nonzero[np.argsort(-self.p[nonzero], kind='mergesort')]
+
+    def information(self, type):
+        """Computes the information content of the specified type: -log_e(p(X))"""
+        return float(-self._log(self[type], self.base))
+
+    def informationarray(self, base = None):
+        """Computes the information content of all types at once, returns an array aligned with the vocabulary (infinite for types with zero probability)"""
+        with np.errstate(divide='ignore'):
+            return -self._log(self.p, base)
+
+    def entropy(self, base = 2):
+        """Compute the entropy of the distribution"""
+        p = self.p[self.p > 0]
+        return float(-(p * self._log(p, base)).sum())
+
+    def perplexity(self, base=2):
+        return base ** self.entropy(base)
+
+    def maxentropy(self, base = 2):
+        """Compute the maximum entropy of the distribution: log_e(N)"""
+        return float(self._log(len(self), base))
+
+    def kl(self, other, base = 2):
+        """Computes the Kullback-Leibler divergence D(self||other) to another distribution sharing the same vocabulary. This is infinite if the other distribution assigns zero probability to a type this one does not."""
+        p, q = self._aligned(other)
+        nonzero = p > 0
+        if (q[nonzero] == 0).any():
+            return float('inf')
+        return float((p[nonzero] * self._log(p[nonzero] / q[nonzero], base)).sum())
+
+    def js(self, other, base = 2):
+        """Computes the Jensen-Shannon divergence to another distribution sharing the same vocabulary"""
+        p, q = self._aligned(other)
+        m = (p + q) / 2
+        divergence = 0.0
+        for x in (p, q):
+            nonzero = x > 0
+            divergence += 0.5 * (x[nonzero] * self._log(x[nonzero] / m[nonzero], base)).sum()
+        return float(divergence)
+
+    def sample(self, n = None, rng = None):
+        """Draws a random type from the distribution, or a list of n types if n is specified. Sampling takes constant time per type, using an alias table that is constructed on first use (Vose's method). The random number generator (rng) can be a numpy.random.Generator or RandomState."""
+        if self._alias is None:
+            self._alias = self._aliastable()
+        probabilities, alias = self._alias
+        if rng is None: rng = np.random
+        size = 1 if n is None else n
+        if hasattr(rng, 'integers'): #numpy.random.Generator
+            columns = rng.integers(0, len(probabilities), size)
+            uniform = rng.random(size)
+        else: #numpy.random.RandomState or the numpy.random module
+            columns = rng.randint(0, len(probabilities), size)
+            uniform = rng.random_sample(size)
+        indices = np.where(uniform < probabilities[columns], columns, alias[columns])
+        if n is None:
+            return self.vocabulary.words[indices[0]]
+        return [ self.vocabulary.words[i] for i in indices ]
+
+    def _aliastable(self):
+        l = len(self.p)
+        scaled = self.p * l
+        probabilities = np.ones(l, dtype=np.float64)
+        alias = np.arange(l)
+        small = list(np.flatnonzero(scaled < 1))
+        large = list(np.flatnonzero(scaled >= 1))
+        while small and large:
+            s = small.pop()
+            g = large.pop()
+            probabilities[s] = scaled[s]
+            alias[s] = g
+            scaled[g] = (scaled[g] + scaled[s]) - 1
+            if scaled[g] < 1:
+                small.append(g)
+            else:
+                large.append(g)
+        return probabilities, alias
+
+    def top(self, k):
+        """Returns the k most probable (type, probability) pairs, ranked. Only these are sorted, not the entire distribution."""
+        if k >= len(self.p):
+            return list(self)[:k]
+        indices = np.argpartition(-self.p, k)[:k]
+        indices = indices[np.argsort(-self.p[indices], kind='mergesort')]
+        return [ (self.vocabulary.words[i], float(self.p[i])) for i in indices if self.p[i] > 0 ]
+
+    def mode(self):
+        """Returns the type that occurs the most frequently in the probability distribution"""
+        return self.vocabulary.words[int(np.argmax(self.p))]
+
+    def __len__(self):
+        """Returns the number of types (with non-zero probability)"""
+        return int(np.count_nonzero(self.p))
+
+    def __getitem__(self, type):
+        """Return the probability for this type"""
+        id = self.vocabulary.encode(type, False)
+        if id is None or id >= len(self.p) or not self.p[id]:
+            raise KeyError(type)
+        return float(self.p[id])
+
+    def __iter__(self):
+        """Iterate over the *ranked* distribution, returns (type, probability) pairs"""
+        self._rank()
+        for i in self._ranked:
+            yield self.vocabulary.words[i], float(self.p[i])
+
+    def items(self):
+        """Returns an *unranked* list of (type, prob) pairs. Use this only if you are not interested in the order."""
+        for i in np.flatnonzero(self.p):
+            yield self.vocabulary.words[i], float(self.p[i])
+
+    def __repr__(self):
+        return "<ArrayDistribution: " + str(len(self)) + " types>"
+
+    def keys(self):
+        return [ type for type, _ in self.items() ]
+
+    def values(self):
+        return self.p[self.p > 0]
+
+
+class MarkovCounts(object):
+    """Sufficient statistics for the supervised training of a :class:`MarkovChain` or :class:`HiddenMarkovModel`: counts of state transitions (including those from the start state and to the end state, if any) and of emissions. Counts collected separately, for instance in different processes, can be merged with :meth:`update`.
+
+    Arguments:
+        startstate: The start state, prepended to every sequence
+        endstate: The end state, appended to every sequence (if not None)
+    """
+
+    def __init__(self, startstate, endstate = None):
+        self.startstate = startstate
+        self.endstate = endstate
+        self.transitions = Counter() #(state, nextstate) -> count
+        self.emissions = Counter() #(state, observation) -> count
+
+    def add(self, states, observations = None):
+        """Count the transitions in a sequence of states, and the emissions if a sequence of observations (of the same length) is given"""
+        states = [self.startstate] + list(states)
+        if self.endstate is not None:
+            states.append(self.endstate)
+        self.transitions.update(zip(states[:-1], states[1:]))
+        if observations is not None:
+            self.emissions.update(zip(states[1:], observations))
+
+    def update(self, other):
+        """Merge the counts of another instance into this one, in place"""
+        self.transitions.update(other.transitions)
+        self.emissions.update(other.emissions)
+
+    @staticmethod
+    def _estimate(counts, smoothing, targets):
+        distributions = {}
+        for (source, target), count in counts.items():
+            if source not in distributions:
+                distributions[source] = Counter()
+            distributions[source][target] += count
+        for source, counter in distributions.items():
+            total = sum(counter.values()) + smoothing * len(targets)
+            if smoothing:
+                distributions[source] = dict( (target, (counter[target] + smoothing) / total) for target in targets )
+            else:
+                distributions[source] = dict( (target, count / total) for target, count in counter.items() )
+        return distributions
+
+    def transitiondistributions(self, smoothing = 0):
+        """Estimates the transition distributions (state -> {nextstate: probability}) by relative frequency, with add-k smoothing (over all states that can be transitioned to) if smoothing is set to k > 0"""
+        targets = set( target for _, target in self.transitions )
+        targets.update( source for source, _ in self.transitions if source != self.startstate )
+        return self._estimate(self.transitions, smoothing, targets)
+
+    def emissiondistributions(self, smoothing = 0):
+        """Estimates the emission distributions (state -> {observation: probability}) by relative frequency, with add-k smoothing (over all observations) if smoothing is set to k > 0. Note that smoothing makes the distributions dense."""
+        return self._estimate(self.emissions, smoothing, set( observation for _, observation in self.emissions ))
+
+
+def _countmarkov(args):
+    """Collects the counts for a chunk of sequences, used in training (possibly in a separate process)"""
+    sequences, startstate, endstate, hidden = args
+    counts = MarkovCounts(startstate, endstate)
+    for sequence in sequences:
+        if hidden:
+            observations, states = sequence
+            counts.add(states, observations)
+        else:
+            counts.add(sequence)
+    return counts
+
+def _countparallel(sequences, startstate, endstate, hidden, workers, chunksize):
+    counts = MarkovCounts(startstate, endstate)
+    sequences = iter(sequences)
+    chunks = iter(lambda: list(itertools.islice(sequences, chunksize)), [])
+    tasks = ( (chunk, startstate, endstate, hidden) for chunk in chunks )
+    if workers > 1:
+        pool = multiprocessing.Pool(workers)
+        try:
+            for partialcounts in pool.imap_unordered(_countmarkov, tasks):
+                counts.update(partialcounts)
+        finally:
+            pool.terminate()
+            pool.join()
+    else:
+        for task in tasks:
+            counts.update(_countmarkov(task))
+    return counts
+
+def taggedsequences(data, set = None):
+    """Converts tagged data to (observations, states) pairs for training a :class:`HiddenMarkovModel` as a tagger, i.e. (words, tags). Data can be a :class:`pynlpl.formats.taggerdata.Taggerdata` instance (or any iterable of (words, lemmas, postags) tuples, or of (words, tags) pairs), or a FoLiA document, of which the text and PoS annotation (of the specified set) of the words in every sentence are used. Sentences with untagged words are skipped."""
+    if hasattr(data, 'sentences') and hasattr(data, 'words'):
+        from pynlpl.formats import folia
+        for sentence in data.sentences():
+            words = []
+            tags = []
+            try:
+                for word in sentence.words():
+                    words.append(word.text())
+                    tags.append(word.pos(set))
+            except (folia.NoSuchAnnotation, folia.NoSuchText):
+                continue
+            if words:
+                yield words, tags
+    else:
+        for item in data:
+            if len(item) == 3:
+                words, _, tags = item
+            else:
+                words, tags = item
+            if words and None not in tags:
+                yield words, tags
+
+
 class MarkovChain(object):
     def __init__(self, startstate, endstate = None):
         self.nodes = set()
         self.edges_out = {}
         self.startstate = startstate
         self.endstate = endstate
+        self.compiled = None
+        self.graph = None
+
+    def invalidate(self):
+        """Clears all cached representations derived from the model, called whenever the model changes"""
+        self.compiled = None
+        self.graph = None
+
+    def analyse(self):
+        """Returns a :class:`MarkovChainGraph` with the strongly connected components and reachability of the states. The result is cached until the model changes."""
+        if self.graph is None:
+            self.graph = MarkovChainGraph(self)
+        return self.graph
 
     def settransitions(self, state, distribution):
         self.nodes.add(state)
@@ -357,6 +1660,7 @@ class MarkovChain(object):
             distribution = Distribution(distribution)
         self.edges_out[state] = distribution
         self.nodes.update(distribution.keys())
+        self.invalidate()
 
     def __iter__(self):
         for state, distribution in self.edges_out.items():
@@ -380,32 +1684,17 @@ class MarkovChain(object):
 
 
     def communicates(self,fromstate, tostate, maxlength=999999):
-        """See if a node communicates (directly or indirectly) with another. Returns the probability of the *shortest* path (probably, but not necessarily the highest probability)"""
+        """See if a node communicates (directly or indirectly) with another. Returns the probability of the *shortest* path (probably, but not necessarily the highest probability), or zero if there is no path of at most maxlength steps. Unreachable states are rejected in constant time using the cached reachability of :meth:`analyse`."""
         if (not (fromstate in self.nodes)) or (not (tostate in self.nodes)):
             return 0
-        assert (fromstate != tostate)
-
-
-        def _test(node,length,prob):
-            if length > maxlength:
-                return 0
-            if node == tostate:
-                prob *= self.edges_out[node][tostate]
-                return True
-
-            for child in self.edges_out[node].keys():
-                if not child in visited:
-                    visited.add(child)
-                    if child == tostate:
-                        return prob * self.edges_out[node][tostate]
-                    else:
-                        r = _test(child, length+1, prob * self.edges_out[node][tostate])
-                        if r:
-                            return r
+        length, prob = self.analyse().shortestpath(fromstate, tostate)
+        if length is None or length > maxlength:
             return 0
+        return prob
 
-        visited = set(fromstate)
-        return _test(fromstate,1,1)
+    def reachable(self, fromstate, tostate):
+        """Can state tostate be reached (in one or more steps) from state fromstate? Constant time after the first call, see :meth:`analyse`"""
+        return self.analyse().reachable(fromstate, tostate)
 
     def p(self, sequence, subsequence=True):
         """Returns the probability of the given sequence or subsequence (if subsequence=True, default)."""
@@ -438,9 +1727,37 @@ class MarkovChain(object):
 
 
 
+    def train(self, sequences, smoothing = 0, workers = 1, chunksize = 10000):
+        """Supervised training: estimates the transition distributions from sequences of states by relative frequency, replacing any existing transitions. The counts are collected in parallel if multiple workers are specified, in chunks of the specified number of sequences.
+
+        Arguments:
+            sequences (iterable): Sequences (lists) of states, without start and end state
+            smoothing (float): Add-k smoothing constant for the transition distributions (0 = no smoothing)
+            workers (int): Number of worker processes
+
+        Returns:
+            :class:`MarkovCounts` with the collected counts
+        """
+        counts = _countparallel(sequences, self.startstate, self.endstate, False, workers, chunksize)
+        self.nodes = set()
+        self.edges_out = {}
+        self.invalidate()
+        for state, distribution in counts.transitiondistributions(smoothing).items():
+            self.settransitions(state, distribution)
+        return counts
+
     def reducible(self):
-        #TODO: implement
-        raise NotImplementedError
+        """Is the chain reducible, i.e. are there states that can not be reached from each other (more than one strongly connected component)?"""
+        return len(self.analyse().components) > 1
+
+    def components(self):
+        """Returns the strongly connected components (communicating classes) of the chain as a list of sets of states"""
+        graph = self.analyse()
+        return [ set( graph.states[i] for i in members ) for members in graph.components ]
+
+    def stationary(self, iterations = 1000, tolerance = 1e-12):
+        """Computes the stationary distribution of the chain, see :meth:`MarkovChainGraph.stationary`"""
+        return self.analyse().stationary(iterations, tolerance)
 
 
 
@@ -457,6 +1774,107 @@ class HiddenMarkovModel(MarkovChain):
             distribution = Distribution(distribution)
         self.edges_toobservables[state] = distribution
         self.observablenodes.update(distribution.keys())
+        self.invalidate()
+
+    def train(self, sequences, smoothing = 0, emissionsmoothing = 0, workers = 1, chunksize = 10000):
+        """Supervised training: estimates the transition and emission distributions from tagged sequences by relative frequency, replacing any existing ones. The counts are collected in parallel if multiple workers are specified, in chunks of the specified number of sequences.
+
+        Arguments:
+            sequences (iterable): (observations, states) pairs, such as (words, tags). See :func:`taggedsequences` for converting Taggerdata or FoLiA documents.
+            smoothing (float): Add-k smoothing constant for the transition distributions (0 = no smoothing)
+            emissionsmoothing (float): Add-k smoothing constant for the emission distributions (0 = no smoothing), this makes the emission distributions dense
+            workers (int): Number of worker processes
+
+        Returns:
+            :class:`MarkovCounts` with the collected counts
+
+        Example::
+
+            hmm = HiddenMarkovModel('start')
+            hmm.train(taggedsequences(Taggerdata('train.tagged')), smoothing=0.1)
+        """
+        counts = _countparallel(sequences, self.startstate, self.endstate, True, workers, chunksize)
+        self.nodes = set()
+        self.edges_out = {}
+        self.edges_toobservables = {}
+        self.observablenodes = set()
+        self.invalidate()
+        for state, distribution in counts.transitiondistributions(smoothing).items():
+            self.settransitions(state, distribution)
+        for state, distribution in counts.emissiondistributions(emissionsmoothing).items():
+            self.setemission(state, distribution)
+        return counts
+
+    def baumwelch(self, sequences, iterations = 10, tolerance = 1e-4, workers = 1, chunksize = 256):
+        """Unsupervised training with the Baum-Welch algorithm (expectation maximisation), starting from the current model. The expected counts are computed in scaled probability space using forward-backward on the compiled model, in parallel if multiple workers are specified. The states and the observations that can be emitted remain the same. If the model has an end state, the transitions to it are re-estimated as well, from the expected last state of every sequence.
+
+        Arguments:
+            sequences (list): Observation sequences, must be iterable multiple times
+            iterations (int): Maximum number of iterations
+            tolerance (float): Stop when the total log likelihood improves by less than this
+            workers (int): Number of worker processes
+
+        Returns:
+            A list with the total log likelihood (base e) of the sequences before every iteration
+        """
+        loglikelihoods = []
+        for _ in range(iterations):
+            compiled = self.compile()
+            S = len(compiled.states)
+            start = np.zeros(S)
+            transitions = np.zeros((S,S))
+            emissions = np.zeros(compiled.emissions.shape)
+            loglikelihood = 0.0
+            chunks = ( sequences[i:i+chunksize] for i in range(0, len(sequences), chunksize) )
+            if workers > 1:
+                pool = multiprocessing.Pool(workers, _baumwelch_init, (compiled,))
+                try:
+                    results = list(pool.imap_unordered(_baumwelch_chunk, chunks))
+                finally:
+                    pool.terminate()
+                    pool.join()
+            else:
+                _baumwelch_init(compiled)
+                results = [ _baumwelch_chunk(chunk) for chunk in chunks ]
+            for s, t, e, l in results:
+                start += s
+                transitions += t
+                emissions += e
+                loglikelihood += l
+            loglikelihoods.append(loglikelihood)
+
+            #maximisation
+            startstateindex = compiled.stateindex.get(self.startstate)
+            if start.sum() > 0:
+                self.settransitions(self.startstate, dict( (compiled.states[j], float(p)) for j, p in enumerate(start / start.sum()) if p > 0 ))
+            for i, state in enumerate(compiled.states):
+                if i != startstateindex and transitions[i].sum() > 0:
+                    self.settransitions(state, dict( (compiled.states[j], float(p)) for j, p in enumerate(transitions[i] / transitions[i].sum()) if p > 0 ))
+                if emissions[:-1,i].sum() > 0:
+                    self.setemission(state, dict( (compiled.observations.words[o], float(p)) for o, p in enumerate(emissions[:-1,i] / emissions[:-1,i].sum()) if p > 0 ))
+            if len(loglikelihoods) > 1 and loglikelihoods[-1] - loglikelihoods[-2] < tolerance:
+                break
+        return loglikelihoods
+
+    def compile(self):
+        """Returns a :class:`CompiledHiddenMarkovModel` for fast decoding. It is cached until the model changes."""
+        if self.compiled is None:
+            self.compiled = CompiledHiddenMarkovModel(self)
+        return self.compiled
+
+    def viterbi_log(self, observations):
+        """Viterbi decoding in log-space using the compiled model, returns a (log probability, path) tuple. The log probability uses base e."""
+        return self.compile().viterbi(observations)
+
+    def viterbi_batch(self, sequences):
+        """Viterbi decoding of many observation sequences at once using the compiled model, returns a list of (log probability, path) tuples"""
+        return self.compile().viterbi_batch(sequences)
+
+    def posteriors(self, observations):
+        """Computes the posterior probability of every state at every position, using the forward-backward algorithm on the compiled model. Returns a list with a dictionary (state -> probability) for every position."""
+        compiled = self.compile()
+        gamma, _ = compiled.posteriors(observations)
+        return [ dict( (state, float(p)) for state, p in zip(compiled.states, row) if p > 0 ) for row in gamma ]
 
     def print_dptable(self, V):
         print("    ",end="",file=stdout)
@@ -515,6 +1933,385 @@ class HiddenMarkovModel(MarkovChain):
 
 
 
+class CompiledHiddenMarkovModel(object):
+    """A compiled representation of a :class:`HiddenMarkovModel`, for fast decoding. States and observations are mapped to indices, and the start, transition and emission probabilities are stored as NumPy matrices in log-space, so long sequences do not underflow.
+
+    Usually obtained through :meth:`HiddenMarkovModel.compile`.
+
+    Arguments:
+        hmm (HiddenMarkovModel): The model to compile
+    """
+
+    def __init__(self, hmm):
+        if np is None:
+            raise ImportError("No numpy installed")
+        self.states = sorted(hmm.nodes, key=repr)
+        self.stateindex = dict( (state, i) for i, state in enumerate(self.states) )
+        self.observations = Vocabulary(sorted(hmm.observablenodes, key=repr))
+        S = len(self.states)
+        start = np.zeros(S)
+        transitions = np.zeros((S,S))
+        emissions = np.zeros((len(self.observations) + 1,S)) #transposed, one row per observation, the last row is for unknown observations
+        if hmm.startstate in hmm.edges_out:
+            for state, p in hmm.edges_out[hmm.startstate].items():
+                start[self.stateindex[state]] = p
+        for state, distribution in hmm.edges_out.items():
+            for nextstate, p in distribution.items():
+                transitions[self.stateindex[state], self.stateindex[nextstate]] = p
+        for state, distribution in hmm.edges_toobservables.items():
+            for observation, p in distribution.items():
+                emissions[self.observations.encode(observation), self.stateindex[state]] = p
+        self.start = start
+        self.transitions = transitions
+        self.emissions = emissions
+        self.endindex = self.stateindex.get(hmm.endstate) if hmm.endstate is not None else None
+        with np.errstate(divide='ignore'):
+            self.logstart = np.log(start)
+            self.logtransitions = np.log(transitions)
+            self.logemissions = np.log(emissions)
+
+    def encode(self, observations):
+        """Converts a sequence of observations to an array of observation indices, unknown observations map to an index with zero emission probability"""
+        unknown = len(self.observations)
+        ids = self.observations.ids
+        return np.array([ ids.get(observation, unknown) for observation in observations ], dtype=np.int64)
+
+    def viterbi(self, observations):
+        """Viterbi decoding, returns a (log probability, path) tuple. If no path is possible, the log probability is -inf and the path is empty."""
+        observations = self.encode(observations)
+        T = len(observations)
+        if T == 0:
+            return (float('-inf'), [])
+        S = len(self.states)
+        backpointers = np.zeros((T,S), dtype=np.int32)
+        delta = self.logstart + self.logemissions[observations[0]]
+        columns = np.arange(S)
+        for t in range(1,T):
+            scores = delta[:,np.newaxis] + self.logtransitions #previous state x state
+            backpointers[t] = scores.argmax(axis=0)
+            delta = scores[backpointers[t], columns] + self.logemissions[observations[t]]
+        return self._backtrack(delta, backpointers, T)
+
+    def _backtrack(self, delta, backpointers, T):
+        state = int(delta.argmax())
+        logprob = float(delta[state])
+        if logprob == float('-inf'):
+            return (logprob, [])
+        path = [state]
+        for t in range(T-1,0,-1):
+            state = int(backpointers[t,state])
+            path.append(state)
+        path.reverse()
+        return (logprob, [ self.states[i] for i in path ])
+
+    def viterbi_batch(self, sequences):
+        """Viterbi decoding of many observation sequences at once, all sequences are decoded simultaneously. Returns a list of (log probability, path) tuples."""
+        sequences = [ self.encode(observations) for observations in sequences ]
+        if not sequences:
+            return []
+        N = len(sequences)
+        S = len(self.states)
+        lengths = np.array([ len(observations) for observations in sequences ])
+        T = int(lengths.max())
+        if T == 0:
+            return [ (float('-inf'), []) for _ in sequences ]
+        unknown = len(self.observations)
+        padded = np.full((N,T), unknown, dtype=np.int64)
+        for i, observations in enumerate(sequences):
+            padded[i,:len(observations)] = observations
+        backpointers = np.zeros((N,T,S), dtype=np.int32)
+        delta = self.logstart + self.logemissions[padded[:,0]] #sequence x state
+        final = delta.copy() #delta at the last position of every sequence
+        columns = np.arange(S)
+        for t in range(1,T):
+            active = lengths > t
+            if not active.any():
+                break
+            scores = delta[active][:,:,np.newaxis] + self.logtransitions #sequence x previous state x state
+            pointers = scores.argmax(axis=1)
+            backpointers[active,t] = pointers
+            delta[active] = np.take_along_axis(scores, pointers[:,np.newaxis,:], axis=1)[:,0,:] + self.logemissions[padded[active,t]]
+            ending = lengths == t + 1
+            final[ending] = delta[ending]
+        results = []
+        for i, length in enumerate(lengths):
+            if length == 0:
+                results.append( (float('-inf'), []) )
+            else:
+                results.append( self._backtrack(final[i], backpointers[i], length) )
+        return results
+
+    def forward(self, observations):
+        """The scaled forward algorithm. Returns the scaled forward probabilities (position x state, every row sums to one) and the scaling factors; the log likelihood of the sequence is the sum of the logs of the scaling factors. Raises a ValueError if the sequence is impossible."""
+        observations = self.encode(observations)
+        T = len(observations)
+        S = len(self.states)
+        alpha = np.zeros((T,S))
+        scales = np.zeros(T)
+        for t in range(T):
+            if t == 0:
+                a = self.start * self.emissions[observations[0]]
+            else:
+                a = alpha[t-1].dot(self.transitions) * self.emissions[observations[t]]
+            scales[t] = a.sum()
+            if scales[t] == 0:
+                raise ValueError("Observation sequence has zero probability")
+            alpha[t] = a / scales[t]
+        return alpha, scales
+
+    def backward(self, observations, scales):
+        """The scaled backward algorithm, using the scaling factors from :meth:`forward`. Returns the scaled backward probabilities (position x state)."""
+        observations = self.encode(observations)
+        T = len(observations)
+        beta = np.zeros((T,len(self.states)))
+        if T:
+            beta[T-1] = 1.0
+        for t in range(T-2,-1,-1):
+            beta[t] = self.transitions.dot(self.emissions[observations[t+1]] * beta[t+1]) / scales[t+1]
+        return beta
+
+    def posteriors(self, observations):
+        """Computes the posterior marginals using the forward-backward algorithm. Returns an array (position x state) with the probability of every state at every position, and the log likelihood of the sequence."""
+        alpha, scales = self.forward(observations)
+        beta = self.backward(observations, scales)
+        return alpha * beta, float(np.log(scales).sum())
+
+    def expectations(self, sequences):
+        """Computes the expected counts for Baum-Welch training from a batch of observation sequences, using the scaled forward-backward algorithm on all sequences simultaneously. If the model has an end state that can be reached, every sequence ends with a transition to it, and the expected counts of these transitions are in the column of the end state. Sequences that are impossible under the model are ignored. Returns the summed expected start counts (per state), transition counts (state x state), emission counts (observation x state) and log likelihood."""
+        S = len(self.states)
+        sequences = [ self.encode(observations) for observations in sequences if len(observations) ]
+        start = np.zeros(S)
+        transitions = np.zeros((S,S))
+        emissions = np.zeros(self.emissions.shape)
+        if not sequences:
+            return start, transitions, emissions, 0.0
+        N = len(sequences)
+        lengths = np.array([ len(observations) for observations in sequences ])
+        T = int(lengths.max())
+        ids = np.full((N,T), len(self.observations), dtype=np.int64)
+        for i, observations in enumerate(sequences):
+            ids[i,:len(observations)] = observations
+        mask = np.arange(T)[np.newaxis,:] < lengths[:,np.newaxis] #sequence x position
+        alpha = np.zeros((N,T,S))
+        beta = np.zeros((N,T,S))
+        scales = np.ones((N,T))
+        impossible = np.zeros(N, dtype=bool)
+        #forward
+        for t in range(T):
+            active = mask[:,t]
+            if t == 0:
+                a = self.start * self.emissions[ids[:,0]]
+            else:
+                a = alpha[active,t-1].dot(self.transitions) * self.emissions[ids[active,t]]
+            scale = a.sum(axis=1)
+            zero = scale == 0
+            if zero.any():
+                impossible[np.flatnonzero(active)[zero]] = True
+                scale[zero] = 1.0
+            alpha[active,t] = a / scale[:,np.newaxis]
+            scales[active,t] = scale
+        #backward, starting from the transition to the end state (if any)
+        last = alpha[np.arange(N),lengths-1]
+        ending = self.endindex is not None and self.transitions[:,self.endindex].any()
+        if ending:
+            final = self.transitions[:,self.endindex]
+        else:
+            final = np.ones(S)
+        endscale = last.dot(final)
+        zero = endscale == 0
+        impossible |= zero
+        endscale[zero] = 1.0
+        beta[np.arange(N),lengths-1] = final[np.newaxis,:] / endscale[:,np.newaxis]
+        for t in range(T-2,-1,-1):
+            active = mask[:,t+1]
+            beta[active,t] = (self.emissions[ids[active,t+1]] * beta[active,t+1]).dot(self.transitions.T) / scales[active,t+1][:,np.newaxis]
+        alpha[impossible] = 0
+        gamma = alpha * beta
+        start = gamma[:,0].sum(axis=0)
+        np.add.at(emissions, ids[mask], gamma[mask])
+        if T > 1:
+            following = self.emissions[ids[:,1:]] * beta[:,1:] / scales[:,1:,np.newaxis]
+            transitions = alpha[:,:-1].reshape(-1,S).T.dot(following.reshape(-1,S)) * self.transitions
+        if ending:
+            transitions[:,self.endindex] += gamma[np.arange(N),lengths-1].sum(axis=0)
+        loglikelihood = float(np.log(scales[~impossible]).sum() + np.log(endscale[~impossible]).sum())
+        return start, transitions, emissions, loglikelihood
+
+    def loglikelihood(self, observations):
+        """Returns the log likelihood (base e) of the observation sequence, or -inf if it is impossible"""
+        try:
+            _, scales = self.forward(observations)
+        except ValueError:
+            return float('-inf')
+        return float(np.log(scales).sum())
+
+
+
+class MarkovChainGraph(object):
+    """A graph analysis of a :class:`MarkovChain`: states are mapped to indices, the strongly connected components are computed with Tarjan's algorithm and the transitive closure is stored as a bitset (an integer) per state, so reachability queries take constant time.
+
+    Usually obtained through :meth:`MarkovChain.analyse`.
+
+    Arguments:
+        chain (MarkovChain): The model to analyse
+    """
+
+    def __init__(self, chain):
+        self.states = sorted(chain.nodes, key=repr)
+        self.stateindex = dict( (state, i) for i, state in enumerate(self.states) )
+        self.successors = [ [] for state in self.states ] #adjacency list per state index, of (state index, probability) tuples
+        for state, distribution in chain.edges_out.items():
+            self.successors[self.stateindex[state]] = [ (self.stateindex[nextstate], p) for nextstate, p in distribution.items() if p > 0 ]
+        self.components, self.component = self._tarjan()
+        self.closure = self._closure()
+        self.shortestpaths = {} #cache of shortest path probabilities per source state index
+
+    def _tarjan(self):
+        """Iterative implementation of Tarjan's algorithm. Returns the list of components (lists of state indices, in reverse topological order) and the component index of every state"""
+        N = len(self.states)
+        index = [None] * N
+        lowlink = [0] * N
+        onstack = [False] * N
+        stack = []
+        components = []
+        component = [None] * N
+        counter = 0
+        for root in range(N):
+            if index[root] is not None:
+                continue
+            work = [(root, 0)]
+            while work:
+                node, i = work.pop()
+                if i == 0:
+                    index[node] = lowlink[node] = counter
+                    counter += 1
+                    stack.append(node)
+                    onstack[node] = True
+                successors = self.successors[node]
+                while i < len(successors):
+                    child = successors[i][0]
+                    i += 1
+                    if index[child] is None:
+                        work.append((node, i))
+                        work.append((child, 0))
+                        break
+                    elif onstack[child] and index[child] < lowlink[node]:
+                        lowlink[node] = index[child]
+                else:
+                    if lowlink[node] == index[node]:
+                        members = []
+                        while True:
+                            member = stack.pop()
+                            onstack[member] = False
+                            component[member] = len(components)
+                            members.append(member)
+                            if member == node:
+                                break
+                        components.append(members)
+                    if work:
+                        parent = work[-1][0]
+                        if lowlink[node] < lowlink[parent]:
+                            lowlink[parent] = lowlink[node]
+        return components, component
+
+    def _closure(self):
+        """Computes the bitset of states reachable in one or more steps, for every state, by propagating over the condensation of the graph in reverse topological order"""
+        reach = [0] * len(self.components)
+        for c, members in enumerate(self.components): #tarjan yields components in reverse topological order
+            bits = 0
+            for member in members:
+                bits |= 1 << member
+            cyclic = len(members) > 1 or any( child == members[0] for child, _ in self.successors[members[0]] )
+            r = bits if cyclic else 0
+            for member in members:
+                for child, _ in self.successors[member]:
+                    d = self.component[child]
+                    if d != c:
+                        r |= reach[d] | (1 << child)
+            reach[c] = r
+        return [ reach[c] for c in self.component ]
+
+    def reachable(self, fromstate, tostate):
+        """Can state tostate be reached (in one or more steps) from state fromstate?"""
+        try:
+            return bool((self.closure[self.stateindex[fromstate]] >> self.stateindex[tostate]) & 1)
+        except KeyError:
+            return False
+
+    def mutuallyreachable(self, state1, state2):
+        """Do the two states belong to the same strongly connected component (i.e. can each be reached from the other)?"""
+        try:
+            return self.component[self.stateindex[state1]] == self.component[self.stateindex[state2]] and self.reachable(state1, state2)
+        except KeyError:
+            return False
+
+    def shortestpath(self, fromstate, tostate):
+        """Returns the length and probability of the shortest path (in number of steps) from fromstate to tostate, or (None, 0) if there is no such path. Breadth-first search results are cached per source state."""
+        if not self.reachable(fromstate, tostate):
+            return None, 0
+        source = self.stateindex[fromstate]
+        if source not in self.shortestpaths:
+            paths = {}
+            frontier = [(source, 1.0)]
+            length = 0
+            while frontier:
+                length += 1
+                nextfrontier = []
+                for node, prob in frontier:
+                    for child, p in self.successors[node]:
+                        if child not in paths:
+                            paths[child] = (length, prob * p)
+                            nextfrontier.append((child, prob * p))
+                frontier = nextfrontier
+            self.shortestpaths[source] = paths
+        return self.shortestpaths[source][self.stateindex[tostate]]
+
+    def stationary(self, iterations = 1000, tolerance = 1e-12):
+        """Computes the stationary distribution of the chain by power iteration with a sparse transition matrix. States without outgoing transitions are treated as absorbing. The lazy chain (P+I)/2 is iterated, which has the same stationary distribution but also converges for periodic chains. For reducible chains, the result depends on the (uniform) initial distribution.
+
+        Returns:
+            :class:`Distribution` over all states
+        """
+        if np is None:
+            raise ImportError("No numpy installed")
+        N = len(self.states)
+        rows = []
+        columns = []
+        data = []
+        for node, successors in enumerate(self.successors):
+            total = sum( p for _, p in successors )
+            if not successors or total == 0:
+                successors = [(node, 1.0)]
+                total = 1.0
+            for child, p in successors:
+                rows.append(node)
+                columns.append(child)
+                data.append(p / total)
+        rows = np.array(rows, dtype=np.int64)
+        columns = np.array(columns, dtype=np.int64)
+        data = np.array(data)
+        x = np.full(N, 1.0 / N)
+        for _ in range(iterations):
+            step = np.bincount(columns, weights=x[rows] * data, minlength=N)
+            nextx = 0.5 * (x + step)
+            nextx /= nextx.sum()
+            converged = np.abs(nextx - x).sum() < tolerance
+            x = nextx
+            if converged:
+                break
+        return Distribution( dict( (state, float(p)) for state, p in zip(self.states, x) ) )
+
+
+def _baumwelch_init(compiled):
+    global _baumwelch_model #pylint: disable=global-statement
+    _baumwelch_model = compiled
+
+def _baumwelch_chunk(sequences):
+    """Sums the expected counts for a chunk of sequences, used in Baum-Welch training (possibly in a separate process)"""
+    return _baumwelch_model.expectations(sequences)
+
+
+
 # ********************* Common Functions ******************************
 
 def product(seq):
@@ -617,32 +2414,345 @@ def normalize(numbers, total=1.0):  #from AI: A Modern Appproach
 
 ###########################################################################################
 
+def _hashableword(word):
+    """Returns the word itself if it is a string, or its tokens as a tuple otherwise, so token sequences given as lists can be used as dictionary keys"""
+    if isstring(word) or isinstance(word, tuple):
+        return word
+    return tuple(word)
+
+def _levenshteinmasks(pattern):
+    """Computes the match bitmask of every symbol in the pattern (a string or a sequence of tokens), as used by the bit-parallel levenshtein algorithm"""
+    masks = {}
+    bit = 1
+    for symbol in pattern:
+        masks[symbol] = masks.get(symbol, 0) | bit
+        bit <<= 1
+    return masks
+
+def _levenshteinbitparallel(masks, m, s, maxdistance):
+    """Bit-parallel levenshtein distance (Myers 1999, in the formulation of Hyyro 2001) between a pattern of length m, given by its bitmasks, and sequence s. One column of the dynamic programming matrix is encoded in the vertical delta bitvectors Pv and Mv, Python integers are used so there is no limit on the pattern length. Returns maxdistance+1 as soon as the distance is known to exceed maxdistance."""
+    n = len(s)
+    if not m:
+        return n if maxdistance is None or n <= maxdistance else maxdistance + 1
+    full = (1 << m) - 1
+    last = 1 << (m - 1)
+    Pv = full
+    Mv = 0
+    score = m
+    remaining = n
+    get = masks.get
+    for symbol in s:
+        Eq = get(symbol, 0)
+        Xv = Eq | Mv
+        Xh = (((Eq & Pv) + Pv) ^ Pv) | Eq
+        Ph = Mv | (~(Xh | Pv) & full)
+        Mh = Pv & Xh
+        if Ph & last:
+            score += 1
+        elif Mh & last:
+            score -= 1
+        Ph = ((Ph << 1) | 1) & full
+        Mh = (Mh << 1) & full
+        Pv = Mh | (~(Xv | Ph) & full)
+        Mv = Ph & Xv
+        remaining -= 1
+        if maxdistance is not None and score - remaining > maxdistance:
+            return maxdistance + 1 #the distance can decrease by at most one per remaining symbol
+    if maxdistance is not None and score > maxdistance:
+        return maxdistance + 1
+    return score
+
 def levenshtein(s1, s2, maxdistance=9999):
-    """Computes the levenshtein distance between two strings. Adapted from:  http://en.wikibooks.org/wiki/Algorithm_Implementation/Strings/Levenshtein_distance#Python"""
+    """Computes the levenshtein distance between two strings or sequences of tokens, using a bit-parallel algorithm (Myers/Hyyro) that processes a full column of the distance matrix per step.
+
+    Arguments:
+        s1: The first string or token sequence
+        s2: The second string or token sequence
+        maxdistance (int): If the distance is greater than this value, computation is aborted early and maxdistance+1 is returned
+
+    Returns:
+        int
+    """
+    if len(s1) < len(s2):
+        s1, s2 = s2, s1
+    if maxdistance is not None and len(s1) - len(s2) > maxdistance:
+        return maxdistance + 1
+    return _levenshteinbitparallel(_levenshteinmasks(s2), len(s2), s1, maxdistance)
+
+def levenshtein_banded(s1, s2, maxdistance):
+    """Computes the levenshtein distance between two strings or sequences of tokens if it does not exceed maxdistance, otherwise maxdistance+1 is returned. Only the diagonal band of width 2*maxdistance+1 of the distance matrix is computed (Ukkonen), which makes this efficient for long sequences and small thresholds."""
     l1 = len(s1)
     l2 = len(s2)
+    if abs(l1 - l2) > maxdistance:
+        return maxdistance + 1
     if l1 < l2:
-        return levenshtein(s2, s1)
-    if not s1:
-        return len(s2)
-
-    #If the words differ too much in length,  (if  we have a low maxdistance) , we needn't bother compute distance:
-    if l1 > l2 + maxdistance:
-        return maxdistance+1
-
-    previous_row = list(range(l2 + 1))
-    for i, c1 in enumerate(s1):
-        current_row = [i + 1]
-        for j, c2 in enumerate(s2):
-            insertions = previous_row[j + 1] + 1 # j+1 instead of j since previous_row and current_row are one character longer
-            deletions = current_row[j] + 1       # than s2
-            substitutions = previous_row[j] + (c1 != c2)
-            current_row.append(min(insertions, deletions, substitutions))
-        if current_row[-1] > maxdistance:
-            return current_row[-1]
+        s1, s2, l1, l2 = s2, s1, l2, l1
+    limit = maxdistance + 1
+    previous_row = [ j if j <= maxdistance else limit for j in range(min(l2, maxdistance) + 1) ]
+    previous_begin = 0
+    for i in range(1, l1 + 1):
+        c1 = s1[i - 1]
+        begin = max(0, i - maxdistance)
+        end = min(l2, i + maxdistance)
+        current_row = []
+        for j in range(begin, end + 1):
+            if j == 0:
+                value = i
+            else:
+                value = current_row[-1] + 1 if j > begin else limit #insertion
+                k = j - previous_begin
+                if k < len(previous_row):
+                    deletion = previous_row[k] + 1
+                    if deletion < value:
+                        value = deletion
+                if k >= 1:
+                    substitution = previous_row[k - 1] + (c1 != s2[j - 1])
+                    if substitution < value:
+                        value = substitution
+            current_row.append(value if value < limit else limit)
+        if min(current_row) >= limit:
+            return limit
         previous_row = current_row
+        previous_begin = begin
+    return previous_row[l2 - previous_begin]
+
+def levenshtein_many(query, candidates, maxdistance=None):
+    """Computes the levenshtein distance between a query and many candidates (strings or token sequences). The bitmasks of the query are computed only once and candidates whose length differs too much are rejected without computation.
+
+    Arguments:
+        query: The query string or token sequence
+        candidates (iterable): The candidates to compare against
+        maxdistance (int): Distances greater than this value are reported as maxdistance+1 (default: None, compute all distances exactly)
+
+    Returns:
+        A list of distances, in the order of the candidates
+    """
+    masks = _levenshteinmasks(query)
+    m = len(query)
+    distances = []
+    for candidate in candidates:
+        if maxdistance is not None and abs(len(candidate) - m) > maxdistance:
+            distances.append(maxdistance + 1)
+        else:
+            distances.append(_levenshteinbitparallel(masks, m, candidate, maxdistance))
+    return distances
 
-    return previous_row[-1]
 
+class BKTree(object):
+    """A Burkhard-Keller tree: a metric tree over a set of words (strings or token sequences) under the levenshtein distance. Children are indexed by their distance to the parent, so the triangle inequality can be used to prune the search for all words within a given distance. Nodes are stored in flat lists rather than nested objects.
+
+    Arguments:
+        words (iterable): The words to index
+    """
 
+    def __init__(self, words = ()):
+        self.words = []
+        self.children = [] #per node: dictionary of distance => node index
+        for word in words:
+            self.add(word)
+
+    def add(self, word):
+        """Adds a word to the tree, returns False if it was already present"""
+        if not self.words:
+            self.words.append(word)
+            self.children.append({})
+            return True
+        node = 0
+        while True:
+            distance = levenshtein(word, self.words[node], None)
+            if distance == 0:
+                return False
+            child = self.children[node].get(distance)
+            if child is None:
+                self.children[node][distance] = len(self.words)
+                self.words.append(word)
+                self.children.append({})
+                return True
+            node = child
+
+    def __len__(self):
+        return len(self.words)
+
+    def find(self, word, maxdistance):
+        """Returns a list of (word, distance) tuples for all words within the specified distance, in no particular order"""
+        results = []
+        if not self.words:
+            return results
+        masks = _levenshteinmasks(word)
+        m = len(word)
+        stack = [0]
+        while stack:
+            node = stack.pop()
+            children = self.children[node]
+            #the exact distance is only needed up to the point where no child can qualify anymore
+            cutoff = (max(children) if children else 0) + maxdistance
+            candidate = self.words[node]
+            if abs(len(candidate) - m) > cutoff:
+                continue
+            distance = _levenshteinbitparallel(masks, m, candidate, cutoff)
+            if distance > cutoff:
+                continue
+            if distance <= maxdistance:
+                results.append( (candidate, distance) )
+            for childdistance, child in children.items():
+                if distance - maxdistance <= childdistance <= distance + maxdistance:
+                    stack.append(child)
+        return results
+
+
+class DeletionIndex(object):
+    """A symmetric deletion index (as in SymSpell) over a set of words (strings or token sequences): every word is indexed under all variants obtained by deleting up to maxdistance symbols. Two words within levenshtein distance k share a variant obtained with at most k deletions from each, so candidates are found with a few dictionary lookups and only those are verified. Fast for small distances, at the cost of memory.
+
+    Arguments:
+        words (iterable): The words to index
+        maxdistance (int): The maximum distance that can be queried
+    """
+
+    def __init__(self, words = (), maxdistance = 2):
+        self.maxdistance = maxdistance
+        self.words = []
+        self.index = {} #deletion variant => list of word indices
+        for word in words:
+            self.add(word)
+
+    @staticmethod
+    def deletions(word, maxdistance):
+        """Returns the set of all variants of the word (including the word itself) obtained by deleting up to maxdistance symbols"""
+        variants = set([word])
+        frontier = variants
+        for _ in range(maxdistance):
+            nextfrontier = set()
+            for variant in frontier:
+                for i in range(len(variant)):
+                    nextfrontier.add(variant[:i] + variant[i+1:])
+            nextfrontier -= variants
+            if not nextfrontier:
+                break
+            variants |= nextfrontier
+            frontier = nextfrontier
+        return variants
+
+    def add(self, word):
+        """Adds a word to the index, words are assumed to be unique. Token sequences are stored as tuples."""
+        word = _hashableword(word)
+        wordindex = len(self.words)
+        self.words.append(word)
+        for variant in self.deletions(word, self.maxdistance):
+            if variant in self.index:
+                self.index[variant].append(wordindex)
+            else:
+                self.index[variant] = [wordindex]
+
+    def __len__(self):
+        return len(self.words)
+
+    def find(self, word, maxdistance):
+        """Returns a list of (word, distance) tuples for all words within the specified distance, in no particular order"""
+        if maxdistance > self.maxdistance:
+            raise ValueError("Deletion index was built for a maximum distance of " + str(self.maxdistance) + ", can not query distance " + str(maxdistance))
+        word = _hashableword(word)
+        candidates = set()
+        for variant in self.deletions(word, maxdistance):
+            if variant in self.index:
+                candidates.update(self.index[variant])
+        masks = _levenshteinmasks(word)
+        m = len(word)
+        results = []
+        for candidate in candidates:
+            candidate = self.words[candidate]
+            if abs(len(candidate) - m) <= maxdistance:
+                distance = _levenshteinbitparallel(masks, m, candidate, maxdistance)
+                if distance <= maxdistance:
+                    results.append( (candidate, distance) )
+        return results
+
+
+class FuzzyLexicon(object):
+    """A lexicon of words with their frequencies that can be searched for all words within a given levenshtein distance, for instance to generate and rank spelling correction candidates.
+
+    Two index backends are available: ``deletion``, a symmetric deletion index (:class:`DeletionIndex`) that is very fast for small distances but whose memory grows quickly with the maximum distance, and ``bktree``, a :class:`BKTree` that is compact and supports arbitrary distances.
+
+    Arguments:
+        lexicon: A :class:`FrequencyList`, a dictionary of words to frequencies, or an iterable of words (each with frequency 1)
+        backend (str): ``deletion`` or ``bktree``
+        maxdistance (int): The default (and for the deletion backend also maximum) distance to search
+    """
 
+    def __init__(self, lexicon = None, backend = 'deletion', maxdistance = 2):
+        if backend == 'deletion':
+            self.index = DeletionIndex(maxdistance=maxdistance)
+        elif backend == 'bktree':
+            self.index = BKTree()
+        else:
+            raise ValueError("Unknown backend: " + str(backend))
+        self.backend = backend
+        self.maxdistance = maxdistance
+        self.frequencies = {}
+        if lexicon is not None:
+            self.update(lexicon)
+
+    def add(self, word, frequency = 1):
+        """Adds a word to the lexicon, or increases its frequency if it is already present. Token sequences are stored as tuples."""
+        word = _hashableword(word)
+        if word in self.frequencies:
+            self.frequencies[word] += frequency
+        else:
+            self.frequencies[word] = frequency
+            self.index.add(word)
+
+    def update(self, lexicon):
+        """Adds all words from a :class:`FrequencyList`, a dictionary of words to frequencies, or an iterable of words"""
+        if hasattr(lexicon, 'items'):
+            for word, frequency in lexicon.items():
+                self.add(word, frequency)
+        else:
+            for word in lexicon:
+                self.add(word)
+
+    def __len__(self):
+        return len(self.frequencies)
+
+    def __contains__(self, word):
+        return _hashableword(word) in self.frequencies
+
+    def __iter__(self):
+        return iter(self.frequencies)
+
+    def __getitem__(self, word):
+        """Returns the frequency of the word"""
+        return self.frequencies[_hashableword(word)]
+
+    def find(self, word, maxdistance = None, limit = None):
+        """Finds all words in the lexicon within the specified levenshtein distance of the given word.
+
+        Arguments:
+            word: The word to search for
+            maxdistance (int): The maximum distance (defaults to the maximum distance of the lexicon)
+            limit (int): Return at most this many results
+
+        Returns:
+            A list of (word, distance, frequency) tuples, ranked by increasing distance, then decreasing frequency, then alphabetically
+        """
+        if maxdistance is None:
+            maxdistance = self.maxdistance
+        results = [ (match, distance, self.frequencies[match]) for match, distance in self.index.find(word, maxdistance) ]
+        results.sort(key=lambda x: (x[1], -x[2], x[0]))
+        if limit is not None:
+            results = results[:limit]
+        return results
+
+    def save(self, filename):
+        """Saves the lexicon and its index to file (pickled), so it can be loaded without rebuilding the index"""
+        f = open(filename,'wb')
+        pickle.dump( {'backend': self.backend, 'maxdistance': self.maxdistance, 'frequencies': self.frequencies, 'index': self.index}, f, pickle.HIGHEST_PROTOCOL)
+        f.close()
+
+    def load(self, filename):
+        """Loads a lexicon and its index from file (as produced by the save method), replacing the current contents"""
+        f = open(filename,'rb')
+        data = pickle.load(f)
+        f.close()
+        self.backend = data['backend']
+        self.maxdistance = data['maxdistance']
+        self.frequencies = data['frequencies']
+        self.index = data['index']
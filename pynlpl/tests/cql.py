@@ -153,5 +153,53 @@ class Test1(unittest.TestCase):
         self.assertEqual(result[1][1]['word'],"new")
         self.assertEqual(result[1][2]['word'],"module")
 
+class Test2DFA(unittest.TestCase):
+    def test1_find(self):
+        """Single-pass DFA find equals running the NFA from every offset"""
+        for s in ("[ pos = \"det\" ] []* [ pos = \"n\" ]", "[ pos != \"n\" ]+", "[]{1,3} [ word = \"t.*\" ]", "[ pos = \"det\" ]? [ pos = \"a\" ]* [ pos = \"n\" ]"):
+            nfa = cql.Query(s).nfa()
+            expected = [ tokens[i:i+length] for i in range(len(tokens)) for length in nfa.run(tokens[i:]) ]
+            self.assertEqual(list(nfa.compile().find(tokens)), expected)
+
+    def test2_match(self):
+        """DFA match and state caching"""
+        dfa = cql.Query("[ pos = \"det\" ] []* [ pos = \"n\" ]").nfa().compile()
+        self.assertTrue(dfa.match(tokens[2:5]))
+        self.assertFalse(dfa.match(tokens[2:6]))
+        self.assertFalse(dfa.match([]))
+        states = len(dfa.states)
+        self.assertTrue(dfa.match(tokens[2:5]))
+        self.assertEqual(len(dfa.states), states)
+
+class Test3Index(unittest.TestCase):
+    def setUp(self):
+        self.sequences = [tokens, tokens[:4], [], tokens[5:]]
+        self.index = cql.CQLIndex(self.sequences)
+
+    def test1_index(self):
+        """CQLIndex - Postings"""
+        self.assertEqual(len(self.index), 10 + 4 + 5)
+        self.assertEqual(self.index.sequences(), 4)
+        self.assertEqual(self.index.sequence(1), tokens[:4])
+        self.assertEqual(list(self.index.postings['pos'][self.index.ids['pos']['det']]), [0,2,6,10,12,15])
+
+    def test2_query(self):
+        """CQLIndex - Queries equal running the query on every sequence"""
+        for s in ("[ pos = \"det\" ] []* [ pos = \"n\" ]", "[]{1,3} [ word = \"t.*\" ]", "[ pos = \"det\" ]? [ pos = \"a\" ]* [ pos = \"n\" ]", "[ pos != \"n\" ]", "[ lemma = \"a|new\" ] [ pos = \"n\" & word = \"module\" ]", "\"nonexistent\""):
+            q = cql.Query(s)
+            expected = [ match for sequence in self.sequences if sequence for match in q(sequence) ]
+            self.assertEqual(q(self.index), expected)
+
+    def test3_find(self):
+        """CQLIndex - Find offsets"""
+        self.assertEqual(list(self.index.find("[ pos = \"det\" ] [ pos = \"a\" ] [ pos = \"n\" ]")), [(0,2,5),(0,6,9),(3,1,4)])
+
+    def test4_partial(self):
+        """CQLIndex - Partially annotated tokens"""
+        index = cql.CQLIndex([[{'word':'the','pos':'det'},{'word':'house'}]])
+        self.assertEqual(index.token(1), {'word':'house','pos':'','lemma':''})
+        self.assertEqual(list(index.find('[ pos = "det" ] [ pos != "n" ]')), [(0,0,2)])
+        self.assertEqual(list(index.find('[ lemma != "house" ]+')), [(0,0,1),(0,0,2),(0,1,2)])
+
 if __name__ == '__main__':
     unittest.main()
@@ -10,9 +10,13 @@ from pynlpl.common import u
 import os
 import sys
 import unittest
+import tempfile
+import shutil
 
 
-from pynlpl.datatypes import PriorityQueue
+from pynlpl.datatypes import PriorityQueue, CompactTrie, SuffixArray
+if sys.version > '3':
+    from pynlpl.datatypes import ClassEncoder, ClassDecoder, Pattern, PatternModel
 
 values = [3,6,6,1,8,2]
 mintomax = sorted(values)
@@ -70,6 +74,198 @@ class PriorityQueueTest(unittest.TestCase):
         result = list(iter(pq))
         self.assertEqual(result, maxtomin[:4])                
 
+    def test_pop(self):
+        """Popping from PriorityQueue"""
+        global values
+        for minimize, length in ((True,0),(False,0),(True,4),(False,4)):
+            pq = PriorityQueue(values, lambda x: x, minimize, length, False, False)
+            expected = mintomax if minimize else maxtomin
+            if length: expected = expected[:length]
+            self.assertEqual( [ pq.pop() for _ in range(len(pq)) ], expected)
+            self.assertEqual( len(pq), 0)
+
+    def test_indexing(self):
+        """Indexing, slicing and scores of PriorityQueue"""
+        global values
+        pq = PriorityQueue(values, lambda x: x * 10, False, 0, False, False)
+        self.assertEqual( pq[0], 8)
+        self.assertEqual( pq[-1], 1)
+        self.assertEqual( pq.score(1), 60)
+        self.assertEqual( list(pq[1:3]), [6,6])
+        pq.append(7)
+        self.assertEqual( pq[1], 7)
+
+    def test_duplicates(self):
+        """PriorityQueue without duplicates"""
+        pq = PriorityQueue([3,1,3,2,1], lambda x: x, True, 0, False, False, False)
+        self.assertEqual( list(pq), [1,2,3])
+        self.assertEqual( pq.pop(), 1)
+        self.assertTrue( pq.append(1) )
+        self.assertFalse( pq.append(2) )
+
+    def test_prune(self):
+        """Pruning PriorityQueue"""
+        global values
+        pq = PriorityQueue(values, lambda x: x, False, 0, False, False)
+        pq.prunebyscore(3, retainequalscore=True)
+        self.assertEqual( list(pq), [8,6,6,3])
+        pq.prune(2)
+        self.assertEqual( list(pq), [8,6])
+        pq = PriorityQueue(values, lambda x: x, True, 4, False, False)
+        pq.prune(2)
+        self.assertEqual( list(pq), [1,2])
+
+
+class CompactTrieTest(unittest.TestCase):
+    def setUp(self):
+        self.words = ['a','an','and','ant','bee','been','beer']
+        self.trie = CompactTrie(self.words)
+
+    def test_lookup(self):
+        """Compact trie lookup"""
+        self.assertEqual( len(self.trie), 7)
+        self.assertTrue( 'ant' in self.trie )
+        self.assertFalse( 'be' in self.trie )
+        self.assertFalse( 'zebra' in self.trie )
+        self.assertEqual( self.trie['been'], 5)
+        self.assertEqual( self.trie.get('b'), None)
+        self.assertRaises( KeyError, self.trie.__getitem__, 'b')
+
+    def test_prefix(self):
+        """Compact trie prefix search"""
+        self.assertEqual( list(self.trie.startswith('be')), [('bee',4),('been',5),('beer',6)])
+        self.assertEqual( [ word for word, _ in self.trie ], self.words)
+        self.assertEqual( self.trie.longestprefix('android'), (3,2))
+        self.assertEqual( list(self.trie.prefixes('android')), [(1,0),(2,1),(3,2)])
+        self.assertEqual( self.trie.longestprefix('cat'), (0,None))
+
+    def test_tokens(self):
+        """Compact trie over token sequences"""
+        trie = CompactTrie([('the','cat'),('the','cat','sat'),('the','dog')], [10,20,30])
+        self.assertEqual( trie[('the','cat')], 10)
+        self.assertEqual( trie.longestprefix(['the','cat','sat','down']), (3,20))
+        self.assertEqual( list(trie.startswith(('the',))), [(('the','cat'),10),(('the','cat','sat'),20),(('the','dog'),30)])
+        self.assertFalse( ('the',) in trie )
+
+    def test_unsorted(self):
+        """Compact trie from unsorted input"""
+        self.assertRaises( ValueError, CompactTrie, ['b','a'])
+
+    def test_save(self):
+        """Saving and memory mapping compact trie"""
+        tmpdir = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(tmpdir, 'trie.bin')
+            self.trie.save(filename)
+            trie = CompactTrie()
+            trie.load(filename)
+            self.assertEqual( list(trie), list(self.trie))
+            self.assertEqual( trie['been'], 5)
+            self.assertEqual( trie.longestprefix('beers'), (4,6))
+        finally:
+            shutil.rmtree(tmpdir)
+
+
+@unittest.skipIf(sys.version < '3', "Patterns are only available on Python 3")
+class PatternModelTest(unittest.TestCase):
+    def setUp(self):
+        self.corpus = [ "to be or not to be".split(), "to be is to do".split(), "not to be".split() ]
+        self.classencoder = ClassEncoder()
+        self.classencoder.build(self.corpus)
+        self.classdecoder = self.classencoder.decoder()
+
+    def test_classencoder(self):
+        """Class encoding and decoding"""
+        self.assertEqual( self.classencoder.classes['to'], 2) #most frequent word gets the first class
+        pattern = self.classencoder.encode("to be or unknown")
+        self.assertEqual( len(pattern), 4)
+        self.assertEqual( self.classdecoder.decode(pattern), "to be or {?}")
+        self.assertEqual( self.classdecoder.decode(pattern[1:3]), "be or")
+        self.assertEqual( str(Pattern(pattern[0].data, self.classdecoder)), "to")
+
+    def test_ngrams(self):
+        """Counting n-grams in pattern model"""
+        model = PatternModel(self.classencoder, self.classdecoder)
+        model.train(self.corpus, threshold=2, maxlength=3)
+        counts = dict( (str(pattern), count) for pattern, count in model.items() )
+        self.assertEqual( counts, {'to': 5, 'be': 4, 'not': 2, 'to be': 4, 'not to': 2, 'not to be': 2})
+
+    def test_skipgrams(self):
+        """Counting skipgrams in pattern model"""
+        model = PatternModel(self.classencoder, self.classdecoder)
+        model.train(self.corpus, threshold=2, maxlength=3, skipgrams=True)
+        self.assertEqual( [ str(pattern) for pattern in model if pattern.isskipgram() ], ["not {*} be"])
+        self.assertEqual( model[Pattern.fromstring("not {*} be", self.classencoder)], 2)
+        self.assertFalse( Pattern.fromstring("be {*} not", self.classencoder) in model ) #occurs only once
+
+    def test_save(self):
+        """Saving and loading class encoder and pattern model"""
+        model = PatternModel(self.classencoder, self.classdecoder)
+        model.train(self.corpus, threshold=2, maxlength=3)
+        tmpdir = tempfile.mkdtemp()
+        try:
+            self.classencoder.save(os.path.join(tmpdir, 'classes'))
+            model.save(os.path.join(tmpdir, 'model'))
+            classencoder = ClassEncoder(os.path.join(tmpdir, 'classes'))
+            classdecoder = ClassDecoder(os.path.join(tmpdir, 'classes'))
+            loaded = PatternModel(classencoder, classdecoder, filename=os.path.join(tmpdir, 'model'))
+            self.assertEqual( dict(loaded.items()), dict(model.items()))
+            self.assertEqual( loaded[classencoder.encode("not to be")], 2)
+        finally:
+            shutil.rmtree(tmpdir)
+
+
+class SuffixArrayTest(unittest.TestCase):
+    def setUp(self):
+        self.tokens = "the cat sat on the mat and the cat ran".split()
+        self.index = SuffixArray(self.tokens)
+
+    def test_suffixes(self):
+        """Suffix array and LCP construction"""
+        suffixes = sorted(range(len(self.tokens)), key=lambda i: self.tokens[i:])
+        self.assertEqual( self.index.suffixes.tolist(), suffixes)
+        self.assertEqual( self.index.lcp.tolist(), [0,0,1,0,0,0,0,0,2,1])
+
+    def test_lcp(self):
+        """LCP construction on a repetitive corpus"""
+        corpus = [0,1,0,1,1,0,1,0,1,1,0,1,0,0,1]
+        index = SuffixArray(corpus)
+        suffixes = index.suffixes.tolist()
+        for i in range(1, len(suffixes)):
+            a = corpus[suffixes[i-1]:]
+            b = corpus[suffixes[i]:]
+            length = 0
+            while length < min(len(a), len(b)) and a[length] == b[length]:
+                length += 1
+            self.assertEqual( index.lcp[i], length)
+
+    def test_count(self):
+        """Counting and locating phrases in suffix array"""
+        self.assertEqual( self.index.count("the"), 3)
+        self.assertEqual( self.index.count("the cat"), 2)
+        self.assertEqual( self.index.count(["cat","ran"]), 1)
+        self.assertEqual( self.index.count("the dog"), 0)
+        self.assertEqual( self.index.locate("the cat").tolist(), [0,7])
+        self.assertEqual( list(self.index.kwic("cat", 1)), [(('the',),('cat',),('sat',)), (('the',),('cat',),('ran',))])
+
+    def test_repeats(self):
+        """Enumerating repeated phrases in suffix array"""
+        self.assertEqual( sorted(self.index.repeats()), [(('cat',),2), (('the',),3), (('the','cat'),2)])
+        self.assertEqual( list(SuffixArray([1,2,1,2,1]).repeats(2)), [((1,2,1),2), ((2,1),2)])
+
+    def test_save(self):
+        """Saving and memory mapping suffix array"""
+        tmpdir = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(tmpdir, 'index')
+            self.index.save(filename)
+            index = SuffixArray()
+            index.load(filename)
+            self.assertEqual( index.count("the cat"), 2)
+            self.assertEqual( sorted(index.repeats()), sorted(self.index.repeats()))
+        finally:
+            shutil.rmtree(tmpdir)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -29,6 +29,9 @@ import sys
 import os
 import unittest
 import io
+import json
+import tempfile
+import shutil
 from pynlpl.formats import fql, folia, cql
 
 Q1 = 'SELECT pos WHERE class = "n" FOR w WHERE text = "house" AND class != "punct" RETURN focus'
@@ -831,6 +834,55 @@ class Test3Evaluation(unittest.TestCase):
         self.assertEqual(list(results[0].annotation(folia.Headspan).wrefs()), [ results[0].doc['WR-P-E-J-0000000001.p.1.s.1.w.3'], results[0].doc['WR-P-E-J-0000000001.p.1.s.1.w.4'], results[0].doc['WR-P-E-J-0000000001.p.1.s.1.w.5'] ] )
         self.assertEqual(results[0].ancestor(folia.AbstractStructureElement).id,  'WR-P-E-J-0000000001.p.1.s.1')
 
+    def test40a_stream_json(self):
+        """Streaming JSON output"""
+        for qs in (Qselect_focus, Qcontext2, "SELECT w FOR SPAN w WHERE (pos HAS class CONTAINS \"ADJ(\") & w WHERE (pos HAS class CONTAINS \"N(\")"):
+            q = fql.Query(qs + " FORMAT json")
+            self.assertEqual("".join(q.stream(folia.Document(string=FOLIAEXAMPLE))), q(folia.Document(string=FOLIAEXAMPLE)))
+
+    def test40b_stream_xml(self):
+        """Writing XML output to a stream"""
+        q = fql.Query(Qselect_target + " FORMAT xml")
+        f = io.StringIO()
+        q.write(self.doc, f)
+        self.assertEqual(f.getvalue(), q(folia.Document(string=FOLIAEXAMPLE)))
+
+    def test40c_stream_jsonl(self):
+        """JSON Lines output"""
+        q = fql.Query(Qselect_focus + " FORMAT jsonl")
+        lines = q(self.doc).splitlines()
+        self.assertEqual(len(lines),2)
+        for line in lines:
+            self.assertEqual(json.loads(line)['type'], 'lemma')
+
+    def test40d_stream_python(self):
+        """Streaming python output"""
+        q = fql.Query(Qselect_focus)
+        results = list(q.stream(self.doc))
+        self.assertEqual(len(results),2)
+        self.assertTrue(isinstance(results[0], folia.LemmaAnnotation))
+        self.assertTrue(isinstance(results[1], folia.LemmaAnnotation))
+
+    def test41a_index(self):
+        """Index-backed selection yields the same as a full scan"""
+        for qs in (Qselect_focus, Qselect_target, Qhas, Qhas_shortcut, Qboolean, "SELECT w WHERE text = \"terweil\""):
+            expected = [ e.id for e in fql.Query(qs)(folia.Document(string=FOLIAEXAMPLE)) ]
+            doc = folia.Document(string=FOLIAEXAMPLE)
+            fql.DocumentIndex(doc)
+            self.assertEqual([ e.id for e in fql.Query(qs)(doc) ], expected)
+
+    def test41b_index_invalidation(self):
+        """Index is invalidated by editing queries"""
+        fql.DocumentIndex(self.doc)
+        q = "SELECT w WHERE :lemma = \"stamboom\""
+        self.assertEqual(len(fql.Query(q)(self.doc)),2)
+        edited = fql.Query(Qedit)(self.doc)
+        self.assertEqual(len(fql.Query(q)(self.doc)),2 - len(edited))
+        count = len(fql.Query("SELECT w WHERE text = \"terwijl\"")(self.doc))
+        edited = fql.Query(Qedittext)(self.doc)
+        self.assertEqual(len(fql.Query("SELECT w WHERE text = \"terweil\"")(self.doc)),0)
+        self.assertEqual(len(fql.Query("SELECT w WHERE text = \"terwijl\"")(self.doc)),count + len(edited))
+
 
 
 class Test4CQL(unittest.TestCase):
@@ -993,6 +1045,48 @@ class Test4Evaluation(unittest.TestCase):
         self.assertEqual(results[0][1].text(), "on")
         self.assertEqual(results[0][2].text(), "weer")
 
+class Test5CorpusQuery(unittest.TestCase):
+    """Parallel queries over a corpus"""
+    def setUp(self):
+        self.corpusdir = tempfile.mkdtemp()
+        for i in range(3):
+            with io.open(os.path.join(self.corpusdir, 'doc' + str(i) + '.folia.xml'),'w',encoding='utf-8') as f:
+                f.write(FOLIAEXAMPLE)
+
+    def tearDown(self):
+        shutil.rmtree(self.corpusdir)
+
+    def test1_select(self):
+        """Corpus query - Select, in order"""
+        results = list(fql.CorpusQuery([Qselect_focus, Qselect_target + " FORMAT xml"], self.corpusdir, threads=2))
+        self.assertEqual([ os.path.basename(filename) for filename, _ in results ], ['doc0.folia.xml','doc1.folia.xml','doc2.folia.xml'])
+        for _, (lemmas, words) in results:
+            self.assertEqual(len(lemmas), 2)
+            self.assertEqual(lemmas[0]['class'], 'stamboom')
+            self.assertEqual(len(words), 2)
+            self.assertTrue(words[0].startswith('<result>'))
+
+    def test2_limit(self):
+        """Corpus query - Limit"""
+        results = list(fql.CorpusQuery(Qselect_focus, self.corpusdir, threads=2, limit=3))
+        self.assertEqual([ len(lemmas) for _, (lemmas,) in results ], [2,1])
+
+    def test3_edit(self):
+        """Corpus query - Edit and save"""
+        results = list(fql.CorpusQuery(Qedit, self.corpusdir, threads=2))
+        self.assertEqual(len(results), 3)
+        for filename, _ in results:
+            doc = folia.Document(file=filename)
+            self.assertEqual(len(fql.Query(Qselect_focus)(doc)), 1)
+
+    def test4_edit_stopped(self):
+        """Corpus query - Edit and save, stopped early"""
+        for filename, _ in fql.CorpusQuery(Qedit, self.corpusdir, threads=2):
+            break
+        for filename in fql.CorpusQuery(Qedit, self.corpusdir).files():
+            doc = folia.Document(file=filename) #all documents are complete
+            self.assertEqual(len(fql.Query(Qselect_focus)(doc)), 1)
+
 if os.path.exists('../../FoLiA'):
     FOLIAPATH = '../../FoLiA/'
 elif os.path.exists('../FoLiA'):
@@ -19,7 +19,7 @@ import unittest
 sys.path.append(sys.path[0] + '/../../')
 os.environ['PYTHONPATH'] = sys.path[0] + '/../../'
 
-from pynlpl.search import AbstractSearchState, DepthFirstSearch, BreadthFirstSearch, IterativeDeepening, HillClimbingSearch, BeamSearch
+from pynlpl.search import AbstractSearchState, DepthFirstSearch, BreadthFirstSearch, IterativeDeepening, HillClimbingSearch, BeamSearch, AStarSearch, DigestVisitedStore, BloomVisitedStore, LRUVisitedStore
 
 
 class ReorderSearchState(AbstractSearchState):
@@ -75,6 +75,66 @@ class InformedReorderSearchState(ReorderSearchState):
                 newtokens += self.tokens[i+2:]
             yield InformedReorderSearchState(newtokens, self.goal, self)
 
+class GridSearchState(AbstractSearchState):
+    """Walks over a grid in which some cells are walls and every step costs the weight of the cell entered"""
+
+    def __init__(self, grid, x, y, goal, parent = None, cost = 0):
+        self.grid = grid
+        self.x = x
+        self.y = y
+        self.goal = goal
+        super(GridSearchState, self).__init__(parent, cost)
+
+    def expand(self):
+        for dx, dy in ((1,0),(0,1),(-1,0),(0,-1)):
+            x = self.x + dx
+            y = self.y + dy
+            if 0 <= y < len(self.grid) and 0 <= x < len(self.grid[y]) and self.grid[y][x] != '#':
+                yield GridSearchState(self.grid, x, y, self.goal, self, int(self.grid[y][x]))
+
+    def score(self):
+        #Manhattan distance: admissible, as each step costs at least one
+        return abs(self.goal[0] - self.x) + abs(self.goal[1] - self.y)
+
+    def test(self, goalstates = None):
+        return (self.x, self.y) == self.goal
+
+    def __hash__(self):
+        return hash((self.x, self.y))
+
+    def __eq__(self, other):
+        return (self.x, self.y) == (other.x, other.y)
+
+    def __str__(self):
+        return str((self.x, self.y))
+
+class GraphSearchState(AbstractSearchState):
+    def __init__(self, graph, node, parent = None, cost = 0):
+        self.graph = graph
+        self.node = node
+        super(GraphSearchState, self).__init__(parent, cost)
+
+    def expand(self):
+        for node, cost in self.graph[self.node]:
+            yield GraphSearchState(self.graph, node, self, cost)
+
+    def __hash__(self):
+        return hash(self.node)
+
+    def __eq__(self, other):
+        return self.node == other.node
+
+    def __str__(self):
+        return self.node
+
+grid = [
+    "1111111",
+    "1#####1",
+    "1119111",
+    "1#1#1#1",
+    "1115111",
+]
+
 inputstate = ReorderSearchState("a This test . sentence is".split(' '))
 goalstate = ReorderSearchState("This is a test sentence .".split(' '))
 
@@ -108,7 +168,84 @@ class IterativeDeepeningTest(unittest.TestCase):
         solution = search.searchfirst()
         #print "It.Deep:", search.traversalsize(), "nodes visited |",
         self.assertEqual(solution, goalstate)
+        self.assertEqual(solution.depth(), BreadthFirstSearch(inputstate, graph=True, goal=goalstate).searchfirst().depth())
 
+    def test_transpositions(self):
+        """Iterative Deepening DFS with a transposition table"""
+        global inputstate, goalstate
+        search = IterativeDeepening(inputstate, graph=True, goal=goalstate)
+        solution = search.searchfirst()
+        for size in (50, 100000):
+            cachedsearch = IterativeDeepening(inputstate, graph=True, goal=goalstate, transpositions=size)
+            cachedsolution = cachedsearch.searchfirst()
+            self.assertEqual(cachedsolution, solution)
+            self.assertEqual(cachedsolution.depth(), solution.depth())
+            self.assertTrue(len(cachedsearch.table) <= size)
+            self.assertTrue(cachedsearch.stats.hitrate > 0)
+            self.assertTrue(cachedsearch.stats.expanded < search.stats.expanded)
+
+    def test_tree(self):
+        """Iterative Deepening DFS on a tree yields every goal path once"""
+        global inputstate
+        for transpositions in (0, 1000):
+            search = IterativeDeepening(inputstate, tree=True, maxdepth=2, transpositions=transpositions)
+            solutions = [ str(state) for state in search ] #every state is a goal state
+            self.assertEqual(len(solutions), 1 + 5 + 5*5)
+            self.assertEqual(search.stats.iterations, 3)
+
+
+class VisitedStoreTest(unittest.TestCase):
+    def test_exact(self):
+        """Breadth First Search with exact visited stores"""
+        global inputstate, goalstate
+        search = BreadthFirstSearch(inputstate, graph=True, keeptraversal=True)
+        traversal = [ str(state) for state in search ]
+        for visited in ('digest', 'lru', DigestVisitedStore(4)):
+            search = BreadthFirstSearch(inputstate, graph=True, keeptraversal=True, visited=visited)
+            self.assertEqual([ str(state) for state in search ], traversal)
+            self.assertEqual(search.memoryusage()['visited'] > 0, True)
+        search = BreadthFirstSearch(inputstate, graph=True, visited='bloom', errorrate=0.0001, goal=goalstate)
+        self.assertEqual(search.searchfirst(), goalstate)
+
+    def test_digest(self):
+        """Digest store is exact and more compact than a set"""
+        store = DigestVisitedStore()
+        for i in range(0,20000,2):
+            store.add(i)
+        self.assertEqual(len(store), 10000)
+        self.assertTrue(all( i in store for i in range(0,20000,2) ))
+        self.assertFalse(any( i in store for i in range(1,20000,2) ))
+        search = BreadthFirstSearch(inputstate, graph=True)
+        for i in range(0,20000,2):
+            search._visited.add(i)
+        self.assertTrue(store.memory() < search.memoryusage()['visited'])
+        store = DigestVisitedStore(5000)
+        size = len(store.table)
+        store.add(1)
+        store.clear()
+        self.assertEqual(len(store), 0)
+        self.assertEqual(len(store.table), size)
+
+    def test_bloom(self):
+        """Scalable Bloom filter keeps its false positive rate"""
+        store = BloomVisitedStore(1000, 0.01)
+        for i in range(0,40000,2):
+            store.add(i)
+        self.assertTrue(len(store) > 0.99 * 20000) #states that test positive before being added are not counted
+        self.assertTrue(all( i in store for i in range(0,40000,2) ))
+        falsepositives = sum( i in store for i in range(1,40000,2) )
+        self.assertTrue(falsepositives < 0.01 * 20000)
+
+    def test_lru(self):
+        """LRU store forgets the least recently used states"""
+        store = LRUVisitedStore(3)
+        for i in (1,2,3):
+            store.add(i)
+        self.assertTrue(1 in store) #1 is now the most recently used
+        store.add(4)
+        self.assertEqual(len(store), 3)
+        self.assertFalse(2 in store)
+        self.assertTrue(all( i in store for i in (1,3,4) ))
 
 
 informedinputstate = InformedReorderSearchState("a This test . sentence is".split(' '), goalstate)
@@ -169,8 +306,116 @@ class BeamSearchTest(unittest.TestCase):
         search = BeamSearch(informedinputstate, beamsize=3, graph=True, minimize=True,debug=False)
         solution = search.searchbest()
         self.assertEqual(str(solution),str(goalstate))
-        
-        
+
+    def test_batched(self):
+        """Beam Search with batch scoring and concurrent expansion (beam=3, minimize)"""
+        goalstate = InformedReorderSearchState("This is supposed to be a very long sentence .".split(' '))
+        informedinputstate = InformedReorderSearchState("a long very . sentence supposed to be This is".split(' '), goalstate)
+        batches = []
+        def scorer(states):
+            batches.append(len(states))
+            return [ state.score() for state in states ]
+        search = BeamSearch(informedinputstate, beamsize=3, graph=True, minimize=True, keeptraversal=True)
+        serial = [ str(state) for state in search ]
+        serialtraversal = [ str(state) for state in search.traversal() ]
+        try:
+            from concurrent.futures import ThreadPoolExecutor
+        except ImportError: #Python 2 without the futures backport
+            self.skipTest("concurrent.futures not available")
+        with ThreadPoolExecutor(4) as executor:
+            search = BeamSearch(informedinputstate, beamsize=3, graph=True, minimize=True, keeptraversal=True, scorer=scorer, executor=executor)
+            self.assertEqual([ str(state) for state in search ], serial)
+        self.assertEqual([ str(state) for state in search.traversal() ], serialtraversal)
+        self.assertTrue(all( size > 1 for size in batches[:-1] ))
+        search = BeamSearch(informedinputstate, beamsize=3, graph=True, minimize=True, scorer=scorer)
+        self.assertEqual(str(search.searchbest()), str(goalstate))
+
+
+
+class SearchStatisticsTest(unittest.TestCase):
+    def test_counters(self):
+        """Search statistics are kept for every search"""
+        global inputstate, goalstate
+        search = BreadthFirstSearch(inputstate, graph=True, goal=goalstate)
+        search.searchfirst()
+        self.assertEqual(search.stats.expanded, search.traversalsize() - 1) #the goal is returned before expansion
+        self.assertEqual(search.stats.generated, 5 * search.stats.expanded) #every state has five successors
+        self.assertTrue(search.stats.duplicates > 0)
+        self.assertEqual(search.stats['solutions'], 1)
+        self.assertEqual(search.stats.fringesizes, []) #not instrumented
+
+    def test_instrument(self):
+        """Instrumented beam search with a callback per round"""
+        global informedinputstate, goalstate
+        rounds = []
+        search = BeamSearch(informedinputstate, beamsize=2, graph=True, minimize=True, instrument=True, callback=lambda stats: rounds.append(stats.expanded))
+        solutions = search.searchall()
+        stats = search.stats
+        self.assertEqual(stats.rounds, len(rounds))
+        self.assertEqual(len(stats.fringesizes), stats.rounds)
+        self.assertTrue(all( size <= 2 for size in stats.fringesizes ))
+        self.assertEqual(stats.solutions, len(solutions))
+        self.assertEqual(rounds[-1], stats.expanded)
+        self.assertTrue(stats.pruned > 0)
+        self.assertTrue(stats.scoretime > 0 and stats.expandtime > 0 and stats.testtime > 0)
+        self.assertTrue(stats.elapsed() >= stats.scoretime + stats.expandtime + stats.testtime)
+        self.assertEqual(stats.todict()['expanded'], stats.expanded)
+        self.assertTrue(str(stats).startswith(str(stats.expanded) + " states expanded"))
+
+
+class AStarSearchTest(unittest.TestCase):
+    def dijkstra(self, start, goal):
+        distance = {start: 0}
+        queue = [(0, start)]
+        while queue:
+            d, (x, y) = queue.pop(queue.index(min(queue)))
+            if (x, y) == goal:
+                return d
+            for state in GridSearchState(grid, x, y, goal).expand():
+                if (state.x, state.y) not in distance or d + state.cost < distance[(state.x, state.y)]:
+                    distance[(state.x, state.y)] = d + state.cost
+                    queue.append((d + state.cost, (state.x, state.y)))
+
+    def test_optimal(self):
+        """A* search finds the cheapest path"""
+        for goal in ((6,4), (2,2), (4,2), (0,4)):
+            search = AStarSearch(GridSearchState(grid, 0, 0, goal))
+            solution = search.searchbest()
+            self.assertEqual(solution.pathcost(), self.dijkstra((0,0), goal))
+            self.assertEqual(search.cost(solution), solution.pathcost())
+            self.assertEqual(str(solution.path()[0]), str((0,0)))
+
+    def test_stats(self):
+        """A* search expands fewer states than exist and keeps statistics"""
+        search = AStarSearch(GridSearchState(grid, 0, 0, (6,0)))
+        solution = search.searchfirst()
+        self.assertEqual(solution.pathcost(), 6)
+        self.assertEqual(search.traversalsize(), 7) #straight along the top row, the heuristic is exact
+        self.assertEqual(search.stats['expanded'], 6) #the goal state itself is not expanded
+        self.assertTrue(search.stats['generated'] >= search.stats['expanded'])
+
+    def test_weighted(self):
+        """Weighted A* search finds a path within the weight's bound"""
+        for goal in ((6,4), (2,2), (4,2)):
+            optimal = self.dijkstra((0,0), goal)
+            search = AStarSearch(GridSearchState(grid, 0, 0, goal), weight=3)
+            solution = search.searchfirst()
+            self.assertTrue(optimal <= solution.pathcost() <= 3 * optimal)
+
+    def test_reopen(self):
+        """A* search reopens states when a cheaper path is found with an inconsistent heuristic"""
+        #the heuristic overestimates at B, so X is first expanded through the more expensive A
+        graph = {'S': [('A',1),('B',1)], 'A': [('X',5)], 'B': [('X',1)], 'X': [('G',10)], 'G': []}
+        heuristic = {'S': 0, 'A': 0, 'B': 10, 'X': 0, 'G': 0}
+        search = AStarSearch(GraphSearchState(graph, 'S'), h=lambda x: heuristic[x.node], goal=GraphSearchState(graph,'G'))
+        solution = search.searchfirst()
+        self.assertEqual(solution.pathcost(), 12)
+        self.assertEqual([ state.node for state in solution.path() ], ['S','B','X','G'])
+        self.assertEqual(search.stats['reopened'], 1)
+        search = AStarSearch(GraphSearchState(graph, 'S'), h=lambda x: heuristic[x.node], goal=GraphSearchState(graph,'G'), reopen=False)
+        self.assertEqual(search.searchfirst().pathcost(), 16)
+        self.assertEqual(search.stats['reopened'], 0)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+#-*- coding:utf-8 -*-
+
+#---------------------------------------------------------------
+# PyNLPl - Benchmark for Search Algorithms
+#   Compares the search strategies on synthetic problems, using
+#   the statistics kept by the searches (instrument=True)
+#
+#   Licensed under GPLv3
+#
+#----------------------------------------------------------------
+
+from __future__ import print_function, unicode_literals, division, absolute_import
+
+import sys
+import os
+import random
+import argparse
+
+sys.path.append(sys.path[0] + '/../../')
+os.environ['PYTHONPATH'] = sys.path[0] + '/../../'
+
+from pynlpl.search import AbstractSearchState, BreadthFirstSearch, IterativeDeepening, BestFirstSearch, BeamSearch, AStarSearch
+
+
+class ReorderState(AbstractSearchState):
+    """Restore a shuffled sequence by swapping adjacent items, every swap costs 1"""
+
+    def __init__(self, sequence, parent = None, cost = 0):
+        self.sequence = sequence
+        super(ReorderState, self).__init__(parent, cost)
+
+    def expand(self):
+        for i in range(len(self.sequence) - 1):
+            sequence = list(self.sequence)
+            sequence[i], sequence[i+1] = sequence[i+1], sequence[i]
+            yield ReorderState(tuple(sequence), self, 1)
+
+    def score(self):
+        #number of inversions: every swap removes at most one, so this never overestimates
+        return sum( 1 for i, x in enumerate(self.sequence) for y in self.sequence[i+1:] if x > y )
+
+    def test(self, goalstates = None):
+        return all( self.sequence[i] < self.sequence[i+1] for i in range(len(self.sequence) - 1) )
+
+    def __hash__(self):
+        return hash(self.sequence)
+
+    def __eq__(self, other):
+        return self.sequence == other.sequence
+
+
+class GridState(AbstractSearchState):
+    """Find a path to the opposite corner of a grid with walls (None) and cells costing 1 to 9 to enter"""
+
+    def __init__(self, grid, x, y, parent = None, cost = 0):
+        self.grid = grid
+        self.x = x
+        self.y = y
+        super(GridState, self).__init__(parent, cost)
+
+    def expand(self):
+        for dx, dy in ((1,0),(0,1),(-1,0),(0,-1)):
+            x = self.x + dx
+            y = self.y + dy
+            if 0 <= y < len(self.grid) and 0 <= x < len(self.grid[0]) and self.grid[y][x] is not None:
+                yield GridState(self.grid, x, y, self, self.grid[y][x])
+
+    def score(self):
+        #manhattan distance to the goal: every step costs at least 1, so this never overestimates
+        return (len(self.grid[0]) - 1 - self.x) + (len(self.grid) - 1 - self.y)
+
+    def test(self, goalstates = None):
+        return self.x == len(self.grid[0]) - 1 and self.y == len(self.grid) - 1
+
+    def __hash__(self):
+        return hash((self.x, self.y))
+
+    def __eq__(self, other):
+        return self.x == other.x and self.y == other.y
+
+
+def reorderproblem(size, rng):
+    sequence = list(range(size))
+    rng.shuffle(sequence)
+    return ReorderState(tuple(sequence))
+
+def gridproblem(size, rng):
+    grid = [ [ (None if rng.random() < 0.15 else rng.randint(1,9)) for x in range(size) ] for y in range(size) ]
+    grid[0][0] = grid[-1][-1] = 1
+    return GridState(grid, 0, 0)
+
+
+STRATEGIES = [
+    ('bfs', lambda state: BreadthFirstSearch(state, graph=True, instrument=True)),
+    ('iddfs-tt', lambda state: IterativeDeepening(state, graph=True, transpositions=100000, instrument=True)),
+    ('bestfirst', lambda state: BestFirstSearch(state, graph=True, minimize=True, instrument=True)),
+    ('beam10', lambda state: BeamSearch(state, 10, graph=True, minimize=True, instrument=True)),
+    ('beam100', lambda state: BeamSearch(state, 100, graph=True, minimize=True, instrument=True)),
+    ('astar', lambda state: AStarSearch(state, instrument=True)),
+    ('astar-w2', lambda state: AStarSearch(state, weight=2, instrument=True)),
+]
+
+COLUMNS = ('problem','strategy','cost','expanded','generated','duplicates','pruned','maxfringe','elapsed','expand','score','test')
+
+def run(problem, name, search):
+    """Runs the search until its first goal state and returns a row of statistics"""
+    for solution in search:
+        if solution.test(): #beam searches yield all states when no goal is given
+            break
+    else:
+        solution = None
+    stats = search.stats
+    return (problem, name, solution.pathcost() if solution else '-', stats.expanded, stats.generated, stats.duplicates, stats.pruned, stats.maxfringe, round(stats.elapsed(),4), round(stats.expandtime,4), round(stats.scoretime,4), round(stats.testtime,4))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compares the search strategies on synthetic problems", formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--reordersize', type=int, help="Length of the sequences to reorder", default=7)
+    parser.add_argument('--gridsize', type=int, help="Width and height of the grids", default=40)
+    parser.add_argument('--problems', type=int, help="Number of problems of each type", default=3)
+    parser.add_argument('--seed', type=int, help="Random seed", default=1)
+    parser.add_argument('--strategies', type=str, help="Comma separated list of strategies to run (" + ",".join( name for name, _ in STRATEGIES ) + ")", default="all")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    problems = [ ('reorder' + str(i+1), reorderproblem(args.reordersize, rng)) for i in range(args.problems) ]
+    problems += [ ('grid' + str(i+1), gridproblem(args.gridsize, rng)) for i in range(args.problems) ]
+
+    print("\t".join(COLUMNS))
+    for problemname, state in problems:
+        for name, strategy in STRATEGIES:
+            if args.strategies == 'all' or name in args.strategies.split(','):
+                print("\t".join( str(x) for x in run(problemname, name, strategy(state)) ))
+                sys.stdout.flush()
+
+if __name__ == '__main__':
+    main()
@@ -17,9 +17,13 @@ from __future__ import absolute_import
 
 import sys
 import os
+import io
+import math
 import unittest
+import tempfile
+import shutil
 
-from pynlpl.statistics import FrequencyList, HiddenMarkovModel
+from pynlpl.statistics import FrequencyList, InternedFrequencyList, Vocabulary, FrequencyCounter, ApproximateFrequencyList, SQLiteFrequencyList, Distribution, ArrayDistribution, MarkovChain, HiddenMarkovModel, levenshtein, levenshtein_banded, levenshtein_many, FuzzyLexicon
 from pynlpl.textprocessors import Windower
 
 
@@ -75,6 +79,345 @@ class BigramFrequencyListTest(unittest.TestCase):
             f.append(Windower(sentence,2))
         self.assertTrue(( f[('is','a')] == 2 and  f[('this','is')] == 1))
 
+def tokenize(line):
+    return line.split()
+
+class FrequencyCounterTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.filenames = []
+        for i, sentence in enumerate(sentences):
+            filename = os.path.join(self.tmpdir, str(i) + ".txt")
+            with io.open(filename,'w',encoding='utf-8') as f:
+                for _ in range(50):
+                    f.write(" ".join(sentence) + "\n")
+            self.filenames.append(filename)
+        self.expected = FrequencyList()
+        for sentence in sentences:
+            for _ in range(50):
+                self.expected.append(sentence)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_update(self):
+        """Frequency List (in-place update)"""
+        f = FrequencyList()
+        f.append(sentences[0])
+        f2 = FrequencyList(None, False)
+        f2.append(sentences[1])
+        f.update(f2)
+        self.assertEqual(f['this'], 1)
+        self.assertEqual(f['This'], 1)
+        self.assertEqual(f['sentence'], 2)
+        self.assertEqual(f.total, 13)
+
+    def test_parallel(self):
+        """Frequency Counter (parallel)"""
+        counter = FrequencyCounter(tokenize, workers=2, chunksize=100)
+        counter.count(self.filenames)
+        self.assertFalse(counter.runs)
+        self.assertEqual(counter.total, self.expected.total)
+        self.assertEqual(dict(counter), self.expected.dict())
+
+    def test_spill(self):
+        """Frequency Counter (spilling to sorted runs)"""
+        counter = FrequencyCounter(tokenize, chunksize=100, memorylimit=0.0001)
+        counter.count(self.filenames)
+        self.assertTrue(len(counter.runs) > 1)
+        result = list(counter)
+        self.assertEqual(result, sorted(self.expected.items()))
+        counter.cleanup()
+        self.assertFalse(counter.runs)
+
+class InternedFrequencyListTest(unittest.TestCase):
+    def test_freqlist_casesens(self):
+        """Interned Frequency List (case sensitive, equal to FrequencyList)"""
+        global sentences
+        f = FrequencyList()
+        f2 = InternedFrequencyList(buffersize=4)
+        for sentence in sentences:
+            f.append(sentence)
+            f2.append(sentence)
+            f.append(Windower(sentence,2))
+            f2.append(Windower(sentence,2))
+        self.assertEqual(f2, f)
+        self.assertEqual(len(f2), len(f))
+        self.assertEqual(f2.total, f.total)
+        self.assertEqual(f2[('is','a')], 2)
+        self.assertEqual(f2['sentence'], 2)
+        self.assertEqual(f2['nonexistent'], 0)
+        self.assertEqual([ count for _, count in f2 ], [ count for _, count in f ])
+
+    def test_freqlist_caseinsens(self):
+        """Interned Frequency List (case insensitive)"""
+        global sentences
+        f = InternedFrequencyList(None, False)
+        for sentence in sentences:
+            f.append(sentence)
+        self.assertTrue(( f['sentence'] == 2 and  f['this'] == 2 and f['Test'] == 1 ))
+
+    def test_freqlist_count_many(self):
+        """Interned Frequency List (bulk counting of pre-encoded n-grams)"""
+        vocabulary = Vocabulary()
+        f = InternedFrequencyList(vocabulary=vocabulary)
+        ids = [ vocabulary.encode(word) for word in "to be or not to be".split() ]
+        f.count_many(f.ngramkeys(ids, 2))
+        f.count('be', 3)
+        self.assertEqual(f[('to','be')], 2)
+        self.assertEqual(f['be'], 3)
+        self.assertEqual(f.total, 8)
+        self.assertEqual(f.decode(f.encode(('or','not'))), ('or','not'))
+        f2 = f + f
+        self.assertEqual(f2[('to','be')], 4)
+        self.assertEqual(f2.vocabulary, vocabulary)
+
+class SQLiteFrequencyListTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmpdir, "freqlist.db")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_counts(self):
+        """SQLite Frequency List (equal to FrequencyList)"""
+        global sentences
+        f = FrequencyList()
+        f2 = SQLiteFrequencyList(self.filename, buffersize=3)
+        for sentence in sentences:
+            f.append(sentence)
+            f2.append(sentence)
+            f.append(Windower(sentence,2))
+            f2.append(Windower(sentence,2))
+        self.assertEqual(f2, f)
+        self.assertEqual(len(f2), len(f))
+        self.assertEqual(f2[('is','a')], 2)
+        self.assertEqual([ count for _, count in f2 ], [ count for _, count in f ])
+        f2.close()
+
+    def test_persistence(self):
+        """SQLite Frequency List (reopening, prefix and range iteration)"""
+        global sentences
+        f = SQLiteFrequencyList(self.filename, None, False)
+        for sentence in sentences:
+            f.append(sentence)
+            f.append(Windower(sentence,2))
+        f.close()
+        f = SQLiteFrequencyList(self.filename)
+        self.assertFalse(f.casesensitive)
+        self.assertEqual(f.total, 28)
+        self.assertEqual(f['This'], 2)
+        self.assertEqual(list(f.prefix('s')), [('sentence', 2), (('sentence', '.'), 1), (('sentence', 'is'), 1)])
+        self.assertEqual(list(f.prefix(('is',))), [(('is', 'a'), 2)])
+        self.assertEqual([ type for type, _ in f.range('a','is', order='frequency') ][0], 'a')
+        self.assertEqual(len(f), 21)
+        self.assertEqual(f.db.total_changes, 0) #lookups don't write to the database
+        del f['sentence']
+        self.assertFalse('sentence' in f)
+        self.assertEqual(f.total, 26)
+        f.close()
+
+class ApproximateFrequencyListTest(unittest.TestCase):
+    def test_counts(self):
+        """Approximate Frequency List (counts and top-k)"""
+        global sentences
+        f = FrequencyList()
+        f2 = ApproximateFrequencyList(k=5)
+        for sentence in sentences * 10:
+            f.append(Windower(sentence,2))
+            f2.append(Windower(sentence,2))
+        self.assertEqual(f2.total, f.total)
+        for type, count in f:
+            self.assertTrue(f2[type] >= count)
+            self.assertTrue(f2[type] <= count + f2.error())
+        self.assertEqual(len(f2), 5)
+        self.assertEqual(list(f2)[0][1], 20)
+        self.assertTrue(f2.mode() in (('is','a'), ('.','<end>'))) #tied
+        self.assertTrue(Distribution(f2).entropy() > 0)
+
+    def test_merge(self):
+        """Approximate Frequency List (merging and saving)"""
+        global sentences
+        f = ApproximateFrequencyList(sentences[0] * 3, k=5)
+        f2 = ApproximateFrequencyList(sentences[1] * 2, k=5)
+        f3 = f + f2
+        self.assertEqual(f3['sentence'], 5)
+        self.assertEqual(f3.total, 31)
+        f.update(f2)
+        self.assertEqual(f, f3)
+        tmpdir = tempfile.mkdtemp()
+        filename = os.path.join(tmpdir, "approx.npz")
+        f3.save(filename)
+        f4 = ApproximateFrequencyList()
+        f4.load(filename)
+        self.assertEqual(f4, f3)
+        self.assertEqual(sorted(f4), sorted(f3))
+        shutil.rmtree(tmpdir)
+
+    def test_mixed(self):
+        """Approximate Frequency List (words and n-grams mixed)"""
+        f = ApproximateFrequencyList(k=3)
+        f.append([('a','b'),'a','b','c'])
+        f.append(['d',('c','d'),('a','b')])
+        self.assertEqual(f.total, 7)
+        self.assertEqual(f[('a','b')], 2)
+        self.assertEqual(f['a\tb'], 0)
+        f.count('a\tb')
+        self.assertEqual(f[('a','b')], 2)
+        self.assertEqual(f['a\tb'], 1)
+
+    def test_other(self):
+        """Approximate Frequency List (other types and unsupported operations)"""
+        f = ApproximateFrequencyList(k=3)
+        f.count(5)
+        f.count(5)
+        f.count('5')
+        f.count('\x005')
+        self.assertEqual(f[5], 2)
+        self.assertEqual(f['5'], 1)
+        self.assertEqual(f['\x005'], 1)
+        self.assertRaises(TypeError, f.__setitem__, 'a', 1)
+        self.assertRaises(TypeError, f.__delitem__, 5)
+        self.assertRaises(ValueError, f.typetokenratio)
+
+class ArrayDistributionTest(unittest.TestCase):
+    def test_distribution(self):
+        """Array Distribution (equal to Distribution)"""
+        global sentences
+        f = FrequencyList()
+        for sentence in sentences:
+            f.append(sentence)
+        d = Distribution(f)
+        d2 = ArrayDistribution(f)
+        self.assertAlmostEqual(d2.entropy(), d.entropy())
+        self.assertAlmostEqual(d2.maxentropy(), d.maxentropy())
+        self.assertAlmostEqual(d2.perplexity(), d.perplexity())
+        self.assertAlmostEqual(d2.information('is'), d.information('is'))
+        self.assertAlmostEqual(d2['sentence'], d['sentence'])
+        self.assertEqual(len(d2), len(d))
+        self.assertEqual([ p for _, p in d2 ], [ p for _, p in d ])
+        self.assertEqual(d2.top(2), list(d2)[:2])
+        self.assertTrue(d2.sample() in f)
+        import numpy as np
+        rngs = [ np.random.RandomState(1) ]
+        if hasattr(np.random, 'default_rng'): rngs.append(np.random.default_rng(1)) #numpy >= 1.17
+        for rng in rngs:
+            self.assertTrue(all( type in f for type in d2.sample(10, rng) ))
+
+    def test_divergence(self):
+        """Array Distribution (KL and JS divergence)"""
+        vocabulary = Vocabulary()
+        p = ArrayDistribution({'a': 1, 'b': 1}, vocabulary=vocabulary)
+        q = ArrayDistribution({'a': 3, 'b': 1}, vocabulary=vocabulary)
+        r = ArrayDistribution({'c': 1}, vocabulary=vocabulary)
+        self.assertAlmostEqual(p.kl(p), 0.0)
+        self.assertAlmostEqual(p.kl(q), 1 - 0.5 * math.log(3, 2))
+        self.assertEqual(p.kl(r), float('inf'))
+        self.assertAlmostEqual(p.js(q), q.js(p))
+        self.assertAlmostEqual(p.js(r), 1.0)
+
+class MarkovChainTest(unittest.TestCase):
+    def test_components(self):
+        """Strongly connected components and reachability of Markov chain"""
+        chain = MarkovChain('start','end')
+        chain.settransitions('start',{'a':1.0})
+        chain.settransitions('a',{'b':0.5,'c':0.5})
+        chain.settransitions('b',{'a':1.0})
+        chain.settransitions('c',{'end':1.0})
+        self.assertTrue( chain.reachable('start','end'))
+        self.assertTrue( chain.reachable('a','a'))
+        self.assertFalse( chain.reachable('c','a'))
+        self.assertFalse( chain.reachable('start','start'))
+        self.assertEqual( chain.communicates('start','c'), 0.5)
+        self.assertEqual( chain.communicates('start','end', maxlength=2), 0)
+        self.assertEqual( chain.communicates('end','start'), 0)
+        self.assertTrue( chain.reducible())
+        self.assertEqual( sorted( sorted(component) for component in chain.components() ), [['a','b'],['c'],['end'],['start']])
+        chain.settransitions('c',{'end':0.5,'start':0.5})
+        self.assertTrue( chain.reachable('c','a'))
+        self.assertEqual( len(chain.components()), 2)
+
+    def test_stationary(self):
+        """Stationary distribution of Markov chain"""
+        chain = MarkovChain('a')
+        chain.settransitions('a',{'a':0.5,'b':0.5})
+        chain.settransitions('b',{'a':0.25,'b':0.75})
+        self.assertFalse( chain.reducible())
+        stationary = chain.stationary()
+        self.assertAlmostEqual( stationary['a'], 1/3.0)
+        self.assertAlmostEqual( stationary['b'], 2/3.0)
+        periodic = MarkovChain('a')
+        periodic.settransitions('a',{'b':1.0})
+        periodic.settransitions('b',{'a':1.0})
+        self.assertAlmostEqual( periodic.stationary()['a'], 0.5)
+
+class LevenshteinTest(unittest.TestCase):
+    def test_levenshtein(self):
+        """Levenshtein distance"""
+        self.assertEqual( levenshtein('kitten','sitting'), 3)
+        self.assertEqual( levenshtein('sitting','kitten'), 3)
+        self.assertEqual( levenshtein('','abc'), 3)
+        self.assertEqual( levenshtein('abc','abc'), 0)
+        self.assertEqual( levenshtein('the cat sat'.split(),'the dog sat down'.split()), 2)
+        self.assertEqual( levenshtein('ab','ab', 0), 0)
+        self.assertEqual( levenshtein('kitten','sitting', 2), 3)
+        self.assertEqual( levenshtein('a' * 100, 'a' * 99 + 'b'), 1)
+
+    def test_levenshtein_banded(self):
+        """Banded levenshtein distance"""
+        self.assertEqual( levenshtein_banded('kitten','sitting', 3), 3)
+        self.assertEqual( levenshtein_banded('kitten','sitting', 2), 3)
+        self.assertEqual( levenshtein_banded('abcdef','bcdefg', 2), 2)
+        self.assertEqual( levenshtein_banded('abc','abcdef', 2), 3)
+
+    def test_levenshtein_many(self):
+        """Levenshtein distance between a query and many candidates"""
+        candidates = ['sitting','kitchen','mitten','kitten','smitten','k']
+        self.assertEqual( levenshtein_many('kitten', candidates), [ levenshtein('kitten', candidate) for candidate in candidates ])
+        self.assertEqual( levenshtein_many('kitten', candidates, 1), [2,2,1,0,2,2])
+
+class FuzzyLexiconTest(unittest.TestCase):
+    def setUp(self):
+        self.freqlist = FrequencyList(['the','then','than','then','hen','them','tree','the','the','tea'])
+
+    def test_find(self):
+        """Fuzzy lexicon search (both backends)"""
+        for backend in ('deletion','bktree'):
+            lexicon = FuzzyLexicon(self.freqlist, backend=backend, maxdistance=2)
+            self.assertEqual( len(lexicon), 7)
+            self.assertEqual( lexicon.find('thn', 1), [('the',1,3),('then',1,2),('than',1,1)])
+            self.assertEqual( lexicon.find('the', 0), [('the',0,3)])
+            self.assertEqual( [ word for word, _, _ in lexicon.find('thee', limit=3) ], ['the','then','them'])
+            self.assertEqual( sorted( word for word, _, _ in lexicon.find('tree') ), ['tea','the','them','then','tree'])
+            self.assertEqual( lexicon.find('xyzzy'), [])
+
+    def test_sequences(self):
+        """Fuzzy lexicon search over token sequences (both backends)"""
+        for backend in ('deletion','bktree'):
+            lexicon = FuzzyLexicon([["a","b","c"],["a","b"]], backend=backend)
+            self.assertEqual( lexicon.find(["a","b","d"], 1), [(("a","b"),1,1),(("a","b","c"),1,1)])
+            self.assertTrue( ["a","b"] in lexicon)
+            self.assertEqual( lexicon[["a","b","c"]], 1)
+
+    def test_maxdistance(self):
+        """Fuzzy lexicon search beyond maximum distance"""
+        self.assertRaises(ValueError, FuzzyLexicon(self.freqlist, backend='deletion', maxdistance=1).find, 'the', 2)
+        self.assertEqual( len(FuzzyLexicon(self.freqlist, backend='bktree', maxdistance=1).find('the', 4)), 7)
+
+    def test_save(self):
+        """Saving and loading fuzzy lexicon"""
+        lexicon = FuzzyLexicon(self.freqlist)
+        tmpdir = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(tmpdir, 'lexicon.pickle')
+            lexicon.save(filename)
+            loaded = FuzzyLexicon()
+            loaded.load(filename)
+            self.assertEqual( loaded.find('thn'), lexicon.find('thn'))
+        finally:
+            shutil.rmtree(tmpdir)
+
 class HMMTest(unittest.TestCase):
     def test_viterbi(self):
         """Viterbi decode run on Hidden Markov Model"""
@@ -88,6 +431,95 @@ class HMMTest(unittest.TestCase):
         prob, path = hmm.viterbi(observations)
         self.assertEqual( path, ['sunny', 'rainy', 'rainy'])
         self.assertEqual( prob, 0.01344)
-        
+
+    def test_viterbi_log(self):
+        """Viterbi decode (log-space, batch) and posteriors on compiled Hidden Markov Model"""
+        hmm = HiddenMarkovModel('start')
+        hmm.settransitions('start',{'rainy':0.6,'sunny':0.4})
+        hmm.settransitions('rainy',{'rainy':0.7,'sunny':0.3})
+        hmm.settransitions('sunny',{'rainy':0.4,'sunny':0.6})
+        hmm.setemission('rainy', {'walk': 0.1, 'shop': 0.4, 'clean': 0.5})
+        hmm.setemission('sunny', {'walk': 0.6, 'shop': 0.3, 'clean': 0.1})
+        observations = ['walk', 'shop', 'clean']
+        logprob, path = hmm.viterbi_log(observations)
+        self.assertEqual( path, ['sunny', 'rainy', 'rainy'])
+        self.assertAlmostEqual( logprob, math.log(0.01344))
+        results = hmm.viterbi_batch([observations, ['clean'], [], ['unknown']])
+        self.assertEqual( results[0][1], path)
+        self.assertAlmostEqual( results[0][0], logprob)
+        self.assertEqual( results[1][1], ['rainy'])
+        self.assertEqual( results[2], (float('-inf'), []))
+        self.assertEqual( results[3], (float('-inf'), []))
+        posteriors = hmm.posteriors(observations)
+        self.assertEqual( len(posteriors), 3)
+        for posterior in posteriors:
+            self.assertAlmostEqual( sum(posterior.values()), 1.0)
+        self.assertAlmostEqual( posteriors[1]['rainy'], 0.6240628347018922)
+        self.assertAlmostEqual( hmm.compile().loglikelihood(observations), -3.3928721329161653)
+        hmm.setemission('sunny', {'walk': 0.1, 'shop': 0.3, 'clean': 0.6})
+        self.assertEqual( hmm.viterbi_log(observations)[1], hmm.viterbi(observations)[1])
+        self.assertNotEqual( hmm.viterbi_log(observations)[1], path)
+
+    def test_train(self):
+        """Supervised training of Hidden Markov Model from tagged sequences"""
+        data = [ (['the','dog','barks'], ['D','N','V']), (['the','cat'], ['D','N']), (['dogs','bark'], ['N','V']) ]
+        hmm = HiddenMarkovModel('start')
+        hmm.train(data)
+        self.assertAlmostEqual( hmm.edges_out['start']['D'], 2/3.0)
+        self.assertAlmostEqual( hmm.edges_out['D']['N'], 1.0)
+        self.assertAlmostEqual( hmm.edges_out['N']['V'], 1.0)
+        self.assertAlmostEqual( hmm.edges_toobservables['N']['dog'], 1/3.0)
+        self.assertEqual( hmm.viterbi_log(['the','cat','barks'])[1], ['D','N','V'])
+        parallel = HiddenMarkovModel('start')
+        parallel.train(data * 10, workers=2, chunksize=4)
+        self.assertEqual( sorted(parallel.edges_out['N'].items()), sorted(hmm.edges_out['N'].items()))
+        smoothed = HiddenMarkovModel('start')
+        smoothed.train(data, smoothing=1)
+        self.assertAlmostEqual( sum(smoothed.edges_out['D'].values()), 1.0)
+        self.assertTrue( smoothed.edges_out['D']['V'] > 0)
+        smoothed.train([ (['hello'], ['X']) ]) #retraining replaces the model
+        self.assertEqual( smoothed.nodes, set(['start','X']))
+        self.assertEqual( smoothed.observablenodes, set(['hello']))
+
+    def test_baumwelch(self):
+        """Unsupervised Baum-Welch training of Hidden Markov Model"""
+        hmm = HiddenMarkovModel('start')
+        hmm.settransitions('start',{'rainy':0.5,'sunny':0.5})
+        hmm.settransitions('rainy',{'rainy':0.6,'sunny':0.4})
+        hmm.settransitions('sunny',{'rainy':0.3,'sunny':0.7})
+        hmm.setemission('rainy', {'walk': 0.2, 'shop': 0.3, 'clean': 0.5})
+        hmm.setemission('sunny', {'walk': 0.5, 'shop': 0.3, 'clean': 0.2})
+        sequences = [ ['walk','walk','shop'], ['clean','clean','shop','clean'], ['walk','shop','walk','walk'], ['clean'] ] * 5
+        loglikelihoods = hmm.baumwelch(sequences, iterations=10, tolerance=0)
+        self.assertEqual( len(loglikelihoods), 10)
+        for previous, current in zip(loglikelihoods, loglikelihoods[1:]):
+            self.assertTrue( current >= previous - 1e-9)
+        for state in ('rainy','sunny'):
+            self.assertAlmostEqual( sum(hmm.edges_toobservables[state].values()), 1.0)
+            self.assertAlmostEqual( sum(hmm.edges_out[state].values()), 1.0)
+
+    def test_baumwelch_endstate(self):
+        """Baum-Welch training of Hidden Markov Model with an end state"""
+        hmm = HiddenMarkovModel('start','end')
+        hmm.settransitions('start',{'A':0.6,'B':0.4})
+        hmm.settransitions('A',{'A':0.4,'B':0.3,'end':0.3})
+        hmm.settransitions('B',{'A':0.5,'B':0.3,'end':0.2})
+        hmm.setemission('A', {'x': 0.7, 'y': 0.3})
+        hmm.setemission('B', {'x': 0.2, 'y': 0.8})
+        sequences = [ ['x','x','y'], ['y','x'], ['x'], ['y','y','x','y'] ] * 5
+        loglikelihoods = hmm.baumwelch(sequences, iterations=5, tolerance=0)
+        for previous, current in zip(loglikelihoods, loglikelihoods[1:]):
+            self.assertTrue( current >= previous - 1e-9)
+        ends = 0.0
+        for state in ('A','B'):
+            self.assertAlmostEqual( sum(hmm.edges_out[state].values()), 1.0)
+            ends += hmm.edges_out[state]['end']
+        self.assertTrue( ends > 0)
+        #every sequence ends exactly once: 20 end transitions in 50 observations
+        compiled = hmm.compile()
+        start, transitions, emissions, _ = compiled.expectations(sequences)
+        self.assertAlmostEqual( transitions[:,compiled.stateindex['end']].sum(), 20.0)
+        self.assertAlmostEqual( emissions.sum(), 50.0)
+
 if __name__ == '__main__':
     unittest.main()
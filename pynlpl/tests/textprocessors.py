@@ -21,7 +21,7 @@ import sys
 import os
 import unittest
 
-from pynlpl.textprocessors import Windower, tokenise, strip_accents, calculate_overlap
+from pynlpl.textprocessors import Windower, tokenise, strip_accents, calculate_overlap, Tokenizer, CompiledTokenizer, split_sentences, _tokenize, TOKENIZERRULES
 
 text = "This is a test .".split(" ")
 
@@ -85,7 +85,23 @@ class TokenizerTest(unittest.TestCase):
     def test_tokenize_quotes(self):
         """Tokeniser - quotes"""
         global text
-        self.assertEqual(tokenise("Hij zegt: \"Wat een lief baby'tje is dat!\""),"Hij zegt : \" Wat een lief baby'tje is dat ! \"".split(" "))     
+        self.assertEqual(tokenise("Hij zegt: \"Wat een lief baby'tje is dat!\""),"Hij zegt : \" Wat een lief baby'tje is dat ! \"".split(" "))
+
+    def test_tokenize_compiled(self):
+        """Tokeniser - compiled tokeniser is identical to the character-based one"""
+        tokenizer = CompiledTokenizer()
+        for text in ("Hello... Wait!!! Really?! 'quoted' don't", "x (http://www.x.com/a.b) y, mail me@x.com.", "1.2.3 3.a 1,000,000. ²,³ a½'b", "a\n\r b\r\nc\td", "Dit is één zin。 En nog één？", "...a ''' ``"):
+            self.assertEqual(tokenizer.tokenize(text), _tokenize(text, list(TOKENIZERRULES)))
+            self.assertEqual(list(tokenizer.sentences(text)), list(split_sentences(_tokenize(text, list(TOKENIZERRULES)))))
+        self.assertFalse(CompiledTokenizer.supports([r"^a|b"]))
+        longurl = "I go to http://www.google.com/" + "a" * 400 + " now."
+        self.assertEqual(tokenise(longurl), _tokenize(longurl, list(TOKENIZERRULES)))
+
+    def test_tokenizer_sentences(self):
+        """Tokeniser - stream with sentence splitting"""
+        stream = ["This, is the first sentence! This is the", "second sentence.", "", "Third... and last"]
+        sentences = [ sentence for paragraph in Tokenizer(stream) for sentence in paragraph ]
+        self.assertEqual(sentences, [["This", ",", "is", "the", "first", "sentence", "!"], ["This", "is", "the", "second", "sentence", "."], ["Third..", "."], ["and", "last"]])
 
 
 class StripAccentTest(unittest.TestCase):
@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+#-*- coding:utf-8 -*-
+
+#---------------------------------------------------------------
+# PyNLPl - Benchmark for the Tokeniser
+#   Compares the throughput of the character-based tokeniser with
+#   the compiled single-regex tokeniser, on synthetic text or on
+#   the files given as arguments
+#
+#   Licensed under GPLv3
+#
+#----------------------------------------------------------------
+
+from __future__ import print_function, unicode_literals, division, absolute_import
+
+import sys
+import os
+import io
+import random
+import argparse
+import time
+
+sys.path.append(sys.path[0] + '/../../')
+os.environ['PYTHONPATH'] = sys.path[0] + '/../../'
+
+from pynlpl.textprocessors import CompiledTokenizer, Tokenizer, split_sentences, _tokenize, TOKENIZERRULES
+
+
+WORDS = "the a of and to in is that it was he for on are as with his they at be this from I have or by one had not but what all were when we there can an your which their said if do will each about how up out them then she many some so these would other into has more her two like him see time could no make than first been its who now people my made over did down only way find use may water long little very after words called just where most know".split(" ")
+EXTRA = ["don't", "baby'tje", "3.14", "1,000,000", "http://www.google.com/search", "proycon@anaproy.nl", "(", ")", '"', "...", "!!!", "--", "één", "café"]
+
+def synthetictext(size, rng):
+    """Generates roughly size characters of English-like text with numbers, urls, quotes and punctuation"""
+    paragraphs = []
+    length = 0
+    while length < size:
+        sentences = []
+        for _ in range(rng.randint(1,6)):
+            words = [ (rng.choice(EXTRA) if rng.random() < 0.08 else rng.choice(WORDS)) for _ in range(rng.randint(3,25)) ]
+            if rng.random() < 0.3:
+                words.insert(rng.randint(1, len(words)), ",")
+            sentences.append(" ".join(words).capitalize() + rng.choice(".....!?"))
+        paragraph = " ".join(sentences).replace(" ,", ",")
+        paragraphs.append(paragraph)
+        length += len(paragraph) + 2
+    return "\n\n".join(paragraphs)
+
+
+def benchmark(name, f, text, repetitions):
+    """Runs f on text the given number of times and returns the best throughput in MB/s along with the result"""
+    best = None
+    for _ in range(repetitions):
+        begintime = time.time()
+        result = f(text)
+        duration = time.time() - begintime
+        if best is None or duration < best:
+            best = duration
+    size = len(text.encode('utf-8')) / (1024 * 1024)
+    return name, size / max(best, 1e-9), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compares the throughput of the tokeniser engines", formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--size', type=int, help="Number of characters of synthetic text to generate (ignored if files are given)", default=1000000)
+    parser.add_argument('--repetitions', type=int, help="Number of runs per engine, the best one is reported", default=3)
+    parser.add_argument('--seed', type=int, help="Random seed", default=1)
+    parser.add_argument('files', nargs='*', help="Plain text files (utf-8) to tokenise instead of synthetic text")
+    args = parser.parse_args()
+
+    if args.files:
+        texts = []
+        for filename in args.files:
+            with io.open(filename, 'r', encoding='utf-8') as f:
+                texts.append(f.read())
+        text = "\n\n".join(texts)
+    else:
+        text = synthetictext(args.size, random.Random(args.seed))
+
+    compiled = CompiledTokenizer()
+    rules = list(TOKENIZERRULES)
+    results = [
+        benchmark('tokenise (characters)', lambda text: _tokenize(text, rules), text, args.repetitions),
+        benchmark('tokenise (compiled)', compiled.tokenize, text, args.repetitions),
+        benchmark('sentences (characters)', lambda text: list(split_sentences(_tokenize(text, rules))), text, args.repetitions),
+        benchmark('sentences (compiled)', lambda text: list(compiled.sentences(text)), text, args.repetitions),
+        benchmark('Tokenizer stream', lambda text: [ sentence for paragraph in Tokenizer(io.StringIO(text)) for sentence in paragraph ], text, args.repetitions),
+    ]
+
+    print("engine\tMB/s\ttokens")
+    for name, throughput, result in results:
+        print(name + "\t" + str(round(throughput,3)) + "\t" + str(len(result) if name.startswith('tokenise') else sum( len(sentence) for sentence in result )))
+
+    if results[0][2] != results[1][2] or results[2][2] != results[3][2]:
+        print("ERROR: compiled tokeniser output differs from the character-based tokeniser", file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -264,6 +264,165 @@ def calculate_overlap(haystack, needle, allowpartial=True):
 
 
 
+_UNICODECLASSES = None
+
+def _unicodeclasses():
+    """Returns regular expressions matching exactly the characters for which str.isdigit() and str.isalpha() are true. Only characters in [^\W\d_] differ from the obvious classes, these are found by a (one-time) scan over all of Unicode."""
+    global _UNICODECLASSES
+    if _UNICODECLASSES is None:
+        if sys.version < '3':
+            characters = "".join( unichr(i) for i in range(sys.maxunicode + 1) if not 0xd800 <= i <= 0xdfff ) #pylint: disable=undefined-variable
+        else:
+            characters = "".join( chr(i) for i in range(sys.maxunicode + 1) if not 0xd800 <= i <= 0xdfff )
+        candidates = re.findall(r"[^\W\d_]", characters, re.UNICODE)
+        digits = "".join( c for c in candidates if c.isdigit() )
+        nonalpha = "".join( c for c in candidates if not c.isalpha() )
+        digit = r"(?:\d|[" + re.escape(digits) + "])" if digits else r"\d"
+        alpha = r"(?![" + re.escape(nonalpha) + r"])[^\W\d_]" if nonalpha else r"[^\W\d_]"
+        _UNICODECLASSES = (digit, alpha)
+    return _UNICODECLASSES
+
+
+class CompiledTokenizer(object):
+    """The tokeniser of tokenize(), compiled into a single regular expression that is applied with re.findall(), rather than examining the text character by character in Python. The output is identical to that of the character-based tokeniser, which is still used for tokeniser rules this class does not support (see supports()).
+
+    The regular expression is an alternation of the tokeniser rules (URL and e-mail address by default), which are tried at the start of each token, and of a token followed by the character that ends it. A token ends at whitespace or punctuation, except for a period or comma between digits, a quote between letters, or punctuation followed by the same character.
+
+    Example:
+
+    >>> tokenizer = CompiledTokenizer()
+    >>> tokenizer.tokenize("Mail me@example.com. Or not!")
+    ['Mail', 'me@example.com', '.', 'Or', 'not', '!']
+    >>> list(tokenizer.sentences("Mail me@example.com. Or not!"))
+    [['Mail', 'me@example.com', '.'], ['Or', 'not', '!']]
+    """
+
+    def __init__(self, regexps=TOKENIZERRULES):
+        """
+        Constructor for CompiledTokenizer
+
+        :param regexps: Regular expressions to use as tokeniser rules in tokenisation (default=_pynlpl.textprocessors.TOKENIZERRULES_). These must be anchored at the start (^) and may not use flags or capturing groups, or match the empty string.
+        :type regexps:  Tuple/list of regular expressions to use in tokenisation
+        """
+        self.regexps = [ re.compile(regexp) if isstring(regexp) else regexp for regexp in regexps ]
+        if not CompiledTokenizer.supports(self.regexps):
+            raise ValueError("Tokeniser rules can not be compiled, they must be anchored at the start (^), and may not use flags or capturing groups or match the empty string")
+        self.rules = "|".join( "(?:" + regexp.pattern[1:] + ")" for regexp in self.regexps )
+        self.eosmarkers = frozenset(EOSMARKERS)
+        self.asciipattern = self._compile("[0-9]", "[A-Za-z]")
+        self.unicodepattern = None #compiled when first needed
+
+    @staticmethod
+    def supports(regexps):
+        """Returns True if the given tokeniser rules (compiled regular expressions) can be compiled into a CompiledTokenizer"""
+        for regexp in regexps:
+            if isstring(regexp):
+                regexp = re.compile(regexp)
+            if not regexp.pattern.startswith('^') or _toplevelalternation(regexp.pattern) or regexp.groups or (regexp.flags & ~(re.UNICODE | re.DEBUG)) or regexp.match(""):
+                return False
+        return True
+
+    def _compile(self, digit, alpha):
+        punctuation = re.escape(string.punctuation)
+        whitespace = re.escape("".join(WHITESPACE))
+        #punctuation that does not end a token
+        inner = [ r"(?<=" + digit + r")[.,](?=" + digit + r")", r"(?<=" + alpha + r")['`](?=" + alpha + r")" ]
+        inner += [ re.escape(c) + "(?=" + re.escape(c) + ")" for c in string.punctuation ]
+        #the lookahead on punctuation first avoids trying every alternative (and the lookbehinds) at each end of a token
+        inner = r"(?=[" + punctuation + r"])(?:" + "|".join(inner) + r")"
+        token = r"(?:[^" + punctuation + whitespace + r"]+|" + inner + r")*"
+        if self.rules:
+            pattern = r"(" + self.rules + r")|"
+        else:
+            pattern = r"()" #rules never match
+        pattern += r"(" + token + r")(?:(?!" + inner + r")([" + punctuation + r"])|[" + whitespace + r"]|\Z)"
+        return re.compile(pattern, re.UNICODE)
+
+    def pattern(self, text):
+        """Returns the compiled regular expression for the given text. Texts with only ASCII characters use simpler character classes for digits and letters than other texts."""
+        try:
+            isascii = text.isascii()
+        except AttributeError: #Python < 3.7
+            isascii = not re.search(r"[^\x00-\x7f]", text)
+        if isascii:
+            return self.asciipattern
+        if self.unicodepattern is None:
+            self.unicodepattern = self._compile(*_unicodeclasses())
+        return self.unicodepattern
+
+    def _findall(self, text):
+        """Returns a list of (rule, token, punctuation) tuples, or None if a rule matched more than 300 characters (the character-based tokeniser only applies the rules to 300 characters)"""
+        matches = self.pattern(text).findall(text)
+        if self.rules and any( len(rule) > 300 for rule, _, _ in matches ):
+            return None
+        return matches
+
+    def tokenize(self, text):
+        """Tokenizes a string and returns a list of tokens"""
+        matches = self._findall(text)
+        if matches is None:
+            return _tokenize(text, self.regexps)
+        return [ token for match in matches for token in match if token ]
+
+    def sentences(self, text):
+        """Tokenizes a string and splits it into sentences in the same pass, yields each sentence as a list of tokens. Equivalent to split_sentences(tokenize(text))."""
+        matches = self._findall(text)
+        if matches is None:
+            for sentence in split_sentences(_tokenize(text, self.regexps)):
+                yield sentence
+            return
+        eosmarkers = self.eosmarkers
+        sentence = []
+        eos = False
+        for match in matches:
+            for token in match:
+                if token:
+                    if eos and token not in eosmarkers:
+                        yield sentence
+                        sentence = []
+                    eos = token in eosmarkers
+                    sentence.append(token)
+        if sentence:
+            yield sentence
+
+
+def _toplevelalternation(pattern):
+    """Tests whether a regular expression has an alternation (|) outside of any group, in which case a ^ at the start only anchors the first alternative"""
+    depth = 0
+    i = 0
+    while i < len(pattern):
+        c = pattern[i]
+        if c == '\\':
+            i += 1
+        elif c == '[':
+            #skip character class, a ] directly after [ or [^ is a literal
+            i += 1
+            if i < len(pattern) and pattern[i] == '^': i += 1
+            if i < len(pattern) and pattern[i] == ']': i += 1
+            while i < len(pattern) and pattern[i] != ']':
+                if pattern[i] == '\\': i += 1
+                i += 1
+        elif c == '(':
+            depth += 1
+        elif c == ')':
+            depth -= 1
+        elif c == '|' and depth == 0:
+            return True
+        i += 1
+    return False
+
+
+_COMPILEDTOKENIZERS = {}
+
+def _compiledtokenizer(regexps):
+    """Returns the (cached) CompiledTokenizer for the given tokeniser rules, or None if they are not supported"""
+    key = tuple( regexp if isstring(regexp) else (regexp.pattern, regexp.flags) for regexp in regexps )
+    if key not in _COMPILEDTOKENIZERS:
+        if len(_COMPILEDTOKENIZERS) > 100: _COMPILEDTOKENIZERS.clear()
+        _COMPILEDTOKENIZERS[key] = CompiledTokenizer(regexps) if CompiledTokenizer.supports(regexps) else None
+    return _COMPILEDTOKENIZERS[key]
+
+
 class Tokenizer(object):
     """A tokenizer and sentence splitter, which acts on a file/stream-like object and when iterating over the object it yields
     a lists of tokens (in case the sentence splitter is active (default)), or a token (if the sentence splitter is deactivated).
@@ -289,6 +448,7 @@ class Tokenizer(object):
         self.onesentenceperline = onesentenceperline
 
     def __iter__(self):
+        compiled = _compiledtokenizer(self.regexps)
         buffer = ""
         for line in self.stream:
             line = line.strip()
@@ -298,7 +458,7 @@ class Tokenizer(object):
 
             if (self.onesentenceperline or not line) and buffer:
                 if self.splitsentences:
-                    yield split_sentences(tokenize(buffer))
+                    yield compiled.sentences(buffer) if compiled else split_sentences(tokenize(buffer, self.regexps))
                 else:
                     for token in tokenize(buffer, self.regexps):
                         yield token
@@ -306,7 +466,7 @@ class Tokenizer(object):
 
         if buffer:
             if self.splitsentences:
-                yield split_sentences(tokenize(buffer))
+                yield compiled.sentences(buffer) if compiled else split_sentences(tokenize(buffer, self.regexps))
             else:
                 for token in tokenize(buffer, self.regexps):
                     yield token
@@ -336,6 +496,14 @@ def tokenize(text, regexps=TOKENIZERRULES):
 
     """
 
+    compiled = _compiledtokenizer(regexps)
+    if compiled:
+        return compiled.tokenize(text)
+    return _tokenize(text, regexps)
+
+
+def _tokenize(text, regexps=TOKENIZERRULES):
+    """Character-based implementation of tokenize(), used for tokeniser rules that CompiledTokenizer does not support"""
     for i,regexp in list(enumerate(regexps)):
         if isstring(regexp):
             regexps[i] = re.compile(regexp)
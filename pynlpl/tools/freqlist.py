@@ -20,16 +20,26 @@ from __future__ import absolute_import
 
 import argparse
 import sys
-import io
+import math
+from functools import partial
 
-from pynlpl.statistics import FrequencyList, Distribution
+from pynlpl.statistics import FrequencyCounter
 from pynlpl.textprocessors import Windower, crude_tokenizer
 
+def tokenize(line, ngramsize=1):
+    """Returns the types to count in a line"""
+    if ngramsize > 1:
+        return Windower(crude_tokenizer(line),ngramsize)
+    else:
+        return crude_tokenizer(line)
+
 def main():
     parser = argparse.ArgumentParser(description="Generate an n-gram frequency list", formatter_class=argparse.ArgumentDefaultsHelpFormatter)
     parser.add_argument('-n','--ngramsize', help="N-gram size", type=int, action='store',default=1)
     parser.add_argument('-i','--caseinsensitive', help="Case insensitive", action="store_true")
     parser.add_argument('-e','--encoding', help="Character encoding", type=str, action='store',default='utf-8')
+    parser.add_argument('-w','--workers', help="Number of worker processes to count with", type=int, action='store',default=1)
+    parser.add_argument('-m','--memory-limit', help="Approximate memory limit in MB for the counts, beyond which they are spilled to sorted runs on disk (0 = no limit). The output is in lexical rather than frequency order if this happens.", type=int, action='store',default=0)
     parser.add_argument('files', type=str, nargs='+', help="The data sets to sample from, must be of equal size (i.e., same number of lines)")
 
 
@@ -39,29 +49,28 @@ def main():
         print("No files specified", file=sys.stderr)
         sys.exit(1)
 
-    freqlist = FrequencyList(None, args.caseinsensitive)
-    for filename in args.files:
-        f = io.open(filename,'r',encoding=args.encoding)
-        for line in f:
-            if args.ngramsize > 1:
-                freqlist.append(Windower(crude_tokenizer(line),args.ngramsize))
-            else:
-                freqlist.append(crude_tokenizer(line))
-
-        f.close()
+    counter = FrequencyCounter(partial(tokenize, ngramsize=args.ngramsize), args.workers, not args.caseinsensitive, args.encoding, memorylimit=args.memory_limit or None)
+    try:
+        counter.count(args.files)
 
-    dist = Distribution(freqlist)
-    for type, count in freqlist:
-        if isinstance(type,tuple) or isinstance(type,list):
-            type = " ".join(type)
-        s =  type + "\t" + str(count) + "\t" + str(dist[type]) + "\t" + str(dist.information(type))
-        print(s)
+        types = 0
+        entropy = 0
+        for type, count in counter:
+            if isinstance(type,tuple) or isinstance(type,list):
+                type = " ".join(type)
+            p = count / counter.total
+            information = -math.log(p, 2)
+            entropy += p * information
+            types += 1
+            s =  type + "\t" + str(count) + "\t" + str(p) + "\t" + str(information)
+            print(s)
+    finally:
+        counter.cleanup()
 
-    print("Tokens:           ", freqlist.tokens(),file=sys.stderr)
-    print("Types:            ", len(freqlist),file=sys.stderr)
-    print("Type-token ratio: ", freqlist.typetokenratio(),file=sys.stderr)
-    print("Entropy:          ", dist.entropy(),file=sys.stderr)
+    print("Tokens:           ", counter.total,file=sys.stderr)
+    print("Types:            ", types,file=sys.stderr)
+    print("Type-token ratio: ", types / float(counter.total),file=sys.stderr)
+    print("Entropy:          ", entropy,file=sys.stderr)
 
 if __name__ == '__main__':
     main()
-